@@ -15,19 +15,22 @@ import sys
 from src.help import help
 from src.init import init
 from src.install import install
+from src.jam import jam
 from src.package import package
 from src.settings import settings
+from src.uninstall import uninstall
 from src.utils import logger
 
 
 def get_arguments():
     """Get the app arguments.
 
-    @return {Dicionary.<command:string, value:string>}.
+    @return {Dicionary.<command:string, value:string, values:list>}.
     """
     result = {
         "command": None,
-        "value": None
+        "value": None,
+        "values": sys.argv[2:]
     }
 
     # Collect the passed arguments
@@ -48,19 +51,29 @@ def main():
         "help": help.main,
         "init": init.main,
         "install": install.main,
+        "jam": jam.main,
         "package": package.main,
-        "settings": settings.main
+        "settings": settings.main,
+        "uninstall": uninstall.main
     }
 
+    # The commands that take every argument after their name
+    multiple_values = ("install", "jam", "uninstall")
+
     # Get the passed arguments
     arguments = get_arguments()
 
     # Run the function appropriate for the given command
+    result = None
     if arguments["command"] in commmands.keys():
-        commmands[arguments["command"]](arguments["value"])
+        value = (arguments["values"]
+                 if arguments["command"] in multiple_values
+                 else arguments["value"])
+        result = commmands[arguments["command"]](value)
 
     # The app was run bare or with an unknown command, display help
     else:
         commmands["help"]("help")
 
-    raise SystemExit(0)
+    # Let scripts know when a command failed
+    raise SystemExit(1 if result is False else 0)
@@ -3,16 +3,20 @@
 import src.constants as const
 import src.init.help as init
 import src.install.help as install
+import src.jam.help as jam
 import src.package.help as package
 import src.settings.help as settings
+import src.uninstall.help as uninstall
 
 
 def main(command: str):
     commands_available = {
         "init": init.main,
         "install": install.main,
+        "jam": jam.main,
         "package": package.main,
-        "settings": settings.main
+        "settings": settings.main,
+        "uninstall": uninstall.main
     }
     commands_available_keys = commands_available.keys()
 
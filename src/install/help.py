@@ -6,10 +6,31 @@ import src.constants as const
 
 def main():
     message = f"""USAGE
-{const.APP_NAME} install <package>
+{const.APP_NAME} install <package> [<package> ...] [-r <manifest>] [-c]
 
 DESCRIPTION
-This command installs the specified package into your game.
+This command installs the specified packages into your game.
 Place packages in the same directory as {const.APP_NAME} for automatic
-discovery or provide a fully-qualified file path to the package."""
+discovery or provide a fully-qualified file path to the package.
+
+Any number of packages can be installed at once. Every package is
+validated before anything is installed, and LEGO.JAM is only rebuilt
+once. When several packages contain the same file, the package
+given last wins. Every such conflict, with the given packages or the
+installed ones, is reported before anything is installed. Files whose
+names only differ in case are the same file to the game.
+
+Only the files that differ from the ones in your game are installed.
+Installing packages that are already installed changes nothing.
+
+OPTIONS
+-r, --manifest <manifest>
+    Install the packages listed in a manifest file, one per line,
+    before any packages given on the command line. Blank lines and
+    lines starting with # are ignored. Relative paths are relative
+    to the manifest.
+
+-c, --check
+    Only report the conflicts, without installing anything.
+    Exits with status 1 if any are found."""
     print(message)
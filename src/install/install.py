@@ -11,14 +11,28 @@ Licensed under The MIT License
 
 
 import os
+import sqlite3
 import logging
+import argparse
+from collections import namedtuple
+from contextlib import ExitStack
 from zipfile import ZipFile, is_zipfile
 
+import src.constants as const
 from src.settings import user
 from src.utils import legojam, jsonutils, utils
+from src.utils.jamarchive import JamArchive, JamFormatError
+from src.utils.jamcache import IndexCache
+from src.utils.packagedb import PackageDB, describe_members
 from src.validator import validator
 
-__all__ = ["main"]
+__all__ = ["Conflict", "find_conflicts", "main", "plan_files",
+           "read_manifest"]
+
+
+# A file of a package that another package also provides.
+# The other path only differs from the path in case, if at all
+Conflict = namedtuple("Conflict", ["path", "package", "other_path", "other"])
 
 
 def __abort_install() -> bool:
@@ -31,105 +45,391 @@ def __abort_install() -> bool:
     return False
 
 
-def main(package) -> bool:
-    settings = user.load()
-    app_utils = utils.AppUtils()
-    package_details = None
+def __display_error(message: str) -> bool:
+    """Display an installation error.
 
-    # We do not have a set game location
-    if not os.path.isdir(settings.get("gameLocation")):
-        logging.warning("User has not yet configured settings!")
-        utils.display_message({
-            "result": "error",
-            "message": "You need to configure your settings before installing!"
-        })
-        return False
+    @param {String} message The error message.
+    @return {Boolean} Always returns False.
+    """
+    utils.display_message({"result": "error", "message": message})
+    return False
 
-    # No package was given
-    if package is None:
-        logging.warning("No package was specified!")
-        utils.display_message({
-            "result": "error",
-            "message": "No package was specified for installation!"
-        })
-        return False
+
+def read_manifest(path: str) -> list:
+    """Read a modpack manifest.
+
+    A manifest lists one package per line, in installation order.
+    Blank lines and lines starting with # are ignored, and relative
+    package paths are relative to the manifest.
+
+    @param {String} path An absolute path to the manifest.
+    @return {List.<String>} Absolute paths to the packages.
+    @throws {OSError} The manifest could not be read.
+    """
+    folder = os.path.dirname(path)
+    packages = []
+    with open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                packages.append(os.path.join(folder, line))
+    return packages
+
+
+def plan_files(packages: list) -> list:
+    """Work out the files each package installs.
+
+    When several packages hold the same file, the later package wins.
+    File names are compared case-insensitively, as the game does.
+
+    @param {List.<List.<String>>} packages The files of each package,
+                                           in installation order.
+    @return {List.<List.<String>>} The files to install from each package.
+    """
+    winners = {}
+    for i, files in enumerate(packages):
+        for name in files:
+            key = name.rstrip("/").casefold()
+            if key in winners and winners[key][0] != i:
+                logging.info(f"{name} of package {i + 1} replaces the one "
+                             f"of package {winners[key][0] + 1}")
+            winners[key] = (i, name)
+
+    planned = [[] for _ in packages]
+    for i, name in winners.values():
+        planned[i].append(name)
+    return planned
+
+
+def find_conflicts(installed: dict, packages: list) -> list:
+    """Find the files that more than one package provides.
+
+    Each incoming file is checked against the installed files and the
+    files of the packages before it, with a single lookup in case-folded
+    path indexes. Installed packages being reinstalled are not checked.
+
+    @param {Dictionary} installed See signature for PackageDB::path_index.
+    @param {List.<Tuple.<String, List.<String>>>} packages The name and
+        files of each package to install, in installation order.
+    @return {List.<Conflict>} The conflicts, in installation order.
+    """
+    incoming = {name.casefold() for name, _ in packages}
+    provided = {}
+    conflicts = []
+    for name, files in packages:
+        for path in files:
+            if path.endswith("/"):
+                continue
+
+            key = path.casefold()
+            other = provided.get(key)
+            if other is None:
+                owner = installed.get(key)
+                if owner is not None and owner[0].casefold() not in incoming:
+                    other = owner
+            if other is not None and other != (name, path):
+                conflicts.append(Conflict(path, name, other[1], other[0]))
+            provided[key] = (name, path)
+    return conflicts
+
+
+def __display_conflicts(conflicts: list):
+    for conflict in conflicts:
+        message = (f"{conflict.path} of {conflict.package} replaces "
+                   f"the one of {conflict.other}")
+        if conflict.path != conflict.other_path:
+            message += (f", named {conflict.other_path}, which only "
+                        "differs in case")
+        logging.warning(message)
+        utils.display_message({"result": "warning", "message": message})
+
+
+def __load_package(package: str):
+    """Validate a package and read its details.
+
+    @param {String} package An absolute path to the package.
+    @return {Dictionary|NoneType} The package "path", "details" and
+                                  "files", None if it cannot be installed.
+    """
+    app_utils = utils.AppUtils()
 
     # The package path given does not exist or is not a valid zip
-    package = os.path.abspath(package)
     if not is_zipfile(package):
-        logging.warning("Package specified is not a valid archive!")
-        utils.display_message({
-            "result": "error",
-            "message": "The file specified is not a valid package!"
-        })
-        return False
-
-    # Extract the JAM
-    # TODO This fails in most cases,
-    # need to fix legojam module return values
-    r = legojam.extract()
-    jam_result = r["result"]
-    extract_path = r["path"]
-    if not jam_result:
-        # TODO Tell the user what happened
-        logging.warning("There was an error extracting LEGO.JAM!")
-        return False
+        logging.warning(f"Package {package} is not a valid archive!")
+        __display_error(f"{package} is not a valid package!")
+        return None
 
-    # Getting ready to install the package
-    package_files = []
     with ZipFile(package, "r") as zf:
         package_files = zf.namelist()
 
         # The required package.json file is missing
         if not validator.has_package_json(package_files):
-            logging.warning("File package.json not found!")
-            utils.display_message({
-                "result": "error",
-                "message": "Package is missing package.json and cannot be installed!"
-            })
-            return False
+            logging.warning(f"File package.json not found in {package}!")
+            __display_error(f"{package} is missing package.json "
+                            "and cannot be installed!")
+            return None
 
         # Extract and validate package.json
         zf.extract("package.json", app_utils.temp_path)
-        validate_result = validator.package_json(
-            os.path.join(app_utils.temp_path, "package.json"))
-
-        # Validation errors occurred
-        # TODO Does this need to occur here or in `package` command?
-        if validate_result:
-            logging.warning("package.json validation errors occurred!")
-            print("\nThe following package.json errors were found:")
-
-            # Display each validation error message
-            should_abort = False
-            for error in validate_result:
-                should_abort = utils.display_message(error)
-
-            # A fatal error occurred, we cannot continue on
-            if should_abort:
-                return __abort_install()
-
-        # Get the package details before removing the JSON
-        # from the archive listing so it is not extracted
-        package_details = jsonutils.read(
-            os.path.join(app_utils.temp_path, "package.json"))
-        package_files.remove("package.json")
-
-        # Install the package
-        logging.info(f"Extracting package to {extract_path}")
-        print("Installing package...")
-        zf.extractall(extract_path, package_files)
-
-    # Compress the JAM
-    jam_result = legojam.build()
-    if not jam_result:
+    validate_result = validator.package_json(
+        os.path.join(app_utils.temp_path, "package.json"))
+
+    # Validation errors occurred
+    # TODO Does this need to occur here or in `package` command?
+    if validate_result:
+        logging.warning("package.json validation errors occurred!")
+        print(f"\nThe following package.json errors were found in {package}:")
+
+        # Display each validation error message
+        should_abort = False
+        for error in validate_result:
+            should_abort = utils.display_message(error) or should_abort
+
+        # A fatal error occurred, we cannot continue on
+        if should_abort:
+            return None
+
+    # Get the package details before removing the JSON
+    # from the archive listing so it is not installed
+    package_details = jsonutils.read(
+        os.path.join(app_utils.temp_path, "package.json"))
+    package_files.remove("package.json")
+    return {
+        "path": package,
+        "details": package_details,
+        "files": package_files
+    }
+
+
+def __get_originals(pristine_path) -> set:
+    """Get the entries of the game's original LEGO.JAM.
+
+    @param {String|NoneType} pristine_path An absolute path to the
+                                           original archive, if any.
+    @return {Set.<String>} The case-folded in-archive paths.
+    @throws {OSError|JamFormatError} The archive could not be read.
+    """
+    if pristine_path is None:
+        return set()
+    with JamArchive(pristine_path, IndexCache()) as archive:
+        return {path.casefold() for path in archive.index().paths}
+
+
+def __is_recorded(record, package: dict) -> bool:
+    """Check if a package is recorded as installed from the same file.
+
+    @param {InstalledPackage|NoneType} record The recorded package.
+    @param {Dictionary} package See signature for __load_package.
+    @return {Boolean}
+    """
+    return (record is not None and
+            record.version == package["details"]["version"] and
+            record.source == package["path"])
+
+
+def __record_install(loaded: list, planned: list, pristine_path) -> bool:
+    """Record the installed packages in the package database.
+
+    @param {List.<Dictionary>} loaded See signature for __load_package.
+    @param {List.<List.<String>>} planned The files installed
+                                          from each package.
+    @param {String|NoneType} pristine_path An absolute path to the
+                                           game's original LEGO.JAM.
+    @return {Boolean} True if the packages were recorded, False otherwise.
+    """
+    try:
+        originals = __get_originals(pristine_path)
+        with PackageDB() as db:
+            for package, files in zip(loaded, planned):
+                with ZipFile(package["path"], "r") as zf:
+                    db.add(package["details"]["name"],
+                           package["details"]["version"], package["path"],
+                           describe_members(zf, files, originals))
+
+    # The packages are installed, they just cannot be managed later
+    except (OSError, JamFormatError, sqlite3.Error) as e:
+        logging.warning("Could not record the installed packages!")
+        logging.debug(e)
+        utils.display_message({
+            "result": "warning",
+            "message": "The installed packages could not be recorded!"
+        })
+        return False
+    return True
+
+
+def __get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog=f"{const.APP_NAME} install")
+    parser.add_argument("packages", nargs="*",
+                        help="the packages to install, in order")
+    parser.add_argument("-r", "--manifest", action="append", default=[],
+                        help="install the packages listed in a file")
+    parser.add_argument("-c", "--check", action="store_true",
+                        help="only check the packages for conflicts")
+    return parser
+
+
+def __get_packages(args: argparse.Namespace):
+    """Get every package on the command line and in the manifests.
+
+    @param {argparse.Namespace} args The parsed command line arguments.
+    @return {List.<String>|NoneType} Absolute paths to the packages,
+                                     in installation order. None if
+                                     a manifest could not be read.
+    """
+    packages = []
+    for manifest in args.manifest:
+        try:
+            packages.extend(read_manifest(os.path.abspath(manifest)))
+        except OSError as e:
+            logging.warning(f"Could not read manifest {manifest}")
+            logging.debug(e)
+            __display_error(f"The manifest {manifest} could not be read!")
+            return None
+    packages.extend(os.path.abspath(a) for a in args.packages)
+    return packages
+
+
+def __check_conflicts(loaded: list) -> tuple:
+    """Find and display the files more than one package provides.
+
+    @param {List.<Dictionary>} loaded See signature for __load_package.
+    @return {Tuple.<List.<Conflict>, List.<InstalledPackage|NoneType>>}
+        The conflicts, and the installed record of each package.
+    """
+    try:
+        with PackageDB() as db:
+            installed = db.path_index()
+            recorded = [db.get(a["details"]["name"]) for a in loaded]
+    except sqlite3.Error as e:
+        logging.warning("Could not read the installed packages!")
+        logging.debug(e)
+        installed = {}
+        recorded = [None for _ in loaded]
+    conflicts = find_conflicts(
+        installed, [(a["details"]["name"], a["files"]) for a in loaded])
+    __display_conflicts(conflicts)
+    return (conflicts, recorded)
+
+
+def __install_changes(loaded: list, planned: list):
+    """Install the files that differ from the installed ones.
+
+    Installing the same packages again changes nothing.
+
+    @param {List.<Dictionary>} loaded See signature for __load_package.
+    @param {List.<List.<String>>} planned The files to install
+                                          from each package.
+    @return {List.<List.<String>>|NoneType} The files installed from each
+                                           package, None if the game
+                                           files could not be updated.
+    """
+    pre_extracted = legojam.find_extracted()
+    with ExitStack() as stack:
+        zip_files = [stack.enter_context(ZipFile(a["path"], "r"))
+                     for a in loaded]
+        try:
+            changed = legojam.find_changes(list(zip(zip_files, planned)))
+        except (OSError, JamFormatError) as e:
+            logging.warning("Could not compare the packages "
+                            "with the game files!")
+            logging.debug(e)
+            changed = planned
+
+        if not any(changed):
+            logging.info("Every package is already installed")
+            return changed
+
+        # The game reads extracted files, install the packages among them
+        if pre_extracted["result"]:
+            logging.info(f"Extracting packages to {pre_extracted['path']}")
+            try:
+                legojam.extract_members(list(zip(zip_files, changed)),
+                                        pre_extracted["path"])
+            except OSError as e:
+                logging.warning("There was an error extracting the packages!")
+                logging.debug(e)
+                __display_error("The packages could not be extracted!")
+                return None
+
+        # Otherwise splice the packages straight into the JAM,
+        # without extracting either archive to disk
+        elif not legojam.splice(list(zip(zip_files, changed))):
+            logging.warning("There was an error updating LEGO.JAM!")
+            __display_error("LEGO.JAM could not be updated!")
+            return None
+
+    # Compress the JAM, if the extracted files need it
+    if pre_extracted["result"] and not legojam.build():
         # TODO Tell the user what happened
         logging.warning("There was an error building LEGO.JAM!")
+        return None
+    return changed
+
+
+def main(args: list) -> bool:
+    """Install packages into the game.
+
+    @param {List.<String>} args The command line arguments.
+    @return {Boolean} True if the packages were installed, False otherwise.
+    """
+    settings = user.load()
+
+    # We do not have a set game location
+    if not os.path.isdir(settings.get("gameLocation")):
+        logging.warning("User has not yet configured settings!")
+        return __display_error(
+            "You need to configure your settings before installing!")
+
+    # Every package on the command line and in the manifests is
+    # installed in a single pass, later packages winning conflicts
+    args = __get_parser().parse_args(args)
+    packages = __get_packages(args)
+    if packages is None:
+        return False
+
+    # No package was given
+    if not packages:
+        logging.warning("No package was specified!")
+        return __display_error("No package was specified for installation!")
+
+    # Validate every package before anything is installed
+    loaded = [__load_package(a) for a in packages]
+    if None in loaded:
+        return __abort_install()
+    planned = plan_files([a["files"] for a in loaded])
+
+    # Find the files more than one package provides before anything
+    # is installed. The package installed last wins each of them
+    conflicts, recorded = __check_conflicts(loaded)
+
+    # Only the conflicts were asked for
+    if args.check:
+        if not conflicts:
+            print("No conflicts found.")
+        return not conflicts
+
+    # Keep the original game files, so the packages can be uninstalled
+    pristine_path = legojam.keep_pristine()
+
+    print("Installing {} package{}...".format(
+        len(loaded), "" if len(loaded) == 1 else "s"))
+    changed = __install_changes(loaded, planned)
+    if changed is None:
         return False
 
-    # TODO Keep persistent log of installed packages and files
+    # Remember which files each package installed,
+    # unless it is already recorded as it is
+    unrecorded = [i for i, files in enumerate(changed)
+                  if files or not __is_recorded(recorded[i], loaded[i])]
+    if unrecorded:
+        __record_install([loaded[i] for i in unrecorded],
+                         [planned[i] for i in unrecorded], pristine_path)
     logging.info("Installation complete!")
-    print("{} {} sucessfully installed.".format(
-        package_details['name'], package_details['version']
-    ))
+    for package, files in zip(loaded, changed):
+        package_details = package["details"]
+        print("{} {} {}.".format(
+            package_details['name'], package_details['version'],
+            "sucessfully installed" if files else "is already installed"
+        ))
     return True
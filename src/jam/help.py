@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*
+
+
+import src.constants as const
+
+
+def main():
+    message = f"""USAGE
+{const.APP_NAME} jam <command> [options]
+
+DESCRIPTION
+This command works directly with a JAM archive without extracting it.
+Unless --jam is given, the LEGO.JAM of your configured game installation
+is used.
+
+where command is one of:
+
+delta <base> <target> -o <patch> [-b]
+    Write a compressed patch that turns the archive <base> into the
+    archive <target>. Files found anywhere in <base>, even if they were
+    moved or renamed, are not stored in the patch. --jam is not used.
+    -b, --blocks  Also reuse the unchanged parts of large changed
+                  files. This makes the patch smaller but slower to make.
+
+diff <old> <new> [-f text|json]
+    List the entries added (+), removed (-) and changed (M) between
+    the archives <old> and <new>. Entries of the same size are only
+    read up to their first difference. --jam is not used.
+
+extract <path> [<path> ...] [-o <folder>]
+    Extract only the named entries, folders or patterns, as for get,
+    to <folder>. By default, a folder named after the archive is created
+    in the current folder. Only the folders holding the extracted files
+    are created.
+
+get <entry> [<entry> ...] [-o <file>]
+    Write the contents of the named archive entries, such as
+    GAMEDATA/COMMON/FOO.BMP, to <file> or to standard output.
+    Entry names are not case-sensitive. An entry may also be a pattern
+    such as GAMEDATA/*/TEXTURES/*.BMP, where ** matches any number of
+    folders. Only the named entries are read.
+
+ls [<path> ...] [-e <regex>] [-l] [-t] [-f text|json|csv]
+    List the archive entries without reading any of them. Each <path>
+    may be an entry, a folder, which lists everything below it, or a
+    pattern as for get. With no <path>, every entry is listed.
+    -e, --regex   Only list paths containing a match for <regex>.
+                  Matching is not case-sensitive.
+    -l, --long    Also show the size and offset of every entry.
+    -t, --totals  List every folder with the number and total size of
+                  the listed entries below it instead.
+    -f, --format  Write plain text (the default), a JSON object
+                  or CSV with a header row.
+
+patch <patch> [-o <archive>]
+    Apply a patch made by delta to the archive it was made from,
+    replacing it or writing the result to <archive>. The result is
+    checked against the archive the patch was made for.
+
+update <folder>
+    Write every file below <folder> into the archive, replacing any
+    entry with the same path. All other entries are copied from the
+    archive as they are, so <folder> only needs to hold the files
+    that changed, such as those from extract.
+
+verify [--tree <folder>] [-w <manifest> | -c <manifest>] [-j <jobs>]
+    Check that every entry lies within the archive and hash them all,
+    <jobs> at a time. With --tree, the extracted files in <folder> are
+    hashed and compared with the archive instead.
+    -w, --write  Also write the hashes to a checksum manifest.
+    -c, --check  Compare the hashes with a checksum manifest. With
+                 --tree, the archive is then not read at all."""
+    print(message)
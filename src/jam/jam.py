@@ -0,0 +1,617 @@
+# -*- coding: utf-8 -*-
+"""rpm - LEGO Racers package manager.
+
+Created 2015-2018 Caleb Ely
+<https://CodeTri.net/>
+
+Licensed under The MIT License
+<http://opensource.org/licenses/MIT/>
+
+"""
+
+
+import os
+import re
+import sys
+import csv
+import json
+import logging
+import argparse
+
+from src import constants as const
+from src.lib import JAMExtractor
+from src.settings import user
+from src.utils import jamdelta, jamdiff, jamverify, legojam, utils
+from src.utils.jamarchive import JamArchive, JamEntry, JamFormatError
+from src.utils.jambuilder import JamTree, write_tree
+from src.utils.jamcache import IndexCache
+from src.utils.jamtrie import JamTrie, is_pattern
+
+__all__ = ["main"]
+
+
+def __display_error(message: str) -> bool:
+    """Display an error message.
+
+    @param {String} message The error message.
+    @return {Boolean} Always returns False.
+    """
+    logging.warning(message)
+    utils.display_message({"result": "error", "message": message})
+    return False
+
+
+def __get_parser(command: str,
+                 jam: bool=True) -> argparse.ArgumentParser:
+    """Create an argument parser for a jam command.
+
+    @param {String} command The jam command name.
+    @param {Boolean} [jam=True] Accept the --jam option.
+    @return {argparse.ArgumentParser}
+    """
+    parser = argparse.ArgumentParser(
+        prog=f"{const.APP_NAME} jam {command}")
+    if jam:
+        parser.add_argument("--jam", help="path to the JAM archive to use")
+    return parser
+
+
+def __get_archive_path(path) -> str:
+    """Get the JAM archive to work with.
+
+    @param {String|NoneType} path The archive given on the command line.
+    @return {String|NoneType} An absolute path to the archive,
+                              None if there is no archive to use.
+    """
+    if path is not None:
+        return os.path.abspath(path)
+
+    # Fall back to the configured game installation
+    game_location = user.load().get("gameLocation")
+    if game_location is None:
+        return None
+    return os.path.join(game_location, "LEGO.JAM")
+
+
+def __open_archive(path):
+    """Open a JAM archive, reporting any problems to the user.
+
+    @param {String|NoneType} path The archive given on the command line.
+    @return {JamArchive|NoneType} The opened archive, None on failure.
+    """
+    path = __get_archive_path(path)
+    if path is None:
+        __display_error("You need to configure your settings "
+                        "or give a JAM archive with --jam!")
+        return None
+
+    try:
+        return JamArchive(path, IndexCache())
+    except FileNotFoundError:
+        __display_error(f"Could not find JAM archive {path}!")
+    except JamFormatError:
+        __display_error(f"{path} is not a valid JAM archive!")
+    return None
+
+
+def __delta(args: list) -> bool:
+    """Write a patch that turns one archive into another.
+
+    @param {List.<String>} args The command line arguments.
+    @return {Boolean} True if the patch was written, False otherwise.
+    """
+    parser = __get_parser("delta", False)
+    parser.add_argument("base")
+    parser.add_argument("target")
+    parser.add_argument("-o", "--output", required=True,
+                        help="patch file to write")
+    parser.add_argument("-b", "--blocks", action="store_true",
+                        help="reuse unchanged blocks of changed files")
+    args = parser.parse_args(args)
+
+    base = __open_archive(args.base)
+    if base is None:
+        return False
+    with base:
+        target = __open_archive(args.target)
+        if target is None:
+            return False
+        with target:
+            patch_path = os.path.abspath(args.output)
+            try:
+                result = jamdelta.create(base, target, patch_path,
+                                         args.blocks)
+            except OSError as e:
+                return __display_error(f"Could not write {patch_path}: {e}")
+
+    print(f"{result['copied']} bytes reused, "
+          f"{result['literal']} bytes stored in {patch_path}.")
+    return True
+
+
+def __diff(args: list) -> bool:
+    """List the differences between two archives.
+
+    @param {List.<String>} args The command line arguments.
+    @return {Boolean} True if the archives were compared, False otherwise.
+    """
+    parser = __get_parser("diff", False)
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("-f", "--format", default="text",
+                        choices=("text", "json"))
+    args = parser.parse_args(args)
+
+    old = __open_archive(args.old)
+    if old is None:
+        return False
+    with old:
+        new = __open_archive(args.new)
+        if new is None:
+            return False
+        with new:
+            differences = jamdiff.diff(old, new)
+
+    if args.format == "json":
+        json.dump(differences, sys.stdout)
+        sys.stdout.write("\n")
+        return True
+
+    for path in differences["added"]:
+        print(f"+ {path}")
+    for path in differences["removed"]:
+        print(f"- {path}")
+    for path, old_size, new_size in differences["changed"]:
+        print(f"M {path}  ({old_size} -> {new_size} bytes)")
+    return True
+
+
+def __write_entries(archive: JamArchive, entries: list,
+                    output: str) -> bool:
+    """Write archive entries one after another to a file or standard output.
+
+    @param {JamArchive} archive The archive.
+    @param {List.<JamEntry>} entries The entries to write.
+    @param {String|NoneType} output A path to the file to write to,
+                                    None for standard output.
+    @return {Boolean} True if every entry was written, False otherwise.
+    """
+    try:
+        out = open(output, "wb") if output is not None else sys.stdout.buffer
+        try:
+            for entry in entries:
+                logging.info(f"Writing entry {entry.path} "
+                             f"({entry.size} bytes)")
+                with archive.read(entry.offset, entry.size) as payload:
+                    out.write(payload)
+        finally:
+            if output is not None:
+                out.close()
+            else:
+                out.flush()
+    except OSError as e:
+        return __display_error("Could not write {}: {}".format(
+            output or "the entries", e))
+    return True
+
+
+def __get(args: list) -> bool:
+    """Write one or more archive entries to a file or standard output.
+
+    @param {List.<String>} args The command line arguments.
+    @return {Boolean} True if every entry was written, False otherwise.
+    """
+    parser = __get_parser("get")
+    parser.add_argument("entries", nargs="+", metavar="entry")
+    parser.add_argument("-o", "--output", help="file to write to")
+    args = parser.parse_args(args)
+
+    archive = __open_archive(args.jam)
+    if archive is None:
+        return False
+
+    with archive:
+        # Find every entry before writing anything. Plain paths only
+        # read the folders along the way, patterns need the whole index
+        entries = []
+        trie = None
+        for path in args.entries:
+            if is_pattern(path):
+                if trie is None:
+                    trie = JamTrie(archive.index())
+                matches = list(trie.glob(path))
+                if not matches:
+                    return __display_error(f"No entries match {path}!")
+                entries.extend(matches)
+                continue
+
+            entry = archive.find(path)
+            if entry is None:
+                return __display_error(f"Could not find entry {path}!")
+            entries.append(entry)
+        return __write_entries(archive, entries, args.output)
+
+
+def __find_paths(index, paths: list) -> list:
+    """Find the entries named by paths and patterns.
+
+    @param {JamIndex} index The archive index.
+    @param {List.<String>} paths Entry or folder paths and patterns.
+    @return {List.<JamEntry>} The entries in archive order,
+                              each listed once.
+    @throws {KeyError} A path that is not a pattern does not exist.
+    """
+    trie = JamTrie(index)
+    entries = []
+    for path in paths:
+        node = trie.get(path)
+        if node is None and not is_pattern(path):
+            raise KeyError(path)
+
+        # A folder selects everything below it
+        if node is None:
+            entries.extend(trie.glob(path))
+        elif node.is_folder():
+            entries.extend(trie.glob(f"{path}/**"))
+        else:
+            entries.append(trie.entry(node))
+
+    # Keep the archive order, no matter how the entries were found
+    positions = {path: i for i, path in enumerate(index.paths)}
+    return sorted({a.path: a for a in entries}.values(),
+                  key=lambda a: positions[a.path])
+
+
+def __select(archive: JamArchive, paths: list, regex) -> list:
+    """Select archive entries by path, pattern and regular expression.
+
+    @param {JamArchive} archive The archive.
+    @param {List.<String>} paths Entry or folder paths and patterns.
+                                 Every entry is selected if empty.
+    @param {re.Pattern|NoneType} regex An expression the selected
+                                       paths must also contain.
+    @return {List.<JamEntry>} The selected entries in archive order,
+                              each listed once.
+    @throws {KeyError} A path that is not a pattern does not exist.
+    """
+    index = archive.index()
+    if paths:
+        entries = __find_paths(index, paths)
+    else:
+        entries = [JamEntry(*a)
+                   for a in zip(index.paths, index.offsets, index.sizes)]
+
+    if regex is not None:
+        entries = [a for a in entries if regex.search(a.path)]
+    return entries
+
+
+def __sum_folders(entries: list) -> list:
+    """Total the entries below every folder holding one of them.
+
+    @param {List.<JamEntry>} entries The entries to total.
+    @return {List.<Tuple.<String, Integer, Integer>>} The folder path,
+        file count and total size of every folder, by path.
+    """
+    totals = {"": [0, 0]}
+    for entry in entries:
+        parts = entry.path.split("/")[:-1]
+        for i in range(len(parts) + 1):
+            total = totals.setdefault("/".join(parts[:i]), [0, 0])
+            total[0] += 1
+            total[1] += entry.size
+    return [(path, count, size)
+            for path, (count, size) in sorted(totals.items())]
+
+
+def __print_listing(archive_path: str, rows: list,
+                    args: argparse.Namespace):
+    """Print archive entries or folder totals in the chosen format.
+
+    @param {String} archive_path An absolute path to the archive.
+    @param {List.<JamEntry>|List.<Tuple>} rows The entries, or the folder
+        totals. See signature for __sum_folders.
+    @param {argparse.Namespace} args The parsed ls arguments.
+    """
+    fields = (("path", "count", "size") if args.totals
+              else ("path", "offset", "size"))
+    if args.format == "json":
+        json.dump({
+            "archive": archive_path,
+            "folders" if args.totals else "entries": [
+                dict(zip(fields, a)) for a in rows]
+        }, sys.stdout)
+        sys.stdout.write("\n")
+    elif args.format == "csv":
+        writer = csv.writer(sys.stdout, lineterminator="\n")
+        writer.writerow(fields)
+        writer.writerows(rows)
+    elif args.totals:
+        for path, count, size in rows:
+            print(f"{count:>8} {size:>12}  {path or '.'}")
+    elif args.long:
+        for path, offset, size in rows:
+            print(f"{size:>12} {offset:>12}  {path}")
+    else:
+        for entry in rows:
+            print(entry.path)
+
+
+def __ls(args: list) -> bool:
+    """List archive entries or folder totals using only the index.
+
+    @param {List.<String>} args The command line arguments.
+    @return {Boolean} True if the listing was written, False otherwise.
+    """
+    parser = __get_parser("ls")
+    parser.add_argument("paths", nargs="*", metavar="path")
+    parser.add_argument("-e", "--regex",
+                        help="only list paths matching this expression")
+    parser.add_argument("-l", "--long", action="store_true",
+                        help="show entry sizes and offsets")
+    parser.add_argument("-t", "--totals", action="store_true",
+                        help="list folder totals instead of entries")
+    parser.add_argument("-f", "--format", default="text",
+                        choices=("text", "json", "csv"))
+    args = parser.parse_args(args)
+
+    regex = None
+    if args.regex is not None:
+        try:
+            regex = re.compile(args.regex, re.IGNORECASE)
+        except re.error as e:
+            return __display_error(f"Invalid expression {args.regex}: {e}")
+
+    archive = __open_archive(args.jam)
+    if archive is None:
+        return False
+
+    with archive:
+        try:
+            entries = __select(archive, args.paths, regex)
+        except KeyError as e:
+            return __display_error(f"Could not find entry {e.args[0]}!")
+        logging.info(f"Listing {len(entries)} entries of {archive.path}")
+        rows = __sum_folders(entries) if args.totals else entries
+        __print_listing(archive.path, rows, args)
+    return True
+
+
+def __extract(args: list) -> bool:
+    """Extract only some of the archive entries.
+
+    @param {List.<String>} args The command line arguments.
+    @return {Boolean} True if every entry was extracted, False otherwise.
+    """
+    parser = __get_parser("extract")
+    parser.add_argument("paths", nargs="+", metavar="path")
+    parser.add_argument("-o", "--output", help="folder to extract to")
+    args = parser.parse_args(args)
+
+    archive = __open_archive(args.jam)
+    if archive is None:
+        return False
+
+    # Extract next to where we are, never next to the game archive,
+    # where the files would be taken for an extracted installation
+    output = args.output
+    if output is None:
+        output = os.path.splitext(os.path.basename(archive.path))[0]
+
+    with archive:
+        return JAMExtractor.extractArchive(
+            archive, archive.path, False, legojam.DEFAULT_JAM_WORKERS,
+            args.paths, os.path.abspath(output))
+
+
+def __patch(args: list) -> bool:
+    """Apply a patch made by delta to an archive.
+
+    @param {List.<String>} args The command line arguments.
+    @return {Boolean} True if the patch was applied, False otherwise.
+    """
+    parser = __get_parser("patch")
+    parser.add_argument("patch")
+    parser.add_argument("-o", "--output",
+                        help="archive to write instead of replacing --jam")
+    args = parser.parse_args(args)
+
+    archive = __open_archive(args.jam)
+    if archive is None:
+        return False
+
+    # Without an output, the archive is only replaced once
+    # the patched copy is complete and checked
+    output = (os.path.abspath(args.output) if args.output is not None
+              else archive.path)
+    temp_path = f"{output}.{os.getpid()}.tmp"
+    try:
+        with archive, open(temp_path, "wb") as f:
+            jamdelta.apply(archive, os.path.abspath(args.patch), f)
+        os.replace(temp_path, output)
+
+    except (OSError, jamdelta.DeltaError) as e:
+        if os.path.isfile(temp_path):
+            os.remove(temp_path)
+        return __display_error(f"Could not apply {args.patch}: {e}")
+
+    logging.info(f"Patched {archive.path} into {output}")
+    print(f"Patched archive written to {output}.")
+    return True
+
+
+def __update(args: list) -> bool:
+    """Write the files of a folder into the archive.
+
+    @param {List.<String>} args The command line arguments.
+    @return {Boolean} True if the archive was updated, False otherwise.
+    """
+    parser = __get_parser("update")
+    parser.add_argument("folder")
+    args = parser.parse_args(args)
+
+    folder = os.path.abspath(args.folder)
+    if not os.path.isdir(folder):
+        return __display_error(f"Could not find folder {folder}!")
+
+    archive = __open_archive(args.jam)
+    if archive is None:
+        return False
+
+    # Every entry not in the folder is copied from the current archive
+    temp_path = f"{archive.path}.{os.getpid()}.tmp"
+    try:
+        with archive:
+            tree = JamTree.from_archive(archive)
+            for path in tree.add_files(folder):
+                logging.warning(f"Skipping {path}, the name is too long")
+            write_tree(temp_path, tree, True)
+
+        # The new archive is only put in place once it is complete
+        os.replace(temp_path, archive.path)
+
+    except (OSError, ValueError) as e:
+        if os.path.isfile(temp_path):
+            os.remove(temp_path)
+        return __display_error(f"Could not update {archive.path}: {e}")
+
+    logging.info(f"Updated {archive.path} from {folder}")
+    return True
+
+
+def __hash_verified_archive(path: str, jobs: int):
+    """Check an archive for corruption and hash its entries.
+
+    @param {String} path A path to the archive, None for LEGO.JAM.
+    @param {Integer} jobs The number of entries to hash at once.
+    @return {Dictionary|NoneType} See signature for jamverify::hash_archive.
+                                  None if the archive is corrupt.
+    """
+    archive = __open_archive(path)
+    if archive is None:
+        return None
+
+    with archive:
+        problems = jamverify.check_bounds(archive)
+        if problems:
+            for problem in problems:
+                logging.warning(problem)
+                print(f"CORRUPT: {problem}")
+            __display_error(f"{archive.path} is corrupt!")
+            return None
+        return jamverify.hash_archive(archive, jobs)
+
+
+def __get_hashes(args: argparse.Namespace, jobs: int):
+    """Hash what is verified and what it is compared with.
+
+    @param {argparse.Namespace} args The parsed verify arguments.
+    @param {Integer} jobs The number of files to hash at once.
+    @return {Tuple.<Dictionary|NoneType, Dictionary>|NoneType} The
+        expected hashes, None if there is nothing to compare with,
+        and the actual hashes. None if something could not be hashed.
+    """
+    expected = None
+    if args.check is not None:
+        expected = jamverify.read_manifest(os.path.abspath(args.check))
+        if expected is None:
+            __display_error(f"{args.check} is not a valid checksum manifest!")
+            return None
+
+    # The archive is verified on its own, or is what
+    # the extracted files are compared with
+    if args.tree is None or expected is None:
+        hashes = __hash_verified_archive(args.jam, jobs)
+        if hashes is None:
+            return None
+        if args.tree is None:
+            return (expected, hashes)
+        expected = hashes
+
+    try:
+        return (expected,
+                jamverify.hash_tree(os.path.abspath(args.tree), jobs))
+    except OSError as e:
+        __display_error(f"Could not read {args.tree}: {e}")
+        return None
+
+
+def __report_differences(expected: dict, actual: dict) -> bool:
+    """Report every difference between two sets of hashes together.
+
+    @param {Dictionary} expected See signature for jamverify::hash_archive.
+    @param {Dictionary} actual See signature for jamverify::hash_archive.
+    @return {Boolean} True if the hashes match, False otherwise.
+    """
+    differences = jamverify.compare(expected, actual)
+    for kind, paths in differences.items():
+        for path in paths:
+            print(f"{kind.upper()}: {path}")
+    if any(differences.values()):
+        return __display_error("The files do not match!")
+    return True
+
+
+def __verify(args: list) -> bool:
+    """Check an archive or extracted files for corruption.
+
+    @param {List.<String>} args The command line arguments.
+    @return {Boolean} True if everything is intact, False otherwise.
+    """
+    parser = __get_parser("verify")
+    parser.add_argument("--tree", help="extracted files to verify")
+    manifest = parser.add_mutually_exclusive_group()
+    manifest.add_argument("-w", "--write", metavar="manifest",
+                          help="write a checksum manifest")
+    manifest.add_argument("-c", "--check", metavar="manifest",
+                          help="compare with a checksum manifest")
+    parser.add_argument("-j", "--jobs", type=int,
+                        default=legojam.DEFAULT_JAM_WORKERS,
+                        help="number of files to hash at once")
+    args = parser.parse_args(args)
+    hashes = __get_hashes(args, max(1, args.jobs))
+    if hashes is None:
+        return False
+    expected, actual = hashes
+
+    if args.write is not None:
+        if not jamverify.write_manifest(os.path.abspath(args.write), actual):
+            return __display_error(f"Could not write {args.write}!")
+
+    if expected is not None and not __report_differences(expected, actual):
+        return False
+
+    logging.info(f"Verified {len(actual)} files")
+    print(f"{len(actual)} files verified.")
+    return True
+
+
+def main(args: list) -> bool:
+    """Run a jam command.
+
+    @param {List.<String>} args The command line arguments,
+                                starting with the jam command.
+    @return {Boolean} True if the command succeeded, False otherwise.
+    """
+    commands = {
+        "delta": __delta,
+        "diff": __diff,
+        "extract": __extract,
+        "get": __get,
+        "ls": __ls,
+        "patch": __patch,
+        "update": __update,
+        "verify": __verify
+    }
+
+    # An unknown command was given
+    command = args[0] if args else None
+    if command not in commands:
+        return __display_error(
+            f"Unknown jam command! Run {const.APP_NAME} help jam for usage.")
+
+    # The archive opened, but its index is damaged
+    try:
+        return commands[command](args[1:])
+    except JamFormatError as e:
+        return __display_error(f"The JAM archive is corrupt: {e}")
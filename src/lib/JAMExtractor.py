@@ -24,101 +24,88 @@
 
 import os
 import sys
-
-def extract(path, verbose):
-    def uint32(offset):
-        if bytesAre == "str":
-            return ord(fileData[offset]) + (ord(fileData[offset+1]) * 256) + (ord(fileData[offset+2]) * 65536) + (ord(fileData[offset+3]) * 16777216)
-        else:
-            return fileData[offset] + (fileData[offset+1] * 256) + (fileData[offset+2] * 65536) + (fileData[offset+3] * 16777216)
-
-    def listFolders(offset, number, folderPath):
-        #List of folder to build.
-        folderList = []
-        #Read in data for the total number of folder.
-        for _ in range(number):
-            #Add ascii bytes to the end of the path until we hit a null byte.
-            name = folderPath
-            for b in fileData[offset:offset+12]:
-                if b == 0 or b == b"\x00":
-                    break
-                if bytesAre == "str":
-                    name += b
-                else:
-                    name += chr(b)
-            position = uint32(offset + 12)
-            if verbose:
-                print("READING: " + name + "  OFFSET: " + str(position))
-            #Add the folder data to the array to return.
-            folderList.append([name, position])
-            #Skip the offset forward for the next folder.
-            offset += 16
-        return folderList
-
-    def listFiles(offset, number, folderPath):
-        #List of files to build.
-        fileList = []
-        #Read in data for the total number of files.
-        for _ in range(number):
-            #Add ascii bytes to the end of the path until we hit a null byte.
-            name = folderPath + os.sep
-            for b in fileData[offset:offset+12]:
-                if b == 0 or b == b"\x00":
-                    break
-                if bytesAre == "str":
-                    name += b
-                else:
-                    name += chr(b)
-            #Add the file data to the array to return.
-            position = uint32(offset + 12)
-            size = uint32(offset + 16)
-            if verbose:
-                print("READING: " + name + "  OFFSET: " + str(position) + "  SIZE: " + str(size))
-            fileList.append([name, position, size])
-            #Skip the offset forward for the next file.
-            offset += 20
-        return fileList
-
-    def recurse(foldersList):
-        folderList.extend(foldersList)
-        for f in foldersList:
-            #How many files are there?
-            totalFiles = uint32(f[1])
-            if totalFiles == 0:
-                #That place has only folders, run this function again for the folders in that folder.
-                recurse(listFolders(f[1]+8, uint32(f[1]+4), f[0] + os.sep))
-            else:
-                #That place has files, add them to the list to extract.
-                fileList.extend(listFiles(f[1]+4, uint32(f[1]), f[0]))
-                #This place may also have folders. Find place where folder count exists after file list ends.
-                folderCountPos = totalFiles * 20 + f[1] + 4
-                folderCount = uint32(folderCountPos)
-                if folderCount > 0:
-                    recurse(listFolders(folderCountPos + 4, folderCount, f[0] + os.sep))
-
-    #Check if this version of Python treats bytes as int or str
-    bytesAre = type(b'a'[0]).__name__
-
-    #Open the file and read it in.
-    with open(path, "rb") as f:
-        fileData = f.read()
-
-    if len(fileData) < 4 or fileData[0:4] != b"LJAM":
+from concurrent.futures import ThreadPoolExecutor
+
+from src.utils.jamarchive import JamArchive, JamFormatError
+from src.utils.jamtrie import JamTrie
+from src.utils.jambuilder import MAX_NAME_LENGTH, FileSource, JamFolder, hash_payloads, plan_layout, write_layout
+from src.utils import jamupdate
+
+def extract(path, verbose, workers = 1, patterns = None, outFolder = None, cache = None):
+    #Map the file instead of reading it in, loading the index from the cache if one is given.
+    try:
+        archive = JamArchive(path, cache)
+    except JamFormatError:
         print("ERROR: Not a JAM file.")
         return False
 
-    print("Extracting, please wait.")
+    try:
+        return extractArchive(archive, path, verbose, workers, patterns, outFolder)
+    except JamFormatError as e:
+        #The index is damaged, nothing was written.
+        print("ERROR: " + str(e))
+        return False
+    finally:
+        archive.close()
+
+def selectEntries(index, patterns):
+    #Find the files named by paths or patterns. A folder selects everything below it.
+    trie = JamTrie(index)
+    selected = set()
+    for pattern in patterns:
+        node = trie.get(pattern)
+        if node is not None and node.is_folder():
+            pattern = pattern + "/**"
+        selected.update(a.path for a in trie.glob(pattern))
+
+    #Only the folders holding the selected files are needed.
+    parents = set()
+    for a in selected:
+        parts = a.split("/")
+        parents.update("/".join(parts[:i]) for i in range(1, len(parts)))
+    folders = [a for a in index.folders if a in parents]
+    files = [i for i, a in enumerate(index.paths) if a in selected]
+    return (folders, files)
+
+def extractArchive(archive, path, verbose, workers = 1, patterns = None, outFolder = None):
+    def writeFile(a):
+        if verbose:
+            print("WRITING: " + a[0] + "  SIZE: " + str(a[2]))
+        #Write a view of the mapping rather than a copied slice.
+        try:
+            with open(outFolder + a[0], "wb") as f, archive.read(a[1], a[2]) as payload:
+                f.write(payload)
+        except OSError as e:
+            return [a[0], e]
+        return None
 
-    #Recurse through, creating a list of all the files.
-    folderList = []
-    fileList = []
-    recurse([["", 4]])
+    print("Extracting, please wait.")
 
-    #Create output path from input path.
-    if path[-4:].lower() == ".jam":
-        outFolder = path[:-4]
+    #Get the index, creating a list of all the folders and files, or only the ones asked for.
+    index = archive.index()
+    if patterns is None:
+        folders, files = index.folders, range(len(index.paths))
     else:
-        outFolder = path
+        folders, files = selectEntries(index, patterns)
+    folderList = [[os.sep + a.replace("/", os.sep)] for a in folders]
+    fileList = [[os.sep + index.paths[i].replace("/", os.sep), index.offsets[i], index.sizes[i]] for i in files]
+    if verbose:
+        for a in fileList:
+            print("READING: " + a[0] + "  OFFSET: " + str(a[1]) + "  SIZE: " + str(a[2]))
+
+    #Create output path from input path, unless one was given.
+    if outFolder is None:
+        if path[-4:].lower() == ".jam":
+            outFolder = path[:-4]
+        else:
+            outFolder = path
+
+    #Refuse to write anything if an entry would end up outside the output folder.
+    root = os.path.abspath(outFolder)
+    for a in folderList + fileList:
+        if os.path.commonpath([root, os.path.abspath(outFolder + a[0])]) != root:
+            print("ERROR: " + a[0] + " is outside of the output folder, files not extracted.")
+            return False
 
     #Move the old folder out of the way if it exists.
     if os.path.exists(outFolder):
@@ -147,121 +134,110 @@ def extract(path, verbose):
                 print("WRITING: " + a[0])
             os.makedirs(outFolder + a[0])
 
-    #Loop through the list of files, saving them.
-    for a in fileList:
-        if verbose:
-            print("WRITING: " + a[0] + "  SIZE: " + str(a[2]))
-        with open(outFolder + a[0], "wb") as f:
-            f.write(fileData[a[1]:a[1]+a[2]])
+    #Save the files, with a pool of writers if asked. Every folder already exists so the writes are independent.
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(writeFile, fileList))
+    else:
+        results = [writeFile(a) for a in fileList]
+
+    #Report every file that failed together.
+    errors = [a for a in results if a is not None]
+    if errors:
+        print("ERROR: " + str(len(errors)) + " of " + str(len(fileList)) + " files could not be extracted.")
+        for a in errors:
+            print("FAILED: " + a[0] + "  (" + str(a[1]) + ")")
+        return False
 
     print("COMPLETE: " + str(len(fileList)) + " files extracted.\nOUTPUT: " + outFolder)
     return True
 
-def build(path, verbose):
-    def writeUint32(i = 0, position = -1):
-        #Keep it possible.
-        if i > 4294967295:
-            i = 4294967295
-        a = [0, 0, 0, 0]
-        #Roll it over to the next place until the end giving what's left to the first number.
-        while i >= 16777216:
-            a[3] += 1
-            i -= 16777216
-        while i >= 65536:
-            a[2] += 1
-            i -= 65536
-        while i >= 256:
-            a[1] += 1
-            i -= 256
-        a[0] = i
-        #If position not set, add it to the end.
-        if position < 0:
-            fileData.extend(a)
-        else:
-            fileData[position:position+4] = a
-
-    def writeName(s):
-        #Write 12 bytes for the name.
-        for i in range(12):
-            if i < len(s):
-                fileData.append(ord(s[i]))
-            else:
-                fileData.append(0)
-
-    def updateFolder(s):
-        #Update the pointer to the folder.
-        for a in folderList:
-            if a[0] == s:
-                writeUint32(len(fileData), a[1])
-                break
-
+def build(path, verbose, incremental = False, dedup = False, cache = None, manifests = None):
     print("Building, please wait.")
 
-    #Start the byte array.
-    fileData = bytearray(b"LJAM")
-    #Create lists to store file and folder pointers to update later.
-    folderList = []
-    fileList = []
+    #Create the output file.
+    outFile = path + ".JAM"
+
+    #Put back an archive left half written by an interrupted update.
+    try:
+        if jamupdate.recover(outFile, manifests):
+            print("NOTE: Interrupted update rolled back.")
+    except OSError as e:
+        print("ERROR: " + str(e) + ", interrupted update could not be rolled back.")
+        return False
+
+    #The folder table, in the order the folders are walked, and the status of every file.
+    folders = []
+    stats = {}
 
     for currentdir, dirlist, filelist in os.walk(path):
         #Filter out files and folder with names that are too long for the format.
         for i in reversed(range(len(filelist))):
-            if len(filelist[i]) > 12:
+            if len(filelist[i]) > MAX_NAME_LENGTH:
                 if verbose:
                     print("SKIPPING: " + filelist[i] + "  (Name too long.)")
                 del filelist[i]
         for i in reversed(range(len(dirlist))):
-            if len(dirlist[i]) > 12:
+            if len(dirlist[i]) > MAX_NAME_LENGTH:
                 if verbose:
                     print("SKIPPING: " + dirlist[i] + "  (Name too long.)")
                 del dirlist[i]
 
-        #Update pointer to this folder if listed earlier.
-        updateFolder(currentdir)
-        #Write the number of files.
-        writeUint32(len(filelist))
-
-        #Lists files.
+        #List the files with their sizes, known up front from the file system, and the directories.
+        relDir = os.path.relpath(currentdir, path).replace(os.sep, "/")
+        if relDir == ".":
+            relDir = ""
+        prefix = relDir + "/" if relDir else ""
         for filename in filelist:
-            #Write to index, remembering where to update pointers later.
-            a = [currentdir + os.sep + filename, 0, 0]
-            writeName(filename)
-            a[1] = len(fileData)
-            writeUint32()
-            a[2] = len(fileData)
-            writeUint32()
-            fileList.append(a)
-            if verbose:
-                print("READING: " + a[0][len(path):])
-
-        #Write the number of folders.
-        writeUint32(len(dirlist))
-
-        #Lists directories.
-        for subdirname in dirlist:
-            #Write to index, remembering where to update pointers later.
-            a = [currentdir + os.sep + subdirname, 0]
-            writeName(subdirname)
-            a[1] = len(fileData)
-            writeUint32()
-            folderList.append(a)
-            if verbose:
-                print("READING: " + a[0][len(path):])
-
-    #Append the files and update pointers.
-    for a in fileList:
-        start = len(fileData)
-        writeUint32(start, a[1])
-        with open(a[0], "rb") as f:
-            fBytes = f.read()
-            size = len(fBytes)
-            if verbose:
-                print("APPENDING: " + a[0][len(path):] + "  OFFSET:" + str(start) + "  SIZE:" + str(size))
-            writeUint32(size, a[2])
-            fileData.extend(fBytes)
+            stats[prefix + filename] = os.stat(os.path.join(currentdir, filename))
+        files = [(filename, stats[prefix + filename].st_size) for filename in filelist]
+        folders.append(JamFolder(relDir, files, list(dirlist)))
+        if verbose:
+            for filename in filelist + dirlist:
+                print("READING: " + os.path.join(currentdir, filename)[len(path):])
+
+    #Reuse the archive built from an identical tree before, if there is one.
+    treeKey = None
+    if cache is not None:
+        try:
+            treeKey = cache.tree_key(path, folders, stats, dedup)
+        except OSError as e:
+            print("WARNING: " + str(e) + ", build cache not used.")
+    if treeKey is not None:
+        if cache.is_cached(treeKey, outFile):
+            print("COMPLETE: Archive is up to date.\nOUTPUT: " + outFile)
+            return True
+        if cache.restore(treeKey, outFile):
+            #The tree is exactly what the archive holds, so the next build can be incremental.
+            if incremental:
+                jamupdate.record_extraction(outFile, path, manifests)
+            print("COMPLETE: Archive restored from cache.\nOUTPUT: " + outFile)
+            return True
+
+    #Only rewrite what changed since the last build, if that is still worthwhile.
+    if incremental and jamupdate.update(outFile, path, folders, stats, manifests):
+        if treeKey is not None:
+            cache.store(treeKey, outFile)
+        print("COMPLETE: Archive updated.\nOUTPUT: " + outFile)
+        return True
+
+    #Hash the files that could be identical, so each distinct payload is only stored once.
+    sources = {a: FileSource(os.path.join(path, *a.split("/")), stats[a].st_size) for a in stats}
+    digests = None
+    if dedup:
+        try:
+            digests = hash_payloads(sources)
+        except OSError as e:
+            print("ERROR: " + str(e) + ", archive not written.")
+            return False
 
-    #Create the output file.
-    outFile = path + ".JAM"
+    #Lay out the whole header in one pass, so every file's offset is known before anything is written.
+    try:
+        layout = plan_layout(folders, digests)
+    except ValueError as e:
+        print("ERROR: " + str(e) + ", archive not written.")
+        return False
+    fileList = [[os.path.join(path, *a.path.split("/")), a.offset, a.size] for a in layout.entries]
 
     #Move the old file out of the way if it exists.
     if os.path.exists(outFile):
@@ -279,9 +255,24 @@ def build(path, verbose):
             print("ERROR: Failed to move old archive out of the way, archive not written.")
             return False
 
-    #Write the archive.
-    with open(outFile, "wb") as f:
-        f.write(fileData)
+    #Write the header, then stream each file in behind it while the next few are read ahead.
+    if verbose:
+        for a in fileList:
+            print("APPENDING: " + a[0][len(path):] + "  OFFSET:" + str(a[1]) + "  SIZE:" + str(a[2]))
+    try:
+        with open(outFile, "wb") as f:
+            write_layout(f, layout, sources)
+    except OSError as e:
+        #A file changed size after the header was written.
+        print("ERROR: " + str(e) + ", archive not written.")
+        os.remove(outFile)
+        return False
+
+    #Remember the layout so the next build can be incremental.
+    if incremental:
+        jamupdate.record_build(outFile, path, folders, layout, stats, manifests)
+    if treeKey is not None:
+        cache.store(treeKey, outFile)
 
     print("COMPLETE: Achive built.\nOUTPUT: " + outFile)
 
@@ -21,6 +21,11 @@ itself to manage packages according to the game revision you own.
 If at any time your game installation changes location or needs to be
 reconfigured, simply run the command again to restart the process.
 
+LEGO.JAM is extracted by writing several files at once. To change how many,
+set "jamWorkers" in {const.APP_NAME}'s user.json to a whole number.
+Use 1 to write one file at a time. This value is kept when the command
+is run again.
+
 If you would like to learn more about the game differences between
 revisions, Rock Raiders United is an excellent resource for all things
 LEGO video games. https://www.rockraidersunited.com"""
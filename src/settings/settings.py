@@ -84,7 +84,8 @@ def main(*args) -> bool:
     pathExists = False
     appOpts = {
         "gameLocation": None,
-        "gameRelease": None
+        "gameRelease": None,
+        "jamWorkers": userSettings.load().get("jamWorkers")
     }
 
     # Keep asking for a path until we get one
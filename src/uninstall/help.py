@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*
+
+
+import src.constants as const
+
+
+def main():
+    message = f"""USAGE
+{const.APP_NAME} uninstall <package> [<package> ...]
+
+DESCRIPTION
+This command removes the specified installed packages from your game.
+
+Only the files the packages installed are changed. A file that replaced
+one of the game's original files is restored from the original LEGO.JAM,
+kept as PRE-RPM-LEGO.JAM when the first package was installed. A file
+another installed package also provides is restored from that package,
+and any other file is removed. LEGO.JAM is only rebuilt once.
+
+If a file cannot be restored, because the package that provides it or
+PRE-RPM-LEGO.JAM was moved or deleted, nothing is uninstalled."""
+    print(message)
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""rpm - LEGO Racers package manager.
+
+Created 2015-2018 Caleb Ely
+<https://CodeTri.net/>
+
+Licensed under The MIT License
+<http://opensource.org/licenses/MIT/>
+
+"""
+
+
+import os
+import sqlite3
+import logging
+import argparse
+from contextlib import ExitStack
+from zipfile import ZipFile, BadZipFile
+
+import src.constants as const
+from src.settings import user
+from src.utils import legojam, utils
+from src.utils.jamarchive import JamArchive, JamFormatError
+from src.utils.jambuilder import ArchiveSource, ZipSource
+from src.utils.jamcache import IndexCache
+from src.utils.packagedb import PackageDB
+
+__all__ = ["main", "plan_restore"]
+
+
+def __display_error(message: str) -> bool:
+    """Display an uninstallation error.
+
+    @param {String} message The error message.
+    @return {Boolean} Always returns False.
+    """
+    utils.display_message({"result": "error", "message": message})
+    return False
+
+
+def plan_restore(db: PackageDB, names: list) -> dict:
+    """Work out what replaces the files of the packages being uninstalled.
+
+    Only the files whose installed copy came from one of the packages
+    change. Each is restored from the last remaining package that also
+    installed it, else from the original LEGO.JAM if it replaced an
+    original entry, and is removed otherwise.
+
+    @param {PackageDB} db The package database.
+    @param {List.<String>} names The packages being uninstalled.
+    @return {Dictionary.<String, Tuple>} The (package name, original)
+        pair of every game path. The package is the one to restore
+        the file from, None if there is none. original is True if the
+        file is in the original LEGO.JAM.
+    """
+    removing = {name.casefold() for name in names}
+    planned = set()
+    changes = {}
+    for name in names:
+        for installed in db.files(name):
+            key = installed.path.casefold()
+            if key in planned:
+                continue
+            planned.add(key)
+
+            owners = db.owners(installed.path)
+            if owners[-1].casefold() not in removing:
+                continue
+            remaining = [a for a in owners if a.casefold() not in removing]
+            changes[installed.path] = (remaining[-1] if remaining else None,
+                                       installed.original)
+    return changes
+
+
+def __get_sources(changes: dict, db: PackageDB, pristine,
+                  stack: ExitStack) -> dict:
+    """Find the payload source of every file being restored.
+
+    @param {Dictionary} changes See signature for plan_restore.
+    @param {PackageDB} db The package database.
+    @param {JamArchive|NoneType} pristine The original LEGO.JAM.
+    @param {ExitStack} stack Keeps the package zip archives open.
+    @return {Dictionary.<String, Source|NoneType>} The source of each
+        game path, None if the file is removed.
+    @throws {LookupError} Some files cannot be restored. The first
+                          argument lists their game paths.
+    """
+    zip_files = {}
+    sources = {}
+    missing = []
+    for path, (owner, original) in changes.items():
+        source = None
+
+        # Restore the copy of the package that installed it before
+        if owner is not None:
+            package_path = db.get(owner).source
+            try:
+                if package_path not in zip_files:
+                    zip_files[package_path] = stack.enter_context(
+                        ZipFile(package_path, "r"))
+                zf = zip_files[package_path]
+                source = ZipSource(zf, zf.getinfo(db.file(owner, path).path))
+            except (OSError, KeyError, BadZipFile) as e:
+                logging.warning(f"Could not restore {path} from {owner}!")
+                logging.debug(e)
+
+        # Restore the original game file
+        elif original and pristine is not None:
+            entry = pristine.find(path)
+            if entry is not None:
+                source = ArchiveSource(pristine, entry.offset, entry.size)
+
+        # Only remove files that nothing else provides
+        if source is None and (owner is not None or original):
+            missing.append(path)
+        sources[path] = source
+
+    if missing:
+        raise LookupError(missing)
+    return sources
+
+
+def __remove_file(root: str, file_path: str):
+    """Remove an extracted file and the folders it leaves empty.
+
+    The top folders are always kept, as they are how
+    legojam::find_extracted finds the extracted files.
+
+    @param {String} root An absolute path to the extracted files.
+    @param {String} file_path An absolute path to the file below root.
+    @throws {OSError} The file or a folder could not be removed.
+    """
+    if not os.path.isfile(file_path):
+        return
+    os.remove(file_path)
+    folder = os.path.dirname(file_path)
+    while os.path.dirname(folder) != root and not os.listdir(folder):
+        os.rmdir(folder)
+        folder = os.path.dirname(folder)
+
+
+def __write_files(root: str, sources: dict):
+    """Apply the changes to extracted game files.
+
+    Files are matched case-insensitively, as the game does.
+
+    @param {String} root An absolute path to the extracted files.
+    @param {Dictionary} sources See signature for __get_sources.
+    @throws {OSError} A file could not be written or removed.
+    """
+    paths = legojam.resolve_extracted(root, list(sources))
+    for path, source in sources.items():
+        if source is None:
+            __remove_file(root, paths[path])
+            continue
+
+        os.makedirs(os.path.dirname(paths[path]), exist_ok=True)
+        with open(paths[path], "wb") as f:
+            for chunk in source.chunks():
+                f.write(chunk)
+
+
+def __find_packages(db: PackageDB, names: list):
+    """Get the installed record of every package being uninstalled.
+
+    @param {PackageDB} db The package database.
+    @param {List.<String>} names The packages being uninstalled.
+    @return {List.<InstalledPackage>|NoneType} The packages,
+                                               None if one is
+                                               not installed.
+    """
+    packages = []
+    for name in names:
+        package_details = db.get(name)
+        if package_details is None:
+            logging.warning(f"Package {name} is not installed!")
+            __display_error(f"{name} is not installed!")
+            return None
+        packages.append(package_details)
+    return packages
+
+
+def __plan_sources(db: PackageDB, names: list, game_location: str,
+                   stack: ExitStack):
+    """Work out the payload source of every file being restored.
+
+    @param {PackageDB} db The package database.
+    @param {List.<String>} names The packages being uninstalled.
+    @param {String} game_location An absolute path to the game.
+    @param {ExitStack} stack Keeps the archives the sources read open.
+    @return {Dictionary|NoneType} See signature for __get_sources.
+                                  None if some files cannot be restored.
+    @throws {OSError|JamFormatError} The original LEGO.JAM
+                                     could not be read.
+    """
+    pristine_path = os.path.join(game_location, legojam.PRISTINE_JAM)
+    pristine = None
+    if os.path.isfile(pristine_path):
+        pristine = stack.enter_context(
+            JamArchive(pristine_path, IndexCache()))
+    try:
+        return __get_sources(plan_restore(db, names), db, pristine, stack)
+
+    # Removing the files would lose another package's
+    # copy or the original game files, so change nothing
+    except LookupError as e:
+        logging.warning(f"Could not restore {', '.join(e.args[0])}")
+        __display_error(
+            "The packages were not uninstalled, as these files could "
+            "not be restored from the packages that installed them "
+            f"before or the original LEGO.JAM: {', '.join(e.args[0])}")
+        return None
+
+
+def __apply_sources(sources: dict) -> bool:
+    """Restore and remove the files in the game.
+
+    @param {Dictionary} sources See signature for __get_sources.
+    @return {Boolean} True if the game files were changed,
+                      False otherwise.
+    @throws {OSError} An extracted file could not be written or removed.
+    """
+    pre_extracted = legojam.find_extracted()
+    if pre_extracted["result"]:
+        logging.info(f"Restoring files in {pre_extracted['path']}")
+        __write_files(pre_extracted["path"], sources)
+
+        # Compress the JAM, as the extracted files need it
+        if not legojam.build():
+            logging.warning("There was an error building LEGO.JAM!")
+            return False
+    elif sources and not legojam.replace_entries(sources):
+        logging.warning("There was an error updating LEGO.JAM!")
+        return __display_error("LEGO.JAM could not be updated!")
+    return True
+
+
+def __get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog=f"{const.APP_NAME} uninstall")
+    parser.add_argument("packages", nargs="*",
+                        help="the names of the packages to uninstall")
+    return parser
+
+
+def main(args: list) -> bool:
+    """Uninstall packages from the game.
+
+    @param {List.<String>} args The command line arguments.
+    @return {Boolean} True if the packages were uninstalled,
+                      False otherwise.
+    """
+    settings = user.load()
+
+    # We do not have a set game location
+    if not os.path.isdir(settings.get("gameLocation")):
+        logging.warning("User has not yet configured settings!")
+        return __display_error(
+            "You need to configure your settings before uninstalling!")
+
+    # No package was given
+    names = __get_parser().parse_args(args).packages
+    if not names:
+        logging.warning("No package was specified!")
+        return __display_error("No package was specified for uninstallation!")
+
+    try:
+        with PackageDB() as db, ExitStack() as stack:
+            # Every package must be installed before anything is changed
+            packages = __find_packages(db, names)
+            if packages is None:
+                return False
+
+            # Only the files of the packages are changed,
+            # all in a single pass over LEGO.JAM
+            print("Uninstalling {} package{}...".format(
+                len(packages), "" if len(packages) == 1 else "s"))
+            sources = __plan_sources(db, names, settings.get("gameLocation"),
+                                     stack)
+            if sources is None:
+                return False
+
+            if not __apply_sources(sources):
+                return False
+            for package_details in packages:
+                db.remove(package_details.name)
+
+    except (OSError, JamFormatError, sqlite3.Error) as e:
+        logging.warning("Could not uninstall the packages!")
+        logging.debug(e)
+        return __display_error(f"The packages could not be uninstalled: {e}")
+
+    logging.info("Uninstallation complete!")
+    for package_details in packages:
+        print(f"{package_details.name} {package_details.version} "
+              "successfully uninstalled.")
+    return True
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""rpm - LEGO Racers package manager.
+
+Created 2015-2018 Caleb Ely
+<https://CodeTri.net/>
+
+Licensed under The MIT License
+<http://opensource.org/licenses/MIT/>
+
+"""
+
+
+import os
+import shutil
+import logging
+
+__all__ = ["CHUNK_SIZE", "clone_file", "copy_range", "prefetch", "unshare"]
+
+
+# The buffer size used when the kernel cannot copy for us
+CHUNK_SIZE = 1024 * 1024
+
+# The Linux ioctl sharing a file's data with another file
+FICLONE = 0x40049409
+
+
+def __copy_chunked(src, dst, count: int) -> int:
+    """Copy bytes through a fixed-size buffer.
+
+    @param {File} src The file to copy from, at the start position.
+    @param {File} dst The file to copy to, at the start position.
+    @param {Integer} count The number of bytes to copy.
+    @return {Integer} The number of bytes copied.
+    """
+    buffer = memoryview(bytearray(min(count, CHUNK_SIZE)))
+    copied = 0
+    while copied < count:
+        read = src.readinto(buffer[:min(len(buffer), count - copied)])
+        if not read:
+            break
+        dst.write(buffer[:read])
+        copied += read
+    return copied
+
+
+def __copy_kernel(src, dst, count: int) -> int:
+    """Copy bytes without passing them through user space.
+
+    os.copy_file_range is preferred, followed by os.sendfile.
+
+    @param {File} src The file to copy from, at the start position.
+    @param {File} dst The file to copy to, at the start position.
+    @param {Integer} count The number of bytes to copy.
+    @return {Integer} The number of bytes copied.
+    @throws {OSError} Neither call is supported for these files.
+    """
+    in_fd = src.fileno()
+    out_fd = dst.fileno()
+    copied = 0
+    while copied < count:
+        if hasattr(os, "copy_file_range"):
+            sent = os.copy_file_range(in_fd, out_fd, count - copied)
+        else:
+            sent = os.sendfile(out_fd, in_fd, None, count - copied)
+        if not sent:
+            break
+        copied += sent
+    return copied
+
+
+def copy_range(src, dst, count: int) -> int:
+    """Copy bytes from one file to another with bounded memory.
+
+    Both files are used from, and left at, their current positions.
+    Where the platform allows it, the kernel copies the bytes directly.
+
+    @param {File} src The binary file to copy from.
+    @param {File} dst The binary file to copy to.
+    @param {Integer} count The number of bytes to copy.
+    @return {Integer} The number of bytes copied. This is only less than
+                      count if the source file ended early.
+    """
+    if count <= 0:
+        return 0
+
+    # The kernel calls work on the descriptors, not the Python file
+    # buffers, so line the descriptor positions up with the files
+    dst.flush()
+    src_start = src.tell()
+    dst_start = dst.tell()
+    try:
+        if not hasattr(os, "copy_file_range") and not hasattr(os, "sendfile"):
+            raise OSError("kernel copies are not available")
+        os.lseek(src.fileno(), src_start, os.SEEK_SET)
+        os.lseek(dst.fileno(), dst_start, os.SEEK_SET)
+        copied = __copy_kernel(src, dst, count)
+
+    # The files do not support kernel copies, such as across
+    # file systems on older kernels. Start over with a plain copy
+    except OSError as e:
+        logging.debug(f"Falling back to a buffered copy: {e}")
+        src.seek(src_start)
+        dst.seek(dst_start)
+        return __copy_chunked(src, dst, count)
+
+    # Bring the Python file positions back in line with the descriptors
+    src.seek(src_start + copied)
+    dst.seek(dst_start + copied)
+    return copied
+
+
+def prefetch(path: str):
+    """Ask the operating system to start reading a file into memory.
+
+    This only hints the page cache and does nothing
+    on platforms without posix_fadvise.
+
+    @param {String} path An absolute path to the file.
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+
+    # A failed hint is of no consequence
+    except OSError:
+        pass
+
+
+def __reflink(src: str, dst: str):
+    """Create a copy-on-write clone of a file.
+
+    @param {String} src An absolute path to the file to clone.
+    @param {String} dst An absolute path to the clone, which must not exist.
+    @throws {OSError} The platform or file system cannot clone files.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError("reflinks are not available") from None
+
+    with open(src, "rb") as s, open(dst, "xb") as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            os.remove(dst)
+            raise
+
+
+def clone_file(src: str, dst: str, link: bool=True) -> str:
+    """Make a file available under a second path as cheaply as possible.
+
+    A copy-on-write reflink is preferred, as the two files stay
+    independent. Otherwise the file is hardlinked, if allowed,
+    and copied as a last resort.
+
+    @param {String} src An absolute path to the file.
+    @param {String} dst An absolute path to the new file,
+                        which must not exist.
+    @param {Boolean} [link=True] Allow a hardlink, where both paths
+                                 are the same file.
+    @return {String} "reflink", "hardlink" or "copy".
+    @throws {OSError} The file could not be copied.
+    """
+    try:
+        __reflink(src, dst)
+        return "reflink"
+    except OSError as e:
+        logging.debug(f"Could not reflink {src}: {e}")
+
+    if link:
+        try:
+            os.link(src, dst)
+            return "hardlink"
+        except OSError as e:
+            logging.debug(f"Could not hardlink {src}: {e}")
+
+    shutil.copy2(src, dst)
+    return "copy"
+
+
+def unshare(path: str) -> bool:
+    """Make sure a file does not share its data with any other path.
+
+    A hardlinked file is replaced by a copy of itself, with the same
+    modification time, so it can be written in place without changing
+    the other paths.
+
+    @param {String} path An absolute path to the file.
+    @return {Boolean} True if the file had to be copied, False otherwise.
+    @throws {OSError} The file could not be copied.
+    """
+    if os.stat(path).st_nlink < 2:
+        return False
+
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        clone_file(path, temp_path, False)
+        os.replace(temp_path, path)
+    except OSError:
+        if os.path.isfile(temp_path):
+            os.remove(temp_path)
+        raise
+    logging.info(f"Broke the hardlink of {path}")
+    return True
@@ -0,0 +1,519 @@
+# -*- coding: utf-8 -*-
+"""rpm - LEGO Racers package manager.
+
+Created 2015-2018 Caleb Ely
+<https://CodeTri.net/>
+
+Licensed under The MIT License
+<http://opensource.org/licenses/MIT/>
+
+"""
+
+
+import io
+import os
+import mmap
+import struct
+import logging
+from array import array
+from collections import namedtuple
+
+__all__ = ["JAM_MAGIC", "JamArchive", "JamEntry", "JamEntryFile",
+           "JamFormatError", "JamIndex", "decode_file_records",
+           "decode_folder_records", "read_uint32", "split_path"]
+
+
+JAM_MAGIC = b"LJAM"
+
+# Every index record is a 12 byte NUL-padded name followed by
+# little-endian uint32 fields: the folder offset for folders,
+# the payload offset and size for files
+UINT32 = struct.Struct("<I")
+FOLDER_RECORD = struct.Struct("<12sI")
+FILE_RECORD = struct.Struct("<12sII")
+
+# The root folder record always directly follows the magic
+ROOT_OFFSET = len(JAM_MAGIC)
+
+JamEntry = namedtuple("JamEntry", ["path", "offset", "size"])
+
+# The complete parsed index of an archive. Folder and file paths are
+# in-archive paths, the offsets and sizes are parallel to the file paths
+JamIndex = namedtuple("JamIndex", ["folders", "paths", "offsets", "sizes"])
+
+
+class JamFormatError(ValueError):
+
+    """Raised when a file is not a readable JAM archive."""
+
+
+def __decode_names(raw_names) -> list:
+    """Cut NUL-padded record names down to strings.
+
+    @param {Iterable.<bytes>} raw_names The raw 12 byte record names.
+    @return {List.<String>}
+    """
+    return [raw.partition(b"\0")[0].decode("latin-1") for raw in raw_names]
+
+
+def split_path(path: str) -> list:
+    """Split an in-archive path into its folder and file names.
+
+    Both forward and back slashes are accepted as separators.
+
+    @param {String} path An in-archive path, such as GAMEDATA/FOO.BMP.
+    @return {List.<String>}
+    """
+    return [part for part in path.replace("\\", "/").split("/") if part]
+
+
+def read_uint32(buffer, offset: int) -> int:
+    """Read a little-endian uint32 from a buffer.
+
+    @param {Bytes-like} buffer The archive data.
+    @param {Integer} offset The offset of the integer.
+    @return {Integer}
+    @throws {JamFormatError} The integer lies outside the buffer.
+    """
+    if offset < 0 or offset + UINT32.size > len(buffer):
+        raise JamFormatError(f"offset {offset} is outside the archive "
+                             f"of {len(buffer)} bytes")
+    return UINT32.unpack_from(buffer, offset)[0]
+
+
+def __check_run(buffer, offset: int, end: int, count: int, kind: str):
+    if offset < 0 or end > len(buffer):
+        raise JamFormatError(f"{count} {kind} records at offset {offset} "
+                             f"run past the end of the archive at "
+                             f"{len(buffer)}")
+
+
+def decode_folder_records(buffer, offset: int, count: int) -> tuple:
+    """Decode a run of folder records in bulk.
+
+    @param {Bytes-like} buffer The archive data.
+    @param {Integer} offset The offset of the first record.
+    @param {Integer} count The number of records in the run.
+    @return {Tuple.<List.<String>, array>} The folder names and
+                                           the offsets of their records.
+    @throws {JamFormatError} The records do not fit in the buffer.
+    """
+    end = offset + count * FOLDER_RECORD.size
+    __check_run(buffer, offset, end, count, "folder")
+    records = tuple(zip(*FOLDER_RECORD.iter_unpack(buffer[offset:end])))
+    if not records:
+        return ([], array("I"))
+    return (__decode_names(records[0]), array("I", records[1]))
+
+
+def decode_file_records(buffer, offset: int, count: int) -> tuple:
+    """Decode a run of file records in bulk.
+
+    @param {Bytes-like} buffer The archive data.
+    @param {Integer} offset The offset of the first record.
+    @param {Integer} count The number of records in the run.
+    @return {Tuple.<List.<String>, array, array>} The file names,
+                                                  payload offsets and
+                                                  payload sizes.
+    @throws {JamFormatError} The records do not fit in the buffer.
+    """
+    end = offset + count * FILE_RECORD.size
+    __check_run(buffer, offset, end, count, "file")
+    records = tuple(zip(*FILE_RECORD.iter_unpack(buffer[offset:end])))
+    if not records:
+        return ([], array("I"), array("I"))
+    return (__decode_names(records[0]),
+            array("I", records[1]), array("I", records[2]))
+
+
+class JamEntryFile(io.RawIOBase):
+
+    """Read-only, seekable file object over a single archive entry.
+
+    Reads are served straight from the archive mapping. Closing the
+    file releases its view, so the archive can unmap the file.
+    """
+
+    def __init__(self, view: memoryview):
+        """Initialize class properties.
+
+        @param {memoryview} view The entry payload.
+        """
+        super().__init__()
+        self.__view = view
+        self.__position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        """Read bytes into a pre-allocated buffer.
+
+        @param {Bytes-like} buffer The buffer to fill.
+        @return {Integer} The number of bytes read.
+        """
+        chunk = self.__view[self.__position:self.__position + len(buffer)]
+        count = len(chunk)
+        buffer[:count] = chunk
+        self.__position += count
+        return count
+
+    def seek(self, offset: int, whence: int=io.SEEK_SET) -> int:
+        """Change the stream position.
+
+        @param {Integer} offset The offset relative to whence.
+        @param {Integer} [whence=io.SEEK_SET] The reference point.
+        @return {Integer} The new absolute position.
+        """
+        if whence == io.SEEK_CUR:
+            offset += self.__position
+        elif whence == io.SEEK_END:
+            offset += len(self.__view)
+        if offset < 0:
+            raise ValueError(f"negative seek position {offset}")
+        self.__position = offset
+        return self.__position
+
+    def tell(self) -> int:
+        return self.__position
+
+    def close(self):
+        """Release the entry view."""
+        if not self.closed:
+            self.__view.release()
+        super().close()
+
+
+class JamArchive:
+
+    """Read-only, memory-mapped view of a JAM archive.
+
+    The archive is never read into memory as a whole. The file is mapped
+    and entry payloads are handed out as memoryview slices of the mapping,
+    so the bytes are only paged in when something actually reads them.
+
+    Exposes the following public properties and methods:
+    * path {String} An absolute path to the archive.
+    * stat {os.stat_result} The archive's file status when it was opened.
+    * size {Integer} The archive size in bytes.
+    * view {memoryview} A read-only view of the entire archive.
+    * read(offset, size) {memoryview} A zero-copy slice of the archive.
+    * index() {JamIndex} The complete archive index.
+    * walk_folders(top) {Generator} Lazily walk the archive folders.
+    * walk(top) {Generator.<JamEntry>} Lazily walk the archive entries.
+    * find(path) {JamEntry|NoneType} Look up a single entry.
+    * read_entry(path) {Bytes} A copy of an entry payload.
+    * open_entry(path) {JamEntryFile} A file object over an entry payload.
+    * close() Release the mapping and the underlying file.
+    """
+
+    def __init__(self, path: str, cache=None):
+        """Open and map the archive.
+
+        @param {String} path An absolute path to the JAM archive.
+        @param {IndexCache} [cache=None] A persistent cache to load
+                                         the index from and save it to.
+        @throws {JamFormatError} The file is not a JAM archive.
+        """
+        self.path = os.path.abspath(path)
+        self.__file = open(self.path, "rb")
+        self.__mmap = None
+        self.__cache = cache
+        self.__index = None
+        self.view = None
+
+        try:
+            self.stat = os.fstat(self.__file.fileno())
+            self.size = self.stat.st_size
+
+            # An empty file cannot be mapped, and is not a JAM anyway
+            if self.size < len(JAM_MAGIC):
+                raise JamFormatError(f"{self.path} is not a JAM archive")
+
+            self.__mmap = mmap.mmap(self.__file.fileno(), 0,
+                                    access=mmap.ACCESS_READ)
+            self.view = memoryview(self.__mmap)
+            if self.view[0:len(JAM_MAGIC)] != JAM_MAGIC:
+                raise JamFormatError(f"{self.path} is not a JAM archive")
+
+        # Do not leak the file handle if we could not open the archive
+        except Exception:
+            self.close()
+            raise
+        logging.info(f"Mapped JAM archive {self.path} ({self.size} bytes)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def read(self, offset: int, size: int) -> memoryview:
+        """Get a zero-copy slice of the archive.
+
+        The slice is only valid while the archive is open. Copy
+        anything that must outlive the archive, and release the slice
+        when done, or the mapping stays alive until it is collected.
+
+        @param {Integer} offset The starting offset of the slice.
+        @param {Integer} size The length of the slice.
+        @return {memoryview}
+        """
+        return self.view[offset:offset + size]
+
+    def read_folder(self, offset: int) -> tuple:
+        """Decode the file and folder records of a single folder.
+
+        @param {Integer} offset The offset of the folder record.
+        @return {Tuple.<Tuple, Tuple>} The decoded file records and
+                                       folder records. See signatures for
+                                       decode_file_records and
+                                       decode_folder_records.
+        @throws {JamFormatError} The record does not fit in the archive
+                                 or holds a name that is not a plain
+                                 file or folder name.
+        """
+        if offset < ROOT_OFFSET:
+            raise JamFormatError(f"folder record offset {offset} "
+                                 "points into the archive magic")
+        file_count = read_uint32(self.view, offset)
+        files = decode_file_records(self.view, offset + 4, file_count)
+        folder_pos = offset + 4 + file_count * FILE_RECORD.size
+        folder_count = read_uint32(self.view, folder_pos)
+        folders = decode_folder_records(self.view, folder_pos + 4,
+                                        folder_count)
+        self.__check_names(files[0])
+        self.__check_names(folders[0])
+        return (files, folders)
+
+    @staticmethod
+    def __check_names(names: list):
+        """Check that record names cannot reach outside their folder.
+
+        @param {List.<String>} names The decoded record names.
+        @throws {JamFormatError} A name is empty, a relative folder
+                                 or holds a path separator.
+        """
+        for name in names:
+            if (name in ("", ".", "..") or
+                    any(char in name for char in "/\\\0")):
+                raise JamFormatError(f"invalid record name {name!r}")
+
+    def index(self) -> JamIndex:
+        """Get the complete archive index.
+
+        The index is parsed once and kept for the life of the archive.
+        If a cache was given, it is consulted before parsing and
+        updated afterwards.
+
+        @return {JamIndex}
+        @throws {JamFormatError} The archive index is corrupt.
+        """
+        if self.__index is None and self.__cache is not None:
+            self.__index = self.__cache.load(self)
+
+        if self.__index is None:
+            self.__index = self.__read_index()
+            if self.__cache is not None:
+                self.__cache.save(self, self.__index)
+        return self.__index
+
+    def __read_index(self) -> JamIndex:
+        folders = []
+        paths = []
+        offsets = array("I")
+        sizes = array("I")
+
+        for folder, files, subfolders in self.walk_folders():
+            folders.extend(subfolders)
+            for entry in files:
+                paths.append(entry.path)
+                offsets.append(entry.offset)
+                sizes.append(entry.size)
+
+        logging.info(f"Parsed {len(paths)} entries from {self.path}")
+        return JamIndex(folders, paths, offsets, sizes)
+
+    def __check_entry(self, entry: JamEntry):
+        if entry.offset + entry.size > self.size:
+            raise JamFormatError(
+                f"{self.path}: {entry.path} ends at "
+                f"{entry.offset + entry.size}, past the end of "
+                f"the archive at {self.size}")
+
+    def __find_folder(self, parts: list):
+        """Find a folder record by its case-folded path names.
+
+        @param {List.<String>} parts The case-folded folder names.
+        @return {Tuple.<Integer, List.<String>>|NoneType} The folder record
+            offset and the names as stored in the archive,
+            None if the folder does not exist.
+        """
+        offset = ROOT_OFFSET
+        found = []
+        for part in parts:
+            fol_names, fol_offsets = self.read_folder(offset)[1]
+            for i, name in enumerate(fol_names):
+                if name.casefold() == part:
+                    found.append(name)
+                    offset = fol_offsets[i]
+                    break
+            else:
+                return None
+        return (offset, found)
+
+    def walk_folders(self, top: str=""):
+        """Lazily walk the archive folders, depth-first.
+
+        An explicit stack is used rather than recursion, so the depth
+        of the archive is not limited by the interpreter. Each folder
+        is only decoded when the walk reaches it, so a consumer that
+        stops early never reads the rest of the index.
+
+        Every record is checked against the archive size, and cycles
+        or overlapping folder records fail the walk rather than
+        letting it loop or blow up.
+
+        @param {String} [top=""] The in-archive folder to start from.
+        @return {Generator.<Tuple.<String, List.<JamEntry>, List.<String>>>}
+            The folder path, its files and the paths of its subfolders.
+            The folder path of the archive root is an empty string.
+        @throws {JamFormatError} The archive index is corrupt.
+        """
+        start = self.__find_folder(
+            [part.casefold() for part in split_path(top)])
+        if start is None:
+            return
+
+        # No folder record may be visited twice, which would be
+        # a cycle, and no more records may be decoded than fit in
+        # the archive without overlapping, whatever the folders claim
+        pending = [("/".join(start[1]), start[0])]
+        visited = {start[0]}
+        budget = self.size // FOLDER_RECORD.size
+        while pending:
+            folder, offset = pending.pop()
+            where = f"{self.path}: folder {folder or '(root)'}"
+            try:
+                (names, file_offsets, file_sizes), (fol_names, fol_offsets) = (
+                    self.read_folder(offset))
+            except JamFormatError as e:
+                raise JamFormatError(f"{where}: {e}") from None
+
+            budget -= len(names) + len(fol_names)
+            if budget < 0:
+                raise JamFormatError(f"{where} holds more records "
+                                     "than fit in the archive")
+
+            prefix = f"{folder}/" if folder else ""
+            files = [JamEntry(prefix + name, file_offsets[i], file_sizes[i])
+                     for i, name in enumerate(names)]
+            for entry in files:
+                self.__check_entry(entry)
+
+            subfolders = [prefix + name for name in fol_names]
+            for path, fol_offset in zip(subfolders, fol_offsets):
+                if fol_offset in visited:
+                    raise JamFormatError(
+                        f"{self.path}: folder {path} points back at the "
+                        f"folder record at offset {fol_offset}")
+                visited.add(fol_offset)
+            yield (folder, files, subfolders)
+
+            # Visit the subfolders in archive order
+            pending.extend(reversed(tuple(zip(subfolders, fol_offsets))))
+
+    def walk(self, top: str=""):
+        """Lazily walk every file entry in the archive, depth-first.
+
+        @param {String} [top=""] The in-archive folder to start from.
+        @return {Generator.<JamEntry>}
+        """
+        for folder, files, subfolders in self.walk_folders(top):
+            yield from files
+
+    def find(self, path: str):
+        """Look up a single entry by its in-archive path.
+
+        Only the folders along the path are decoded, no other part
+        of the index is touched. Names are matched case-insensitively,
+        as the game does.
+
+        @param {String} path An in-archive path, such as GAMEDATA/FOO.BMP.
+        @return {JamEntry|NoneType} The entry, or None if it does not exist.
+        @throws {JamFormatError} The archive index is corrupt.
+        """
+        parts = [part.casefold() for part in split_path(path)]
+        if not parts:
+            return None
+
+        # Find the folder holding the file, then the file itself
+        folder = self.__find_folder(parts[:-1])
+        if folder is None:
+            return None
+
+        names, offsets, sizes = self.read_folder(folder[0])[0]
+        for i, name in enumerate(names):
+            if name.casefold() == parts[-1]:
+                entry = JamEntry("/".join(folder[1] + [name]),
+                                 offsets[i], sizes[i])
+                self.__check_entry(entry)
+                return entry
+        return None
+
+    def __get_entry(self, path: str) -> JamEntry:
+        entry = self.find(path)
+        if entry is None:
+            raise KeyError(f"There is no entry named {path} in the archive")
+        return entry
+
+    def read_entry(self, path: str) -> bytes:
+        """Get a copy of a single entry payload.
+
+        The copy stays valid after the archive is closed.
+        Use read with the entry's offset and size for a zero-copy view.
+
+        @param {String} path An in-archive path, such as GAMEDATA/FOO.BMP.
+        @return {Bytes}
+        @throws {KeyError} The entry does not exist.
+        """
+        entry = self.__get_entry(path)
+        with self.read(entry.offset, entry.size) as payload:
+            return bytes(payload)
+
+    def open_entry(self, path: str) -> JamEntryFile:
+        """Open a single entry payload as a read-only file object.
+
+        @param {String} path An in-archive path, such as GAMEDATA/FOO.BMP.
+        @return {JamEntryFile}
+        @throws {KeyError} The entry does not exist.
+        """
+        entry = self.__get_entry(path)
+        return JamEntryFile(self.read(entry.offset, entry.size))
+
+    def close(self):
+        """Release the mapping and the underlying file.
+
+        The file is always closed. If views of the archive are still
+        alive, the mapping is left to be released along with them.
+        """
+        try:
+            if self.view is not None:
+                self.view.release()
+                self.view = None
+            if self.__mmap is not None:
+                self.__mmap.close()
+                self.__mmap = None
+
+        # Some slice from read is still in use
+        except BufferError:
+            logging.debug(f"Views of {self.path} are still alive, "
+                          "leaving the mapping open")
+            self.view = None
+            self.__mmap = None
+        finally:
+            if not self.__file.closed:
+                self.__file.close()
@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""rpm - LEGO Racers package manager.
+
+Created 2015-2018 Caleb Ely
+<https://CodeTri.net/>
+
+Licensed under The MIT License
+<http://opensource.org/licenses/MIT/>
+
+"""
+
+
+import os
+import time
+import struct
+import hashlib
+import logging
+
+from src.utils import fileutils, jsonutils, utils
+
+__all__ = ["BuildCache", "tree_hash"]
+
+
+# Bump the version whenever the archives built
+# from the same tree would come out differently
+BUILD_CACHE_VERSION = 1
+
+# Bump the version whenever the stat cache layout changes
+STAT_CACHE_VERSION = 1
+
+# The default upper bound on the total size of all cached archives
+MAX_BUILD_CACHE_SIZE = 512 * 1024 * 1024
+
+# Files modified this close to when they were hashed may have changed
+# again within the same timestamp, so their hashes are not reused.
+# This covers the two second timestamps of FAT file systems
+RACY_WINDOW_NS = 2 * 1000 * 1000 * 1000
+
+
+def tree_hash(folders: list, digests: dict) -> bytes:
+    """Get the Merkle hash of a source tree.
+
+    Each folder is hashed from the names, sizes and content hashes of its
+    files and the names and hashes of its subfolders, in the order they
+    are stored. Trees with the same hash build the same archive.
+
+    @param {List.<JamFolder>} folders The folder table of the tree,
+                                      each folder before its subfolders.
+    @param {Dictionary.<String, String>} digests The content hash
+                                                of every file.
+    @return {Bytes}
+    """
+    hashes = {}
+    for folder in reversed(folders):
+        prefix = f"{folder.path}/" if folder.path else ""
+        digest = hashlib.blake2b(digest_size=32)
+        for name, size in folder.files:
+            digest.update(b"F" + name.encode("latin-1") + b"\0" +
+                          struct.pack("<Q", size) +
+                          bytes.fromhex(digests[prefix + name]))
+        for name in folder.folders:
+            digest.update(b"D" + name.encode("latin-1") + b"\0" +
+                          hashes.pop(prefix + name))
+        hashes[folder.path] = digest.digest()
+    return hashes[""]
+
+
+class BuildCache:
+
+    """Persistent, content-addressed cache of built JAM archives.
+
+    Archives are keyed by the Merkle hash of the tree they were built
+    from, so building a tree that was already built before only has
+    to link the stored archive into place. File contents are hashed
+    once and reused for as long as the file status stays the same.
+    Once the cache grows past its size limit, the least recently used
+    archives are deleted.
+
+    Archives are reflinked where the file system supports it and copied
+    otherwise, never hardlinked. Anything may write to the archive in the
+    game installation in place, which must not change the cache.
+
+    Exposes the following public properties and methods:
+    * path {String} An absolute path to the cache folder.
+    * max_size {Integer} The cache size limit in bytes.
+    * tree_key(tree_path, folders, stats, dedup) {String} The cache key.
+    * is_cached(key, archive_path) {Boolean} Check if an archive is
+        the one cached for a key.
+    * restore(key, archive_path) {Boolean} Put a cached archive in place.
+    * store(key, archive_path) {Boolean} Cache a freshly built archive.
+    """
+
+    def __init__(self, path: str=None, max_size: int=MAX_BUILD_CACHE_SIZE):
+        """Initialize class properties.
+
+        @param {String} [path=None] An absolute path to the cache folder.
+                                    Defaults to a folder in the app's
+                                    configuration folder.
+        @param {Integer} [max_size=MAX_BUILD_CACHE_SIZE] The size limit.
+        """
+        if path is None:
+            path = os.path.join(utils.AppUtils().config_path,
+                                "cache", "build")
+        self.path = path
+        self.max_size = max_size
+        os.makedirs(os.path.join(self.path, "stats"), exist_ok=True)
+
+    @staticmethod
+    def __hash_file(path: str) -> str:
+        digest = hashlib.blake2b(digest_size=32)
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(fileutils.CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def __get_file(self, key: str) -> str:
+        return os.path.join(self.path, f"{key}.JAM")
+
+    def __get_stats_file(self, tree_path: str) -> str:
+        name = hashlib.sha1(
+            os.path.normcase(tree_path).encode("utf-8")).hexdigest()
+        return os.path.join(self.path, "stats", f"{name}.json")
+
+    def __get_index_file(self) -> str:
+        return os.path.join(self.path, "index.json")
+
+    def __get_placed_file(self) -> str:
+        return os.path.join(self.path, "placed.json")
+
+    def tree_key(self, tree_path: str, folders: list, stats: dict,
+                 dedup: bool=False) -> str:
+        """Get the cache key of a source tree.
+
+        Only files that changed since the tree was last hashed are read.
+
+        @param {String} tree_path An absolute path to the source tree.
+        @param {List.<JamFolder>} folders The folder table of the tree.
+        @param {Dictionary.<String, os.stat_result>} stats The file status
+            of every source file, by in-archive path.
+        @param {Boolean} [dedup=False] The archive stores every
+                                       distinct payload once.
+        @return {String}
+        @throws {OSError} A file could not be read.
+        """
+        stats_file = self.__get_stats_file(tree_path)
+        known = {}
+        hashed_at = 0
+        if os.path.isfile(stats_file):
+            record = jsonutils.read(stats_file)
+            if record and record.get("version") == STAT_CACHE_VERSION:
+                known = record["files"]
+                hashed_at = record["hashedAt"]
+
+        now = int(time.time() * 10**9)
+        digests = {}
+        files = {}
+        rehashed = 0
+        for path, stat in stats.items():
+            old = known.get(path)
+            if (old is not None and
+                    old[:2] == [stat.st_size, stat.st_mtime_ns] and
+                    stat.st_mtime_ns + RACY_WINDOW_NS < hashed_at):
+                digest = old[2]
+            else:
+                digest = self.__hash_file(
+                    os.path.join(tree_path, *path.split("/")))
+                rehashed += 1
+            digests[path] = digest
+            files[path] = [stat.st_size, stat.st_mtime_ns, digest]
+
+        if rehashed:
+            logging.info(f"Hashed {rehashed} of {len(stats)} files "
+                         f"in {tree_path}")
+            jsonutils.write(stats_file, {
+                "version": STAT_CACHE_VERSION,
+                "hashedAt": now,
+                "files": files
+            }, None)
+
+        digest = hashlib.blake2b(digest_size=32)
+        digest.update(struct.pack("<I?", BUILD_CACHE_VERSION, dedup))
+        digest.update(tree_hash(folders, digests))
+        return digest.hexdigest()
+
+    def restore(self, key: str, archive_path: str) -> bool:
+        """Put the archive cached for a key in place.
+
+        The archive is reflinked into place where possible, so this costs
+        next to nothing, and copied otherwise. An existing archive
+        is replaced.
+
+        @param {String} key The cache key of the source tree.
+        @param {String} archive_path An absolute path to the archive.
+        @return {Boolean} True if the archive was restored,
+                          False if it is not cached.
+        """
+        cache_file = self.__get_file(key)
+        if not os.path.isfile(cache_file):
+            return False
+
+        temp_path = f"{archive_path}.{os.getpid()}.tmp"
+        try:
+            method = fileutils.clone_file(cache_file, temp_path, False)
+            os.replace(temp_path, archive_path)
+        except OSError as e:
+            logging.warning(f"Could not restore {archive_path} from cache!")
+            logging.debug(e)
+            if os.path.isfile(temp_path):
+                os.remove(temp_path)
+            return False
+
+        logging.info(f"Restored {archive_path} from {cache_file} ({method})")
+        self.__touch(key)
+        self.__record_placed(key, archive_path)
+        return True
+
+    def is_cached(self, key: str, archive_path: str) -> bool:
+        """Check if an archive already is the one cached for a key.
+
+        The archive must be unchanged since it was last restored
+        from or stored in the cache under the key.
+
+        @param {String} key The cache key of the source tree.
+        @param {String} archive_path An absolute path to the archive.
+        @return {Boolean}
+        """
+        placed = self.__read_json(self.__get_placed_file()).get(
+            os.path.normcase(archive_path))
+        if (placed is None or placed[0] != key or
+                not os.path.isfile(self.__get_file(key))):
+            return False
+        try:
+            stat = os.stat(archive_path)
+        except OSError:
+            return False
+        if placed[1:] != [stat.st_size, stat.st_mtime_ns]:
+            return False
+        self.__touch(key)
+        return True
+
+    def store(self, key: str, archive_path: str) -> bool:
+        """Cache a freshly built archive.
+
+        @param {String} key The cache key of the tree it was built from.
+        @param {String} archive_path An absolute path to the archive.
+        @return {Boolean} True if the archive was cached, False otherwise.
+        """
+        cache_file = self.__get_file(key)
+        temp_file = f"{cache_file}.{os.getpid()}.tmp"
+        try:
+            method = fileutils.clone_file(archive_path, temp_file, False)
+            os.replace(temp_file, cache_file)
+
+        # Caching is only an optimization, silently fail
+        except OSError as e:
+            logging.warning(f"Could not cache {archive_path}!")
+            logging.debug(e)
+            if os.path.isfile(temp_file):
+                os.remove(temp_file)
+            return False
+
+        logging.info(f"Cached {archive_path} as {cache_file} ({method})")
+        self.__touch(key)
+        self.__record_placed(key, archive_path)
+        self.__evict()
+        return True
+
+    @staticmethod
+    def __read_json(path: str) -> dict:
+        data = jsonutils.read(path) if os.path.isfile(path) else None
+        return data if isinstance(data, dict) else {}
+
+    def __read_index(self) -> dict:
+        return self.__read_json(self.__get_index_file())
+
+    def __record_placed(self, key: str, archive_path: str):
+        """Remember which cached archive an archive is a copy of.
+
+        @param {String} key The cache key of the archive.
+        @param {String} archive_path An absolute path to the archive.
+        """
+        placed_file = self.__get_placed_file()
+        placed = self.__read_json(placed_file)
+        stat = os.stat(archive_path)
+        placed[os.path.normcase(archive_path)] = [key, stat.st_size,
+                                                  stat.st_mtime_ns]
+        jsonutils.write(placed_file, placed, None)
+
+    def __touch(self, key: str):
+        """Mark a cached archive as recently used.
+
+        The cached archive's own timestamps cannot be used for this,
+        as reflinking or copying it may not update them.
+        """
+        index = self.__read_index()
+        index[key] = int(time.time() * 10**9)
+        jsonutils.write(self.__get_index_file(), index, None)
+
+    def __evict(self):
+        """Delete the least recently used archives
+        until the cache fits within its size limit.
+        """
+        index = self.__read_index()
+        cache_files = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith(".JAM"):
+                key = entry.name[:-4]
+                cache_files.append((index.get(key, 0), entry.stat().st_size,
+                                    key, entry.path))
+
+        total_size = sum(size for _, size, _, _ in cache_files)
+        for _, size, key, path in sorted(cache_files):
+            if total_size <= self.max_size:
+                break
+            logging.info(f"Evicting cached archive {path}")
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            index.pop(key, None)
+            total_size -= size
+
+        # Forget the archives that no longer exist
+        jsonutils.write(self.__get_index_file(),
+                        {key: used for key, used in index.items()
+                         if os.path.isfile(self.__get_file(key))}, None)
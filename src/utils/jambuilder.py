@@ -0,0 +1,588 @@
+# -*- coding: utf-8 -*-
+"""rpm - LEGO Racers package manager.
+
+Created 2015-2018 Caleb Ely
+<https://CodeTri.net/>
+
+Licensed under The MIT License
+<http://opensource.org/licenses/MIT/>
+
+"""
+
+
+import os
+import hashlib
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from src.utils import fileutils
+from src.utils.jamarchive import (FILE_RECORD, FOLDER_RECORD, JAM_MAGIC,
+                                  UINT32, JamEntry, split_path)
+
+__all__ = ["MAX_NAME_LENGTH", "MAX_OFFSET", "PREFETCH_FILES",
+           "ArchiveSource", "FileSource", "JamFolder", "JamLayout",
+           "JamTree", "ZipSource", "folder_record_size", "hash_payloads",
+           "pack_folder", "plan_layout", "write_layout", "write_tree"]
+
+
+# Record names are stored in 12 bytes without a required NUL terminator
+MAX_NAME_LENGTH = 12
+
+# The largest offset a uint32 record field can hold
+MAX_OFFSET = 0xFFFFFFFF
+
+# How many files to read ahead of the one being written
+PREFETCH_FILES = 8
+
+# A single folder of the tree to be built. The path is the in-archive
+# folder path ("" for the root), files is a list of (name, size) tuples
+# and folders is a list of subfolder names. Every subfolder must have
+# its own JamFolder in the same tree
+JamFolder = namedtuple("JamFolder", ["path", "files", "folders"])
+
+# The planned archive. The header is the complete index, ready to be
+# written as-is, and the entries are every file in record order. Their
+# payloads are written after the header in offset order, except for
+# deduplicated entries, which point back at an earlier entry's payload.
+# Folders holds the record offset of every folder path
+JamLayout = namedtuple("JamLayout", ["header", "entries", "size", "folders"])
+
+
+def __join(folder: str, name: str) -> str:
+    return f"{folder}/{name}" if folder else name
+
+
+def __encode_name(name: str) -> bytes:
+    """Encode a record name, enforcing the format's name length.
+
+    @param {String} name The folder or file name.
+    @return {Bytes}
+    @throws {ValueError} The name is too long.
+    """
+    raw = name.encode("latin-1")
+    if len(raw) > MAX_NAME_LENGTH:
+        raise ValueError(f"name {name} is longer than "
+                         f"{MAX_NAME_LENGTH} characters")
+    return raw
+
+
+def folder_record_size(folder: JamFolder) -> int:
+    """Get the size of a folder record and the records it holds.
+
+    @param {JamFolder} folder The folder.
+    @return {Integer}
+    """
+    return (UINT32.size * 2 + len(folder.files) * FILE_RECORD.size +
+            len(folder.folders) * FOLDER_RECORD.size)
+
+
+def __pack_folder(buffer, position: int, folder: JamFolder,
+                  file_offsets: dict, folder_offsets: dict):
+    """Serialize a folder record into a buffer.
+
+    @param {bytearray} buffer The buffer to write into.
+    @param {Integer} position The offset to write the record at.
+    @param {JamFolder} folder The folder.
+    @param {Dictionary.<String, Integer>} file_offsets The payload offset
+                                                       of every file path.
+    @param {Dictionary.<String, Integer>} folder_offsets The record offset
+                                                         of every folder.
+    @throws {ValueError} The folder cannot be stored in a JAM archive.
+    """
+    UINT32.pack_into(buffer, position, len(folder.files))
+    position += UINT32.size
+    for name, size in folder.files:
+        FILE_RECORD.pack_into(buffer, position, __encode_name(name),
+                              file_offsets[__join(folder.path, name)], size)
+        position += FILE_RECORD.size
+
+    UINT32.pack_into(buffer, position, len(folder.folders))
+    position += UINT32.size
+    for name in folder.folders:
+        child = __join(folder.path, name)
+        if child not in folder_offsets:
+            raise ValueError(f"folder {child} is missing from the tree")
+        FOLDER_RECORD.pack_into(buffer, position, __encode_name(name),
+                                folder_offsets[child])
+        position += FOLDER_RECORD.size
+
+
+def pack_folder(folder: JamFolder, file_offsets: dict,
+                folder_offsets: dict) -> bytearray:
+    """Serialize a single folder record.
+
+    @param {JamFolder} folder The folder.
+    @param {Dictionary.<String, Integer>} file_offsets The payload offset
+                                                       of every file path.
+    @param {Dictionary.<String, Integer>} folder_offsets The record offset
+                                                         of every folder.
+    @return {bytearray}
+    @throws {ValueError} The folder cannot be stored in a JAM archive.
+    """
+    record = bytearray(folder_record_size(folder))
+    __pack_folder(record, 0, folder, file_offsets, folder_offsets)
+    return record
+
+
+def __hash_source(source) -> bytes:
+    """Hash a payload, reading it in bounded chunks.
+
+    @param {Source} source The payload source.
+    @return {Bytes}
+    """
+    digest = hashlib.blake2b(digest_size=32)
+    for chunk in source.chunks():
+        digest.update(chunk)
+    return digest.digest()
+
+
+def hash_payloads(sources: dict) -> dict:
+    """Hash the payloads that could be duplicates of each other.
+
+    Only payloads sharing their size with another one can be identical,
+    so every other payload is never read.
+
+    @param {Dictionary.<String, Source>} sources The payload source of
+                                                 every in-archive path.
+    @return {Dictionary.<String, Bytes>} The content hash of every
+                                         path that was hashed.
+    """
+    by_size = {}
+    for path, source in sources.items():
+        if source.size > 0:
+            by_size.setdefault(source.size, []).append(path)
+
+    digests = {}
+    for paths in by_size.values():
+        if len(paths) > 1:
+            for path in paths:
+                digests[path] = __hash_source(sources[path])
+    return digests
+
+
+def plan_layout(folders: list, digests: dict=None) -> JamLayout:
+    """Lay out and serialize a complete JAM archive header.
+
+    Every folder record offset is assigned in a single pass over the
+    folder table, so no pointer has to be searched for and patched
+    later. The payloads are placed directly after the header in
+    the order their records appear.
+
+    When content hashes are given, files with the same size and hash
+    share the payload of the first of them instead of being stored again.
+
+    @param {List.<JamFolder>} folders Every folder of the tree, starting
+                                      with the root. Folder records are
+                                      written in this order.
+    @param {Dictionary.<String, Bytes>} [digests=None] Content hashes by
+        in-archive path, see hash_payloads. Files without one are
+        always stored on their own.
+    @return {JamLayout}
+    @throws {ValueError} The tree cannot be stored in a JAM archive.
+    """
+    if not folders or folders[0].path != "":
+        raise ValueError("the tree must start with the root folder")
+
+    # Each folder record holds its file and subfolder records,
+    # so its size (and thus every offset) follows from the counts alone
+    folder_offsets = {}
+    position = len(JAM_MAGIC)
+    for folder in folders:
+        folder_offsets[folder.path] = position
+        position += folder_record_size(folder)
+    header_size = position
+
+    # The payloads follow the header in record order
+    if digests is None:
+        digests = {}
+    entries = []
+    file_offsets = {}
+    stored = {}
+    payload_offset = header_size
+    for folder in folders:
+        for name, size in folder.files:
+            path = __join(folder.path, name)
+            digest = digests.get(path)
+
+            # An identical payload is already stored
+            if (digest, size) in stored:
+                file_offsets[path] = stored[(digest, size)]
+                entries.append(JamEntry(path, file_offsets[path], size))
+                continue
+
+            if payload_offset + size > MAX_OFFSET:
+                raise ValueError("the archive would be larger than 4 GiB")
+            if digest is not None:
+                stored[(digest, size)] = payload_offset
+            file_offsets[path] = payload_offset
+            entries.append(JamEntry(path, payload_offset, size))
+            payload_offset += size
+
+    header = bytearray(header_size)
+    header[0:len(JAM_MAGIC)] = JAM_MAGIC
+    for folder in folders:
+        __pack_folder(header, folder_offsets[folder.path], folder,
+                      file_offsets, folder_offsets)
+    return JamLayout(header, entries, payload_offset, folder_offsets)
+
+
+class FileSource:
+
+    """A payload read from a file on disk."""
+
+    __slots__ = ("path", "size")
+
+    def __init__(self, path: str, size: int):
+        """Initialize class properties.
+
+        @param {String} path An absolute path to the file.
+        @param {Integer} size The file size the archive was laid out with.
+        """
+        self.path = path
+        self.size = size
+
+    def prefetch(self):
+        fileutils.prefetch(self.path)
+
+    def chunks(self):
+        with open(self.path, "rb") as f:
+            yield from iter(lambda: f.read(fileutils.CHUNK_SIZE), b"")
+
+    def copy_to(self, out) -> int:
+        """Copy the payload into an archive.
+
+        @param {File} out The archive, positioned at the payload offset.
+        @return {Integer} The number of bytes copied.
+        @throws {OSError} The file changed size since it was laid out.
+        """
+        with open(self.path, "rb") as f:
+            if (os.fstat(f.fileno()).st_size != self.size or
+                    fileutils.copy_range(f, out, self.size) != self.size):
+                raise OSError(f"{self.path} changed while building")
+        return self.size
+
+
+class ArchiveSource:
+
+    """A payload copied from an entry of another archive."""
+
+    __slots__ = ("archive", "offset", "size")
+
+    def __init__(self, archive, offset: int, size: int):
+        """Initialize class properties.
+
+        @param {JamArchive} archive The archive holding the payload.
+        @param {Integer} offset The payload offset.
+        @param {Integer} size The payload size.
+        """
+        self.archive = archive
+        self.offset = offset
+        self.size = size
+
+    def prefetch(self):
+        pass
+
+    def chunks(self):
+        with self.archive.read(self.offset, self.size) as payload:
+            for start in range(0, self.size, fileutils.CHUNK_SIZE):
+                yield payload[start:start + fileutils.CHUNK_SIZE]
+
+    def copy_to(self, out) -> int:
+        with self.archive.read(self.offset, self.size) as payload:
+            out.write(payload)
+        return self.size
+
+
+class ZipSource:
+
+    """A payload decompressed from a zip archive member."""
+
+    __slots__ = ("zf", "info", "size")
+
+    def __init__(self, zf, info):
+        """Initialize class properties.
+
+        @param {ZipFile} zf The open zip archive.
+        @param {ZipInfo} info The member to copy.
+        """
+        self.zf = zf
+        self.info = info
+        self.size = info.file_size
+
+    def prefetch(self):
+        pass
+
+    def chunks(self):
+        with self.zf.open(self.info) as f:
+            yield from iter(lambda: f.read(fileutils.CHUNK_SIZE), b"")
+
+    def copy_to(self, out) -> int:
+        # Zip members can only be read front to back on Python 3.6,
+        # so they cannot be handed to fileutils::copy_range
+        copied = 0
+        for chunk in self.chunks():
+            out.write(chunk)
+            copied += len(chunk)
+        if copied != self.size:
+            raise OSError(f"{self.info.filename} is truncated")
+        return copied
+
+
+class JamTree:
+
+    """An ordered tree of archive entries and their payload sources.
+
+    Paths are matched case-insensitively, as the game does, and keep
+    the casing they were first added with. Folders and files keep the
+    order they were added in.
+
+    Exposes the following public properties and methods:
+    * add_folder(path) Add a folder and any missing parent folders.
+    * add(path, source) Add or replace a file.
+    * add_files(path) {List.<String>} Add every file below a folder.
+    * remove(path) {Boolean} Remove a file.
+    * prune(path) {Integer} Remove a folder and parents left empty.
+    * get(path) {Source|NoneType} Get the source of a file.
+    * items() {Generator} Every (path, source) pair, in tree order.
+    * folders() {List.<JamFolder>} The folder table for plan_layout.
+    * from_archive(archive) {JamTree} A tree of an archive's entries.
+    """
+
+    def __init__(self):
+        """Initialize class properties."""
+        # Each folder is [path, file keys, folder keys], the keys being
+        # dictionaries used as ordered sets. Each file is [path, source]
+        self.__folders = {"": ["", {}, {}]}
+        self.__files = {}
+
+    def __len__(self) -> int:
+        return len(self.__files)
+
+    def __contains__(self, path: str) -> bool:
+        return self.__key(path) in self.__files
+
+    @staticmethod
+    def __join(folder: str, name: str) -> str:
+        return f"{folder}/{name}" if folder else name
+
+    @staticmethod
+    def __key(path: str) -> str:
+        return "/".join(split_path(path)).casefold()
+
+    @staticmethod
+    def __check_name(name: str):
+        if len(name.encode("latin-1")) > MAX_NAME_LENGTH:
+            raise ValueError(f"name {name} is longer than "
+                             f"{MAX_NAME_LENGTH} characters")
+
+    def add_folder(self, path: str) -> str:
+        """Add a folder and any missing parent folders.
+
+        @param {String} path The in-archive folder path.
+        @return {String} The folder's case-folded key.
+        @throws {ValueError} The path cannot be stored in a JAM archive.
+        """
+        key = ""
+        for part in split_path(path):
+            self.__check_name(part)
+            child = self.__join(key, part.casefold())
+            if child not in self.__folders:
+                if child in self.__files:
+                    raise ValueError(f"{path} is already a file")
+                self.__folders[child] = [
+                    self.__join(self.__folders[key][0], part), {}, {}]
+                self.__folders[key][2][child] = None
+            key = child
+        return key
+
+    def add(self, path: str, source):
+        """Add a file, or replace the source of an existing file.
+
+        @param {String} path The in-archive file path.
+        @param {Source} source The payload source.
+        @throws {ValueError} The path cannot be stored in a JAM archive.
+        """
+        parts = split_path(path)
+        if not parts:
+            raise ValueError("a file path cannot be empty")
+        parent = self.add_folder("/".join(parts[:-1]))
+        self.__check_name(parts[-1])
+
+        key = self.__join(parent, parts[-1].casefold())
+        if key in self.__folders:
+            raise ValueError(f"{path} is already a folder")
+        if key in self.__files:
+            self.__files[key][1] = source
+        else:
+            self.__files[key] = [
+                self.__join(self.__folders[parent][0], parts[-1]), source]
+            self.__folders[parent][1][key] = None
+
+    def add_files(self, path: str) -> list:
+        """Add every file below a folder on disk, replacing the sources
+        of existing files with the same in-archive path.
+
+        @param {String} path An absolute path to the folder.
+        @return {List.<String>} The files that cannot be stored
+                                in a JAM archive and were skipped.
+        """
+        skipped = []
+        for current, dirs, files in os.walk(path):
+            folder = os.path.relpath(current, path).replace(os.sep, "/")
+            for name in files:
+                file_path = os.path.join(current, name)
+                try:
+                    self.add(self.__join("" if folder == "." else folder,
+                                         name),
+                             FileSource(file_path,
+                                        os.path.getsize(file_path)))
+                except ValueError:
+                    skipped.append(file_path)
+        return skipped
+
+    def remove(self, path: str) -> bool:
+        """Remove a file.
+
+        @param {String} path The in-archive file path.
+        @return {Boolean} True if the file was removed,
+                          False if it did not exist.
+        """
+        key = self.__key(path)
+        if key not in self.__files:
+            return False
+        del self.__files[key]
+        del self.__folders[key.rpartition("/")[0]][1][key]
+        return True
+
+    def prune(self, path: str) -> int:
+        """Remove a folder if it is empty, then every parent folder
+        that leaves empty. The root folder is never removed.
+
+        @param {String} path The in-archive folder path.
+        @return {Integer} The number of folders removed.
+        """
+        key = self.__key(path)
+        removed = 0
+        while key in self.__folders and key and not any(
+                self.__folders[key][1:]):
+            parent = key.rpartition("/")[0]
+            del self.__folders[key]
+            del self.__folders[parent][2][key]
+            key = parent
+            removed += 1
+        return removed
+
+    def get(self, path: str):
+        """Get the source of a file.
+
+        @param {String} path The in-archive file path.
+        @return {Source|NoneType} The source, None if there is no such file.
+        """
+        entry = self.__files.get(self.__key(path))
+        return entry[1] if entry is not None else None
+
+    def __walk(self):
+        """Walk the folders depth-first from the root, in tree order.
+
+        @return {Generator.<List>} See the folder layout in __init__.
+        """
+        pending = [""]
+        while pending:
+            folder = self.__folders[pending.pop()]
+            yield folder
+            pending.extend(reversed(tuple(folder[2])))
+
+    def items(self):
+        """Get every file and its source, in tree order.
+
+        @return {Generator.<Tuple.<String, Source>>}
+        """
+        for path, file_keys, folder_keys in self.__walk():
+            for key in file_keys:
+                yield tuple(self.__files[key])
+
+    def folders(self) -> list:
+        """Get the folder table, depth-first from the root.
+
+        @return {List.<JamFolder>} See signature for plan_layout.
+        """
+        table = []
+        for path, file_keys, folder_keys in self.__walk():
+            files = []
+            for key in file_keys:
+                file_path, source = self.__files[key]
+                files.append((file_path.rpartition("/")[2], source.size))
+            table.append(JamFolder(path, files, [
+                self.__folders[key][0].rpartition("/")[2]
+                for key in folder_keys]))
+        return table
+
+    @classmethod
+    def from_archive(cls, archive):
+        """Create a tree holding every entry of an archive.
+
+        The payloads are copied straight from the archive,
+        which must stay open until the tree is written.
+
+        @param {JamArchive} archive The archive.
+        @return {JamTree}
+        """
+        tree = cls()
+        for folder, files, subfolders in archive.walk_folders():
+            for path in subfolders:
+                tree.add_folder(path)
+            for entry in files:
+                tree.add(entry.path, ArchiveSource(archive, entry.offset,
+                                                   entry.size))
+        return tree
+
+
+def write_layout(f, layout: JamLayout, sources: dict):
+    """Write a planned archive, streaming every payload into place.
+
+    The next few file payloads are read ahead in the background
+    while the current one is written. Payloads shared by several
+    entries are only written once.
+
+    @param {File} f The binary file to write the archive to.
+    @param {JamLayout} layout The planned archive.
+    @param {Dictionary.<String, Source>} sources The payload source of
+                                                 every in-archive path.
+    @throws {OSError} A payload could not be copied.
+    """
+    # A deduplicated entry points before the end of what is written
+    entries = []
+    position = len(layout.header)
+    for entry in layout.entries:
+        if entry.offset >= position:
+            entries.append(entry)
+            position = entry.offset + entry.size
+
+    f.write(layout.header)
+    with ThreadPoolExecutor(max_workers=1) as prefetcher:
+        for entry in entries[:PREFETCH_FILES]:
+            prefetcher.submit(sources[entry.path].prefetch)
+        for i, entry in enumerate(entries):
+            if i + PREFETCH_FILES < len(entries):
+                prefetcher.submit(
+                    sources[entries[i + PREFETCH_FILES].path].prefetch)
+            if sources[entry.path].copy_to(f) != entry.size:
+                raise OSError(f"{entry.path} changed while building")
+
+
+def write_tree(path: str, tree: JamTree, dedup: bool=False) -> JamLayout:
+    """Build an archive from a tree of entries.
+
+    @param {String} path An absolute path to the archive to write.
+    @param {JamTree} tree The archive entries.
+    @param {Boolean} [dedup=False] Store identical payloads only once.
+    @return {JamLayout} The layout the archive was written with.
+    @throws {ValueError} The tree cannot be stored in a JAM archive.
+    @throws {OSError} The archive could not be written.
+    """
+    sources = dict(tree.items())
+    digests = hash_payloads(sources) if dedup else None
+    layout = plan_layout(tree.folders(), digests)
+    with open(path, "wb") as f:
+        write_layout(f, layout, sources)
+    return layout
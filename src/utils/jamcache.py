@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""rpm - LEGO Racers package manager.
+
+Created 2015-2018 Caleb Ely
+<https://CodeTri.net/>
+
+Licensed under The MIT License
+<http://opensource.org/licenses/MIT/>
+
+"""
+
+
+import os
+import sys
+import struct
+import hashlib
+import logging
+from array import array
+
+from src.utils import utils
+from src.utils.jamarchive import JamIndex
+
+__all__ = ["IndexCache"]
+
+
+# Bump the version whenever the cache file layout changes
+CACHE_MAGIC = b"RJIX"
+CACHE_VERSION = 2
+
+# magic, version, archive size, archive mtime, header hash,
+# folder blob length, file count, path blob length
+CACHE_HEADER = struct.Struct("<4sIQQ32sIII")
+
+# The number of leading archive bytes hashed into the cache key.
+# This covers the entire index of all but the largest archives
+HEADER_HASH_SIZE = 64 * 1024
+
+# The default upper bound on the total size of all cached indexes
+MAX_CACHE_SIZE = 64 * 1024 * 1024
+
+
+class IndexCache:
+
+    """Persistent on-disk cache of parsed JAM indexes.
+
+    Each cached index is keyed by the archive's size, modification time
+    and a hash of its leading bytes, so an archive that changes in any
+    way gets a new entry. Once the cache grows past its size limit,
+    the least recently used indexes are deleted.
+
+    Exposes the following public properties and methods:
+    * path {String} An absolute path to the cache folder.
+    * max_size {Integer} The cache size limit in bytes.
+    * load(archive) {JamIndex|NoneType} Load a cached index.
+    * save(archive, index) {Boolean} Cache an index.
+    """
+
+    def __init__(self, path: str=None, max_size: int=MAX_CACHE_SIZE):
+        """Initialize class properties.
+
+        @param {String} [path=None] An absolute path to the cache folder.
+                                    Defaults to a folder in the app's
+                                    configuration folder.
+        @param {Integer} [max_size=MAX_CACHE_SIZE] The cache size limit.
+        """
+        if path is None:
+            path = os.path.join(utils.AppUtils().config_path,
+                                "cache", "index")
+        self.path = path
+        self.max_size = max_size
+        os.makedirs(self.path, exist_ok=True)
+
+    @staticmethod
+    def __array_bytes(values: array) -> bytes:
+        """Get the little-endian bytes of an integer array."""
+        if sys.byteorder == "big":
+            values = array(values.typecode, values)
+            values.byteswap()
+        return values.tobytes()
+
+    @staticmethod
+    def __bytes_array(data) -> array:
+        """Get an integer array from little-endian bytes."""
+        values = array("I")
+        values.frombytes(data)
+        if sys.byteorder == "big":
+            values.byteswap()
+        return values
+
+    def __get_key(self, archive) -> tuple:
+        """Get the fields identifying an archive.
+
+        @param {JamArchive} archive The archive.
+        @return {Tuple.<Integer, Integer, bytes>} The archive size,
+                                                  mtime and header hash.
+        """
+        with archive.read(0, HEADER_HASH_SIZE) as header:
+            header_hash = hashlib.sha256(header).digest()
+        return (archive.size, archive.stat.st_mtime_ns, header_hash)
+
+    def __get_file(self, key: tuple) -> str:
+        """Get the cache file for an archive key.
+
+        @param {Tuple} key See signature for __get_key.
+        @return {String}
+        """
+        name = hashlib.sha256(
+            struct.pack("<QQ", key[0], key[1]) + key[2]).hexdigest()
+        return os.path.join(self.path, f"{name[:32]}.idx")
+
+    def load(self, archive):
+        """Load the cached index for an archive.
+
+        @param {JamArchive} archive The archive.
+        @return {JamIndex|NoneType} The cached index,
+                                    None if it is not cached.
+        """
+        key = self.__get_key(archive)
+        cache_file = self.__get_file(key)
+        try:
+            with open(cache_file, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        try:
+            (magic, version, size, mtime, header_hash,
+             folder_len, file_count, path_len) = CACHE_HEADER.unpack_from(data)
+
+            # The cache file is from an older rpm or a different archive
+            if ((magic, version) != (CACHE_MAGIC, CACHE_VERSION) or
+                    (size, mtime, header_hash) != key):
+                raise ValueError("cache key mismatch")
+
+            pos = CACHE_HEADER.size
+            numbers_len = file_count * 4
+            if len(data) != pos + folder_len + path_len + numbers_len * 2:
+                raise ValueError("truncated cache file")
+
+            folders = data[pos:pos + folder_len].decode("latin-1")
+            pos += folder_len
+            paths = data[pos:pos + path_len].decode("latin-1")
+            pos += path_len
+            offsets = self.__bytes_array(data[pos:pos + numbers_len])
+            pos += numbers_len
+            sizes = self.__bytes_array(data[pos:pos + numbers_len])
+
+            index = JamIndex(folders.split("\0") if folders else [],
+                             paths.split("\0") if paths else [],
+                             offsets, sizes)
+            if len(index.paths) != file_count:
+                raise ValueError("path count mismatch")
+
+        # The cache file is unusable, get rid of it
+        except (struct.error, ValueError) as e:
+            logging.warning(f"Discarding invalid index cache {cache_file}")
+            logging.debug(e)
+            self.__remove(cache_file)
+            return None
+
+        # Mark the cache file as recently used, if the cache is writable
+        try:
+            os.utime(cache_file)
+        except OSError as e:
+            logging.debug(e)
+        logging.info(f"Loaded cached index {cache_file} for {archive.path}")
+        return index
+
+    def save(self, archive, index: JamIndex) -> bool:
+        """Cache the index of an archive.
+
+        @param {JamArchive} archive The archive.
+        @param {JamIndex} index The parsed archive index.
+        @return {Boolean} True if the index was cached, False otherwise.
+        """
+        key = self.__get_key(archive)
+        cache_file = self.__get_file(key)
+        folders = "\0".join(index.folders).encode("latin-1")
+        paths = "\0".join(index.paths).encode("latin-1")
+
+        # Write to a temporary file first so a reader
+        # never sees a partially written cache file
+        temp_file = f"{cache_file}.{os.getpid()}.tmp"
+        try:
+            with open(temp_file, "wb") as f:
+                f.write(CACHE_HEADER.pack(
+                    CACHE_MAGIC, CACHE_VERSION, *key,
+                    len(folders), len(index.paths), len(paths)))
+                f.write(folders)
+                f.write(paths)
+                f.write(self.__array_bytes(index.offsets))
+                f.write(self.__array_bytes(index.sizes))
+            os.replace(temp_file, cache_file)
+
+        # Caching is only an optimization, silently fail
+        except OSError as e:
+            logging.warning(f"Index cache {cache_file} could not be written!")
+            logging.debug(e)
+            self.__remove(temp_file)
+            return False
+
+        logging.info(f"Cached index of {archive.path} to {cache_file}")
+        self.__evict()
+        return True
+
+    def __remove(self, path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def __evict(self):
+        """Delete the least recently used indexes
+        until the cache fits within its size limit.
+        """
+        cache_files = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith(".idx"):
+                stat = entry.stat()
+                cache_files.append((stat.st_mtime_ns, stat.st_size,
+                                    entry.path))
+
+        total_size = sum(size for _, size, _ in cache_files)
+        for _, size, path in sorted(cache_files):
+            if total_size <= self.max_size:
+                break
+            logging.info(f"Evicting cached index {path}")
+            self.__remove(path)
+            total_size -= size
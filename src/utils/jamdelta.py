@@ -0,0 +1,438 @@
+# -*- coding: utf-8 -*-
+"""rpm - LEGO Racers package manager.
+
+Created 2015-2018 Caleb Ely
+<https://CodeTri.net/>
+
+Licensed under The MIT License
+<http://opensource.org/licenses/MIT/>
+
+"""
+
+
+import gzip
+import zlib
+import struct
+import hashlib
+import logging
+import operator
+
+from src.utils import fileutils
+from src.utils.jamcache import HEADER_HASH_SIZE
+from src.utils.jamdiff import same_payload
+
+__all__ = ["BLOCK_SIZE", "DeltaError", "apply", "create"]
+
+
+# Bump the version whenever the patch layout changes
+DELTA_MAGIC = b"RJDL"
+DELTA_VERSION = 1
+
+# magic, version, base size, base key, target size, target hash
+DELTA_HEADER = struct.Struct("<4sIQ32sQ32s")
+
+# Copy a range of the base archive, or insert the bytes that follow
+COPY_SEGMENT = struct.Struct("<cII")
+DATA_SEGMENT = struct.Struct("<cI")
+END_SEGMENT = b"E"
+
+# The block size of rolling-hash deltas, and the smallest
+# changed payload worth searching for unchanged blocks
+BLOCK_SIZE = 4096
+BLOCK_DELTA_MIN = 16 * BLOCK_SIZE
+
+# The rolling checksum modulus
+WEAK_MODULUS = 1 << 16
+
+
+class DeltaError(ValueError):
+
+    """Raised when a patch is invalid or does not fit its base archive."""
+
+
+def __get_base_key(archive) -> bytes:
+    """Identify a base archive without reading all of it.
+
+    The leading bytes hold the whole index of all but
+    the largest archives, so any change to it shows up here.
+
+    @param {JamArchive} archive The base archive.
+    @return {Bytes}
+    """
+    with archive.read(0, HEADER_HASH_SIZE) as header:
+        return hashlib.sha256(header).digest()
+
+
+class __SegmentWriter:
+
+    """Write patch segments, merging adjacent base ranges.
+
+    * copied {Integer} The number of bytes copied from the base archive.
+    * literal {Integer} The number of bytes stored in the patch.
+    """
+
+    def __init__(self, f):
+        """Start writing segments.
+
+        @param {File} f The binary patch file to write to.
+        """
+        self.f = f
+        self.copied = 0
+        self.literal = 0
+        self.__pending = None
+
+    def copy(self, offset: int, size: int):
+        """Copy a range of the base archive.
+
+        @param {Integer} offset The offset of the range in the base archive.
+        @param {Integer} size The size of the range.
+        """
+        if size <= 0:
+            return
+        self.copied += size
+        if (self.__pending is not None and
+                self.__pending[0] + self.__pending[1] == offset):
+            self.__pending[1] += size
+        else:
+            self.flush()
+            self.__pending = [offset, size]
+
+    def data(self, view):
+        """Store bytes in the patch.
+
+        @param {Bytes-like} view The bytes to store.
+        """
+        if not len(view):
+            return
+        self.flush()
+        self.literal += len(view)
+        for start in range(0, len(view), fileutils.CHUNK_SIZE):
+            chunk = view[start:start + fileutils.CHUNK_SIZE]
+            self.f.write(DATA_SEGMENT.pack(b"D", len(chunk)))
+            self.f.write(chunk)
+
+    def flush(self):
+        """Write the pending base range, if any."""
+        if self.__pending is not None:
+            self.f.write(COPY_SEGMENT.pack(b"C", *self.__pending))
+            self.__pending = None
+
+
+def __weak_sum(window) -> tuple:
+    """Get the rolling checksum parts of a block.
+
+    @param {Bytes-like} window The block.
+    @return {Tuple.<Integer, Integer>}
+    """
+    a = sum(window) % WEAK_MODULUS
+    b = sum(map(operator.mul, range(len(window), 0, -1),
+                window)) % WEAK_MODULUS
+    return (a, b)
+
+
+def __block_delta(base_view, target_view, writer: __SegmentWriter,
+                  base_offset: int) -> bool:
+    """Encode a payload as blocks of its previous version and literals.
+
+    @param {memoryview} base_view The previous payload.
+    @param {memoryview} target_view The new payload.
+    @param {__SegmentWriter} writer The patch being written.
+    @param {Integer} base_offset The previous payload's archive offset.
+    @return {Boolean} True if the payload was written,
+                      False if no block was worth reusing.
+    """
+    block = BLOCK_SIZE
+    blocks = {}
+    for start in range(0, len(base_view) - block + 1, block):
+        a, b = __weak_sum(base_view[start:start + block])
+        blocks.setdefault(a | b << 16, []).append(start)
+
+    # Find the unchanged blocks first, so nothing is written
+    # if too little of the payload can be reused
+    ops = []
+    literal_start = 0
+    i = 0
+    size = len(target_view)
+    a, b = __weak_sum(target_view[0:block]) if size >= block else (0, 0)
+    while i + block <= size:
+        match = None
+        for start in blocks.get(a | b << 16, ()):
+            if base_view[start:start + block] == target_view[i:i + block]:
+                match = start
+                break
+
+        if match is not None:
+            ops.append((literal_start, i, match))
+            i += block
+            literal_start = i
+            if i + block <= size:
+                a, b = __weak_sum(target_view[i:i + block])
+            continue
+
+        # Roll the window one byte forward
+        if i + block < size:
+            out_byte = target_view[i]
+            a = (a - out_byte + target_view[i + block]) % WEAK_MODULUS
+            b = (b - block * out_byte + a) % WEAK_MODULUS
+        i += 1
+
+    if len(ops) * block < size // 4:
+        return False
+
+    for start, end, match in ops:
+        writer.data(target_view[start:end])
+        writer.copy(base_offset + match, block)
+    writer.data(target_view[literal_start:])
+    return True
+
+
+def __index_base(base) -> tuple:
+    """Index the payloads of a base archive.
+
+    @param {JamArchive} base The base archive.
+    @return {Tuple.<Dictionary, Dictionary>} The offset and size of the
+                                             previous version of every
+                                             path, and the offsets of every
+                                             payload by size.
+    """
+    index = base.index()
+    base_paths = {}
+    base_sizes = {}
+    for path, offset, size in zip(index.paths, index.offsets, index.sizes):
+        base_paths[path.casefold()] = (offset, size)
+        if size > 0:
+            base_sizes.setdefault(size, {})[offset] = None
+    return (base_paths, base_sizes)
+
+
+def __get_extents(target) -> list:
+    """Get every distinct payload of an archive, in archive order.
+
+    @param {JamArchive} target The archive.
+    @return {List.<Tuple.<Integer, String, Integer>>} The offset, a path
+                                                      and the size of
+                                                      every payload.
+    """
+    index = target.index()
+    extents = {}
+    for path, offset, size in zip(index.paths, index.offsets, index.sizes):
+        if size > 0 and extents.get(offset, ("", 0))[1] < size:
+            extents[offset] = (path, size)
+    return [(offset, *extents[offset]) for offset in sorted(extents)]
+
+
+def __find_moved(base, base_sizes: dict, base_hashes: dict,
+                 payload) -> int:
+    """Find a payload anywhere in the base archive by content hash.
+
+    Only base payloads of the same size can match,
+    and they are only hashed once one is needed.
+
+    @param {JamArchive} base The base archive.
+    @param {Dictionary} base_sizes The base payload offsets by size.
+    @param {Dictionary} base_hashes The base payload offsets hashed
+                                    so far, by size and hash.
+    @param {memoryview} payload The payload to find.
+    @return {Integer|None} The offset of the same payload in the base.
+    """
+    size = len(payload)
+    if size not in base_sizes:
+        return None
+    if size not in base_hashes:
+        base_hashes[size] = {}
+        for base_offset in base_sizes[size]:
+            with base.read(base_offset, size) as base_payload:
+                base_hashes[size].setdefault(
+                    hashlib.sha256(base_payload).digest(), base_offset)
+    return base_hashes[size].get(hashlib.sha256(payload).digest())
+
+
+def __write_changed(base, payload, writer: __SegmentWriter,
+                    previous: tuple, blocks: bool):
+    """Write a payload that is not anywhere in the base archive.
+
+    @param {JamArchive} base The base archive.
+    @param {memoryview} payload The payload.
+    @param {__SegmentWriter} writer The patch being written.
+    @param {Tuple.<Integer, Integer>|None} previous The offset and size
+                                                    of the previous version
+                                                    of the payload.
+    @param {Boolean} blocks Search large payloads for
+                            blocks of their previous version.
+    """
+    if (blocks and previous is not None and
+            len(payload) >= BLOCK_DELTA_MIN and previous[1] >= BLOCK_SIZE):
+        with base.read(*previous) as old_payload:
+            if __block_delta(old_payload, payload, writer, previous[0]):
+                return
+    writer.data(payload)
+
+
+def create(base, target, patch_path: str, blocks: bool=False) -> dict:
+    """Write a patch that turns one archive into another.
+
+    The patch covers the target archive byte for byte. Payloads found
+    anywhere in the base archive, under the same path or, when moved
+    or renamed, by content hash, are copied from it. Everything else
+    is stored in the patch, which is gzip compressed.
+
+    @param {JamArchive} base The archive the patch will be applied to.
+    @param {JamArchive} target The archive the patch will produce.
+    @param {String} patch_path An absolute path to the patch to write.
+    @param {Boolean} [blocks=False] Also search large changed payloads
+                                    for blocks of their previous version.
+    @return {Dictionary.<String, Integer>} The "copied" and "literal"
+                                           byte counts of the target.
+    @throws {OSError} The patch could not be written.
+    """
+    base_paths, base_sizes = __index_base(base)
+    base_hashes = {}
+
+    with gzip.open(patch_path, "wb") as f:
+        f.write(DELTA_HEADER.pack(
+            DELTA_MAGIC, DELTA_VERSION, base.size, __get_base_key(base),
+            target.size, hashlib.sha256(target.view).digest()))
+        writer = __SegmentWriter(f)
+        position = 0
+        for offset, path, size in __get_extents(target):
+            end = offset + size
+            if end <= position:
+                continue
+
+            # Overlapping payloads only happen in hand-made archives
+            if offset < position:
+                with target.read(position, end - position) as payload:
+                    writer.data(payload)
+                position = end
+                continue
+
+            # The header and any unused space between payloads
+            with target.read(position, offset - position) as gap:
+                writer.data(gap)
+            position = end
+
+            previous = base_paths.get(path.casefold())
+            if (previous is not None and previous[1] == size and
+                    same_payload(base, previous[0], target, offset, size)):
+                writer.copy(previous[0], size)
+                continue
+
+            with target.read(offset, size) as payload:
+                moved = __find_moved(base, base_sizes, base_hashes, payload)
+                if moved is not None:
+                    writer.copy(moved, size)
+                else:
+                    __write_changed(base, payload, writer, previous, blocks)
+
+        with target.read(position, target.size - position) as tail:
+            writer.data(tail)
+        writer.flush()
+        f.write(END_SEGMENT)
+
+    logging.info(f"Patch {base.path} -> {target.path}: {writer.copied} "
+                 f"bytes copied, {writer.literal} bytes stored")
+    return {"copied": writer.copied, "literal": writer.literal}
+
+
+def __read_exact(f, size: int) -> bytes:
+    try:
+        data = f.read(size)
+
+    # The gzip stream itself is damaged or cut short
+    except (EOFError, OSError, zlib.error) as e:
+        raise DeltaError(f"the patch is corrupt: {e}") from None
+    if len(data) != size:
+        raise DeltaError("the patch is truncated")
+    return data
+
+
+def __read_header(f, base) -> tuple:
+    """Read the header of a patch and check it fits the base archive.
+
+    @param {File} f The decompressed patch.
+    @param {JamArchive} base The archive the patch was made for.
+    @return {Tuple.<Integer, Bytes>} The size and hash of the result.
+    @throws {DeltaError} The patch is not a JAM patch
+                         or was made for another archive.
+    """
+    (magic, version, base_size, base_key,
+     target_size, target_hash) = DELTA_HEADER.unpack(
+        __read_exact(f, DELTA_HEADER.size))
+    if (magic, version) != (DELTA_MAGIC, DELTA_VERSION):
+        raise DeltaError("the file is not a JAM patch")
+    if base_size != base.size or base_key != __get_base_key(base):
+        raise DeltaError(f"the patch was not made for {base.path}")
+    return (target_size, target_hash)
+
+
+def __apply_copy(f, base, out, digest) -> int:
+    """Apply a segment copying a range of the base archive.
+
+    @param {File} f The decompressed patch, after the segment kind.
+    @param {JamArchive} base The archive the patch was made for.
+    @param {File} out The binary file to write the result to.
+    @param {hashlib.Hash} digest The hash of the result.
+    @return {Integer} The number of bytes written.
+    """
+    _, offset, size = COPY_SEGMENT.unpack(
+        b"C" + __read_exact(f, COPY_SEGMENT.size - 1))
+    if offset + size > base.size:
+        raise DeltaError(f"the patch reads past the end of {base.path}")
+    with base.read(offset, size) as payload:
+        digest.update(payload)
+        out.write(payload)
+    return size
+
+
+def __apply_data(f, out, digest) -> int:
+    """Apply a segment of bytes stored in the patch.
+
+    @param {File} f The decompressed patch, after the segment kind.
+    @param {File} out The binary file to write the result to.
+    @param {hashlib.Hash} digest The hash of the result.
+    @return {Integer} The number of bytes written.
+    """
+    _, size = DATA_SEGMENT.unpack(
+        b"D" + __read_exact(f, DATA_SEGMENT.size - 1))
+    written = 0
+    while written < size:
+        data = __read_exact(f, min(fileutils.CHUNK_SIZE, size - written))
+        digest.update(data)
+        out.write(data)
+        written += len(data)
+    return written
+
+
+def apply(base, patch_path: str, out) -> int:
+    """Apply a patch, streaming the result into a file.
+
+    Neither the patch nor the result is ever held in memory whole.
+    The result is hashed as it is written and checked at the end.
+
+    @param {JamArchive} base The archive the patch was made for.
+    @param {String} patch_path An absolute path to the patch.
+    @param {File} out The binary file to write the result to.
+    @return {Integer} The size of the result.
+    @throws {DeltaError} The patch is invalid, was made for another
+                         archive or did not produce the expected result.
+    @throws {OSError} The patch could not be opened or the result written.
+    """
+    digest = hashlib.sha256()
+    written = 0
+    with gzip.open(patch_path, "rb") as f:
+        target_size, target_hash = __read_header(f, base)
+        while True:
+            kind = __read_exact(f, 1)
+            if kind == END_SEGMENT:
+                break
+            elif kind == b"C":
+                written += __apply_copy(f, base, out, digest)
+            elif kind == b"D":
+                written += __apply_data(f, out, digest)
+            else:
+                raise DeltaError("the patch is corrupt")
+
+    if written != target_size or digest.digest() != target_hash:
+        raise DeltaError("the patched archive does not match the one "
+                         "the patch was made from")
+    return written
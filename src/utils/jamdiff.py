@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""rpm - LEGO Racers package manager.
+
+Created 2015-2018 Caleb Ely
+<https://CodeTri.net/>
+
+Licensed under The MIT License
+<http://opensource.org/licenses/MIT/>
+
+"""
+
+
+import os
+import logging
+
+from src.utils import fileutils
+
+__all__ = ["diff", "same_payload"]
+
+
+def same_payload(old, old_offset: int, new, new_offset: int,
+                 size: int) -> bool:
+    """Compare two payloads of the same size.
+
+    The payloads are compared a chunk at a time, so only the bytes
+    up to the first difference are ever read.
+
+    @param {JamArchive} old The first archive.
+    @param {Integer} old_offset The payload offset in the first archive.
+    @param {JamArchive} new The second archive.
+    @param {Integer} new_offset The payload offset in the second archive.
+    @param {Integer} size The payload size.
+    @return {Boolean}
+    """
+    for start in range(0, size, fileutils.CHUNK_SIZE):
+        length = min(fileutils.CHUNK_SIZE, size - start)
+        with old.read(old_offset + start, length) as a, \
+                new.read(new_offset + start, length) as b:
+            if a != b:
+                return False
+    return True
+
+
+def diff(old, new) -> dict:
+    """Compare the entries of two archives.
+
+    Paths are matched case-insensitively, as the game does. Entries of
+    different sizes are changed without reading them, and a payload
+    shared by several entries is only compared once.
+
+    @param {JamArchive} old The original archive.
+    @param {JamArchive} new The archive to compare it with.
+    @return {Dictionary} The "added" and "removed" paths, and the
+        "changed" entries as [path, old size, new size] lists,
+        all sorted by path.
+    """
+    old_index = old.index()
+    new_index = new.index()
+    new_entries = {
+        path.casefold(): (path, offset, size) for path, offset, size in
+        zip(new_index.paths, new_index.offsets, new_index.sizes)
+    }
+
+    # The same file on both sides cannot differ
+    same_file = os.path.samestat(old.stat, new.stat)
+
+    removed = []
+    changed = []
+    compared = {}
+    for path, offset, size in zip(old_index.paths, old_index.offsets,
+                                  old_index.sizes):
+        new_entry = new_entries.pop(path.casefold(), None)
+        if new_entry is None:
+            removed.append(path)
+            continue
+
+        if new_entry[2] != size:
+            changed.append([path, size, new_entry[2]])
+            continue
+
+        key = (offset, new_entry[1], size)
+        if key not in compared:
+            compared[key] = ((same_file and offset == new_entry[1]) or
+                             same_payload(old, offset, new, new_entry[1],
+                                          size))
+        if not compared[key]:
+            changed.append([path, size, size])
+
+    added = [a[0] for a in new_entries.values()]
+    logging.info(f"{old.path} -> {new.path}: {len(added)} added, "
+                 f"{len(removed)} removed, {len(changed)} changed")
+    return {
+        "added": sorted(added),
+        "removed": sorted(removed),
+        "changed": sorted(changed)
+    }
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""rpm - LEGO Racers package manager.
+
+Created 2015-2018 Caleb Ely
+<https://CodeTri.net/>
+
+Licensed under The MIT License
+<http://opensource.org/licenses/MIT/>
+
+"""
+
+
+import io
+import os
+import glob
+import stat
+import weakref
+
+from src.utils.jamarchive import JamEntryFile, split_path
+from src.utils.jamtrie import JamTrie
+
+__all__ = ["JamPath"]
+
+
+class JamPath:
+
+    """Read-only, pathlib-like path to a folder or file in a JAM archive.
+
+    Paths are matched case-insensitively, as the game does, and every
+    lookup only costs one step per path name. Files are read straight
+    from the archive mapping, so nothing is ever extracted. The archive
+    must stay open while its paths are used.
+
+    Exposes the following public properties and methods:
+    * archive {JamArchive} The archive the path is in.
+    * parts {Tuple.<String>} The path names.
+    * name {String} The final path name.
+    * stem {String} The final path name without its suffix.
+    * suffix {String} The file extension of the final path name.
+    * parent {JamPath} The folder holding the path.
+    * joinpath(*names) {JamPath} Combine the path with more names.
+    * exists() {Boolean} Check if the path exists.
+    * is_dir() {Boolean} Check if the path is a folder.
+    * is_file() {Boolean} Check if the path is a file.
+    * resolve() {JamPath} The path with the names stored in the archive.
+    * stat() {os.stat_result} The path status.
+    * iterdir() {Generator.<JamPath>} The folder contents.
+    * glob(pattern) {Generator.<JamPath>} The files below matching a pattern.
+    * rglob(pattern) {Generator.<JamPath>} glob at any depth.
+    * open(mode, encoding, errors, newline) {File} Open the file.
+    * read_bytes() {Bytes} The file contents.
+    * read_text(encoding, errors) {String} The decoded file contents.
+    """
+
+    # Every path of an archive shares a single trie
+    __tries = weakref.WeakKeyDictionary()
+
+    def __init__(self, archive, *names: str):
+        """Initialize class properties.
+
+        @param {JamArchive} archive The open archive.
+        @param {String} names Path names, or paths such as GAMEDATA/FOO.
+                              With none, the path is the archive root.
+        """
+        self.archive = archive
+        self.parts = tuple(part for name in names
+                           for part in split_path(name))
+
+    def __get_trie(self) -> JamTrie:
+        trie = self.__tries.get(self.archive)
+        if trie is None:
+            trie = JamTrie(self.archive.index())
+            self.__tries[self.archive] = trie
+        return trie
+
+    def __get_node(self):
+        return self.__get_trie().get(str(self))
+
+    def __require_node(self):
+        node = self.__get_node()
+        if node is None:
+            raise FileNotFoundError(f"{self} does not exist in "
+                                    f"{self.archive.path}")
+        return node
+
+    def __str__(self) -> str:
+        return "/".join(self.parts)
+
+    def __repr__(self) -> str:
+        return f"JamPath({self.archive.path!r}, {str(self)!r})"
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, JamPath):
+            return NotImplemented
+        return (self.archive is other.archive and
+                str(self).casefold() == str(other).casefold())
+
+    def __hash__(self) -> int:
+        return hash((id(self.archive), str(self).casefold()))
+
+    def __truediv__(self, name: str):
+        return self.joinpath(name)
+
+    def joinpath(self, *names: str):
+        return JamPath(self.archive, *self.parts, *names)
+
+    @property
+    def name(self) -> str:
+        return self.parts[-1] if self.parts else ""
+
+    @property
+    def suffix(self) -> str:
+        stem, dot, suffix = self.name.rpartition(".")
+        return f".{suffix}" if dot and stem else ""
+
+    @property
+    def stem(self) -> str:
+        suffix = self.suffix
+        return self.name[:-len(suffix)] if suffix else self.name
+
+    @property
+    def parent(self):
+        return JamPath(self.archive, *self.parts[:-1])
+
+    def exists(self) -> bool:
+        return self.__get_node() is not None
+
+    def is_dir(self) -> bool:
+        node = self.__get_node()
+        return node is not None and node.is_folder()
+
+    def is_file(self) -> bool:
+        node = self.__get_node()
+        return node is not None and not node.is_folder()
+
+    def resolve(self):
+        """Get the path with the names as they are stored in the archive.
+
+        @return {JamPath}
+        @throws {FileNotFoundError} The path does not exist.
+        """
+        node = self.__get_trie().root
+        names = []
+        for part in self.parts:
+            if node.children is None:
+                raise FileNotFoundError(f"{self} does not exist in "
+                                        f"{self.archive.path}")
+            node = node.children.get(part.casefold())
+            if node is None:
+                raise FileNotFoundError(f"{self} does not exist in "
+                                        f"{self.archive.path}")
+            names.append(node.name)
+        return JamPath(self.archive, *names)
+
+    def stat(self) -> os.stat_result:
+        """Get the path status.
+
+        Files are read-only regular files of their payload size,
+        folders are read-only directories of the total size below them.
+        Both carry the archive modification time.
+
+        @return {os.stat_result}
+        @throws {FileNotFoundError} The path does not exist.
+        """
+        node = self.__require_node()
+        mode = (stat.S_IFDIR | 0o555 if node.is_folder()
+                else stat.S_IFREG | 0o444)
+        archive_stat = self.archive.stat
+        return os.stat_result((
+            mode, 0, archive_stat.st_dev, 1, archive_stat.st_uid,
+            archive_stat.st_gid, node.size, archive_stat.st_atime,
+            archive_stat.st_mtime, archive_stat.st_ctime))
+
+    def iterdir(self):
+        """Get the folders and then the files in a folder.
+
+        Both the folders and the files are in archive order.
+
+        @return {Generator.<JamPath>}
+        @throws {FileNotFoundError} The path does not exist.
+        @throws {NotADirectoryError} The path is a file.
+        """
+        node = self.__require_node()
+        if not node.is_folder():
+            raise NotADirectoryError(f"{self} is not a folder")
+        for child in tuple(node.children.values()):
+            yield JamPath(self.archive, *self.parts, child.name)
+
+    def glob(self, pattern: str):
+        """Find every file below this folder matching a pattern.
+
+        See signature for JamTrie::glob. Unlike pathlib,
+        only files are matched, never folders.
+
+        @param {String} pattern A path pattern relative to this folder,
+                                such as */TEXTURES/*.BMP.
+        @return {Generator.<JamPath>}
+        """
+        # The names of this path are never wildcards
+        joined = "/".join([glob.escape(part) for part in self.parts] +
+                          split_path(pattern))
+        for entry in self.__get_trie().glob(joined):
+            yield JamPath(self.archive, entry.path)
+
+    def rglob(self, pattern: str):
+        return self.glob(f"**/{pattern}")
+
+    def open(self, mode: str="r", encoding: str=None,
+             errors: str=None, newline: str=None):
+        """Open the file for reading.
+
+        The file object reads straight from the archive mapping,
+        and must be closed before the archive is.
+
+        @param {String} [mode="r"] "r" or "rb", as the archive is read-only.
+        @param {String} [encoding=None] The text encoding, for mode "r".
+        @param {String} [errors=None] See signature for io.TextIOWrapper.
+        @param {String} [newline=None] See signature for io.TextIOWrapper.
+        @return {JamEntryFile|io.TextIOWrapper}
+        @throws {FileNotFoundError} The path does not exist.
+        @throws {IsADirectoryError} The path is a folder.
+        @throws {ValueError} The mode is not a read mode.
+        """
+        if mode not in ("r", "rt", "rb"):
+            raise ValueError(f"a JAM archive cannot be opened in mode {mode}")
+
+        node = self.__require_node()
+        if node.is_folder():
+            raise IsADirectoryError(f"{self} is a folder")
+
+        entry = self.__get_trie().entry(node)
+        raw = JamEntryFile(self.archive.read(entry.offset, entry.size))
+        if mode == "rb":
+            return raw
+
+        # Do not keep the entry view alive if the text cannot be decoded
+        try:
+            return io.TextIOWrapper(io.BufferedReader(raw),
+                                    encoding=encoding, errors=errors,
+                                    newline=newline)
+        except Exception:
+            raw.close()
+            raise
+
+    def read_bytes(self) -> bytes:
+        with self.open("rb") as f:
+            return f.read()
+
+    def read_text(self, encoding: str=None, errors: str=None) -> str:
+        with self.open("r", encoding, errors) as f:
+            return f.read()
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""rpm - LEGO Racers package manager.
+
+Created 2015-2018 Caleb Ely
+<https://CodeTri.net/>
+
+Licensed under The MIT License
+<http://opensource.org/licenses/MIT/>
+
+"""
+
+
+import re
+import sys
+import fnmatch
+
+from src.utils.jamarchive import JamEntry, JamIndex, split_path
+
+__all__ = ["JamTrie", "JamTrieNode", "is_pattern"]
+
+
+# Pattern characters that need a full match rather than a lookup
+GLOB_CHARS = re.compile(r"[*?[]")
+
+
+def is_pattern(path: str) -> bool:
+    """Check if a path is a pattern for JamTrie::glob.
+
+    @param {String} path An in-archive path or pattern.
+    @return {Boolean}
+    """
+    return GLOB_CHARS.search(path) is not None
+
+
+class JamTrieNode:
+
+    """A single folder or file of a JamTrie.
+
+    Exposes the following public properties:
+    * name {String} The name as stored in the archive.
+    * children {Dictionary.<String, JamTrieNode>|NoneType} The folder
+        contents by case-folded name, None for files.
+    * index {Integer} The position of a file in the JamIndex,
+        -1 for folders.
+    * size {Integer} The payload size of a file,
+        the total payload size of everything below a folder.
+    * count {Integer} 1 for a file, the number of files below a folder.
+    """
+
+    __slots__ = ("name", "children", "index", "size", "count")
+
+    def __init__(self, name: str, index: int=-1):
+        """Initialize class properties.
+
+        @param {String} name The name as stored in the archive.
+        @param {Integer} [index=-1] The position of a file in the JamIndex.
+                                    Folders do not have one.
+        """
+        self.name = name
+        self.children = {} if index < 0 else None
+        self.index = index
+        self.size = 0
+        self.count = 0
+
+    def is_folder(self) -> bool:
+        return self.children is not None
+
+
+class JamTrie:
+
+    """In-memory path trie of a JAM archive index.
+
+    Each path name is stored once per folder and looked up by its
+    case-folded form, so finding an entry only costs one dictionary
+    lookup per path name, whatever the size of the archive.
+
+    Exposes the following public properties and methods:
+    * root {JamTrieNode} The archive root folder.
+    * get(path) {JamTrieNode|NoneType} Look up a folder or file node.
+    * find(path) {JamEntry|NoneType} Look up a single file entry.
+    * entry(node) {JamEntry} The entry of a file node.
+    * size(path) {Integer} The total payload size below a path.
+    * glob(pattern) {Generator.<JamEntry>} Every file matching a pattern.
+    """
+
+    def __init__(self, index: JamIndex):
+        """Build the trie.
+
+        @param {JamIndex} index The parsed archive index.
+        """
+        self.__index = index
+        self.root = JamTrieNode("")
+        for path in index.folders:
+            self.__add(split_path(path))
+        for i, path in enumerate(index.paths):
+            self.__add(split_path(path), i, index.sizes[i])
+
+    def __add(self, parts: list, index: int=-1, size: int=0):
+        """Add a folder, or a file and its size, and any missing parents.
+
+        @param {List.<String>} parts The path names.
+        @param {Integer} [index=-1] The position of a file in the index.
+        @param {Integer} [size=0] The payload size of a file.
+        """
+        node = self.root
+        parents = []
+        for i, part in enumerate(parts):
+            # A file and folder of the same name can only both be stored
+            # by a hand-made archive. The first one added wins
+            if node.children is None:
+                return
+            parents.append(node)
+            key = sys.intern(part.casefold())
+            child = node.children.get(key)
+            if child is None:
+                child = JamTrieNode(sys.intern(part),
+                                    index if i == len(parts) - 1 else -1)
+                node.children[key] = child
+            elif i == len(parts) - 1:
+                return
+            node = child
+
+        if index >= 0 and node.index == index:
+            node.size = size
+            node.count = 1
+            for parent in parents:
+                parent.size += size
+                parent.count += 1
+
+    def get(self, path: str):
+        """Look up a folder or file node.
+
+        Names are matched case-insensitively, as the game does.
+
+        @param {String} path An in-archive path. The root is "".
+        @return {JamTrieNode|NoneType} The node, None if it does not exist.
+        """
+        node = self.root
+        for part in split_path(path):
+            if node.children is None:
+                return None
+            node = node.children.get(part.casefold())
+            if node is None:
+                return None
+        return node
+
+    def entry(self, node: JamTrieNode) -> JamEntry:
+        """Get the entry of a file node.
+
+        @param {JamTrieNode} node The file node.
+        @return {JamEntry}
+        """
+        return JamEntry(self.__index.paths[node.index],
+                        self.__index.offsets[node.index],
+                        self.__index.sizes[node.index])
+
+    def find(self, path: str):
+        """Look up a single file entry.
+
+        @param {String} path An in-archive path, such as GAMEDATA/FOO.BMP.
+        @return {JamEntry|NoneType} The entry, None if there is no such file.
+        """
+        node = self.get(path)
+        if node is None or node.is_folder():
+            return None
+        return self.entry(node)
+
+    def size(self, path: str="") -> int:
+        """Get the total payload size of a file or folder.
+
+        @param {String} [path=""] An in-archive path. Defaults to the root.
+        @return {Integer} The size, 0 if the path does not exist.
+        """
+        node = self.get(path)
+        return node.size if node is not None else 0
+
+    def glob(self, pattern: str):
+        """Find every file matching a pattern, in trie order.
+
+        Each path name of the pattern may use the fnmatch wildcards
+        *, ? and [...], matched case-insensitively against a single
+        name. A name of ** matches any number of folders, so
+        GAMEDATA/**/*.BMP finds every bitmap below GAMEDATA.
+
+        @param {String} pattern An in-archive path pattern,
+                                such as GAMEDATA/*/TEXTURES/*.
+        @return {Generator.<JamEntry>}
+        """
+        parts = [part.casefold() for part in split_path(pattern)]
+        matchers = [None if part == "**" or not is_pattern(part)
+                    else re.compile(fnmatch.translate(part)).match
+                    for part in parts]
+
+        # Walk the trie with an explicit stack of (node, pattern position)
+        # pairs. Seen pairs are skipped, as ** can reach a node twice
+        pending = [(self.root, 0)]
+        seen = set()
+        while pending:
+            node, pos = pending.pop()
+            if (id(node), pos) in seen:
+                continue
+            seen.add((id(node), pos))
+
+            if pos == len(parts):
+                if not node.is_folder():
+                    yield self.entry(node)
+                continue
+            if not node.is_folder():
+                continue
+
+            part = parts[pos]
+            if part == "**":
+                # Either match no folder at all or one more folder.
+                # A trailing ** matches every file below
+                last = pos + 1 == len(parts)
+                pending.extend(
+                    (child, pos if child.is_folder() else pos + 1)
+                    for child in reversed(tuple(node.children.values()))
+                    if last or child.is_folder())
+                pending.append((node, pos + 1))
+            elif matchers[pos] is None:
+                child = node.children.get(part)
+                if child is not None:
+                    pending.append((child, pos + 1))
+            else:
+                match = matchers[pos]
+                pending.extend((child, pos + 1) for key, child in reversed(
+                    tuple(node.children.items())) if match(key))
@@ -0,0 +1,548 @@
+# -*- coding: utf-8 -*-
+"""rpm - LEGO Racers package manager.
+
+Created 2015-2018 Caleb Ely
+<https://CodeTri.net/>
+
+Licensed under The MIT License
+<http://opensource.org/licenses/MIT/>
+
+"""
+
+
+import os
+import struct
+import hashlib
+import logging
+from collections import Counter
+
+from src.utils import fileutils, jsonutils, utils
+from src.utils.jamarchive import ROOT_OFFSET, JamArchive, JamFormatError
+from src.utils.jambuilder import (MAX_OFFSET, JamFolder,
+                                  folder_record_size, pack_folder)
+
+__all__ = ["FRAGMENTATION_LIMIT", "record_build", "record_extraction",
+           "recover", "update"]
+
+
+# Bump the version whenever the manifest layout changes
+MANIFEST_VERSION = 1
+
+# The share of an archive that may be unused space before
+# an incremental update gives way to a full rebuild
+FRAGMENTATION_LIMIT = 0.25
+
+# An update journal holds the archive size before the update, then the
+# offset, length and original bytes of every range the update overwrites,
+# and ends with the magic again once it is complete
+JOURNAL_MAGIC = b"RJNL"
+JOURNAL_HEADER = struct.Struct("<4sQI")
+JOURNAL_RANGE = struct.Struct("<QI")
+
+
+def __get_manifest_path(archive_path: str, manifests: str=None) -> str:
+    """Get the build manifest location for an archive.
+
+    @param {String} archive_path An absolute path to the archive.
+    @param {String} [manifests=None] An absolute path to the manifest
+                                     folder. Defaults to a folder in the
+                                     app's configuration folder.
+    @return {String}
+    """
+    folder = manifests
+    if folder is None:
+        folder = os.path.join(utils.AppUtils().config_path, "manifests")
+    os.makedirs(folder, exist_ok=True)
+    name = hashlib.sha1(
+        os.path.normcase(archive_path).encode("utf-8")).hexdigest()
+    return os.path.join(folder, f"{name}.json")
+
+
+def __to_path(tree_path: str, path: str) -> str:
+    return os.path.join(tree_path, *path.split("/"))
+
+
+def __get_journal_path(archive_path: str) -> str:
+    return f"{archive_path}.journal"
+
+
+def __save(archive_path: str, tree_path: str, folders: dict, files: dict,
+           manifests: str=None) -> bool:
+    """Write the build manifest of an archive.
+
+    @param {String} archive_path An absolute path to the archive.
+    @param {String} tree_path An absolute path to the source tree.
+    @param {Dictionary} folders [offset, capacity] of every folder record.
+    @param {Dictionary} files [offset, size, capacity, mtime] of every file.
+    @param {String} [manifests=None] See signature for __get_manifest_path.
+    @return {Boolean} See signature for jsonutils::write.
+    """
+    stat = os.stat(archive_path)
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "tree": os.path.normcase(tree_path),
+        "archiveSize": stat.st_size,
+        "archiveMtime": stat.st_mtime_ns,
+        "folders": folders,
+        "files": files
+    }
+    return jsonutils.write(__get_manifest_path(archive_path, manifests),
+                           manifest, None)
+
+
+def __discard(archive_path: str, manifests: str=None):
+    """Delete the build manifest of an archive, if there is one.
+
+    @param {String} archive_path An absolute path to the archive.
+    @param {String} [manifests=None] See signature for __get_manifest_path.
+    """
+    manifest_path = __get_manifest_path(archive_path, manifests)
+    if os.path.isfile(manifest_path):
+        os.remove(manifest_path)
+
+
+def __load(archive_path: str, tree_path: str, manifests: str=None):
+    """Load the build manifest of an archive.
+
+    @param {String} archive_path An absolute path to the archive.
+    @param {String} tree_path An absolute path to the source tree.
+    @param {String} [manifests=None] See signature for __get_manifest_path.
+    @return {Dictionary|NoneType} The manifest, None if there is none
+                                  or the archive changed since it was made.
+    """
+    manifest = jsonutils.read(__get_manifest_path(archive_path, manifests))
+    if not manifest or manifest.get("version") != MANIFEST_VERSION:
+        return None
+
+    try:
+        stat = os.stat(archive_path)
+    except FileNotFoundError:
+        return None
+
+    # The archive was changed by something other than rpm
+    if (manifest["tree"] != os.path.normcase(tree_path) or
+            manifest["archiveSize"] != stat.st_size or
+            manifest["archiveMtime"] != stat.st_mtime_ns):
+        logging.info(f"Build manifest of {archive_path} is out of date")
+        return None
+    return manifest
+
+
+def record_build(archive_path: str, tree_path: str, folders: list,
+                 layout, stats: dict, manifests: str=None) -> bool:
+    """Record the manifest of a freshly built archive.
+
+    @param {String} archive_path An absolute path to the archive.
+    @param {String} tree_path An absolute path to the source tree.
+    @param {List.<JamFolder>} folders The folder table of the tree.
+    @param {JamLayout} layout The layout the archive was built with.
+    @param {Dictionary.<String, os.stat_result>} stats The file status
+        of every source file, by in-archive path.
+    @param {String} [manifests=None] See signature for __get_manifest_path.
+    @return {Boolean} True if the manifest was written, False otherwise.
+    """
+    records = {
+        folder.path: [layout.folders[folder.path], folder_record_size(folder)]
+        for folder in folders
+    }
+    files = {
+        entry.path: [entry.offset, entry.size, entry.size,
+                     stats[entry.path].st_mtime_ns]
+        for entry in layout.entries
+    }
+    return __save(archive_path, tree_path, records, files, manifests)
+
+
+def record_extraction(archive_path: str, tree_path: str,
+                      manifests: str=None) -> bool:
+    """Record the manifest of an archive that was just extracted.
+
+    The extracted files are the source tree of the next build,
+    so only the files changed after this point need to be rewritten.
+
+    @param {String} archive_path An absolute path to the archive.
+    @param {String} tree_path An absolute path to the extracted files.
+    @param {String} [manifests=None] See signature for __get_manifest_path.
+    @return {Boolean} True if the manifest was written, False otherwise.
+    """
+    folders = {}
+    files = {}
+    try:
+        with JamArchive(archive_path) as archive:
+            pending = [("", ROOT_OFFSET)]
+            visited = {ROOT_OFFSET}
+            while pending:
+                folder, offset = pending.pop()
+                (names, offsets, sizes), (fol_names, fol_offsets) = (
+                    archive.read_folder(offset))
+                prefix = f"{folder}/" if folder else ""
+                folders[folder] = [offset, folder_record_size(
+                    JamFolder(folder, names, fol_names))]
+                for name, file_offset, size in zip(names, offsets, sizes):
+                    path = prefix + name
+                    mtime = os.stat(__to_path(tree_path, path)).st_mtime_ns
+                    files[path] = [file_offset, size, size, mtime]
+                for name, fol_offset in zip(fol_names, fol_offsets):
+                    if fol_offset in visited:
+                        raise JamFormatError(f"folder {prefix + name} points "
+                                             "back at an earlier folder")
+                    visited.add(fol_offset)
+                    pending.append((prefix + name, fol_offset))
+
+    # Without a manifest, the next build is simply a full one
+    except (OSError, JamFormatError) as e:
+        logging.warning(f"Could not record extraction of {archive_path}")
+        logging.debug(e)
+        return False
+    return __save(archive_path, tree_path, folders, files, manifests)
+
+
+def __same_content(path: str, archive: JamArchive,
+                   offset: int, size: int) -> bool:
+    """Compare a file with an archive payload.
+
+    @param {String} path An absolute path to the file.
+    @param {JamArchive} archive The archive.
+    @param {Integer} offset The payload offset.
+    @param {Integer} size The payload size.
+    @return {Boolean}
+    """
+    position = 0
+    with open(path, "rb") as f:
+        while position < size:
+            chunk = f.read(min(fileutils.CHUNK_SIZE, size - position))
+            if not chunk:
+                return False
+            with archive.read(offset + position, len(chunk)) as payload:
+                if payload != chunk:
+                    return False
+            position += len(chunk)
+    return True
+
+
+def __place_payloads(archive: JamArchive, old_files: dict, tree_path: str,
+                     folders: list, stats: dict) -> tuple:
+    """Decide where the payload of every file goes.
+
+    Payloads that did not change stay put. Changed ones are rewritten
+    in place when they still fit, otherwise they move to the end.
+
+    @param {JamArchive} archive The archive being updated.
+    @param {Dictionary} old_files The files of the archive's manifest.
+    @param {String} tree_path An absolute path to the source tree.
+    @param {List.<JamFolder>} folders The folders of the source tree.
+    @param {Dictionary.<String, os.stat_result>} stats The status
+                                                       of every file.
+    @return {Tuple.<List, Dictionary, Integer>} The payload writes,
+        the new manifest files and the new end of the archive.
+    """
+    end = archive.size
+    payload_writes = []
+    new_files = {}
+
+    # A deduplicated payload is shared by several entries,
+    # so rewriting it for one of them would change the others
+    shared = Counter(a[0] for a in old_files.values() if a[1])
+
+    for folder in folders:
+        prefix = f"{folder.path}/" if folder.path else ""
+        for name, size in folder.files:
+            path = prefix + name
+            mtime = stats[path].st_mtime_ns
+            old = old_files.get(path)
+
+            if old is not None and old[1] == size and (
+                    old[3] == mtime or __same_content(
+                        __to_path(tree_path, path), archive, old[0], size)):
+                new_files[path] = [old[0], size, old[2], mtime]
+            elif (old is not None and size <= old[2] and
+                    shared[old[0]] < 2):
+                payload_writes.append((path, old[0], size))
+                new_files[path] = [old[0], size, old[2], mtime]
+            else:
+                payload_writes.append((path, end, size))
+                new_files[path] = [end, size, size, mtime]
+                end += size
+    return (payload_writes, new_files, end)
+
+
+def __place_folders(old_folders: dict, folders: list, end: int):
+    """Decide where the record of every folder goes.
+
+    Folder records follow the same rule as payloads, except the root
+    folder record must always stay directly after the magic.
+
+    @param {Dictionary} old_folders The folders of the archive's manifest.
+    @param {List.<JamFolder>} folders The folders of the source tree.
+    @param {Integer} end The end of the archive after the payloads.
+    @return {Tuple.<Dictionary, Integer, Integer>|NoneType} The new
+        manifest folders, the new end of the archive and the total size
+        of the folder records. None if the root folder record moves.
+    """
+    new_folders = {}
+    records_size = 0
+    for folder in folders:
+        size = folder_record_size(folder)
+        old = old_folders.get(folder.path)
+        records_size += size
+        if old is not None and size <= old[1]:
+            new_folders[folder.path] = [old[0], old[1]]
+        elif folder.path == "":
+            logging.info("The root folder record has outgrown its space")
+            return None
+        else:
+            new_folders[folder.path] = [end, size]
+            end += size
+    return (new_folders, end, records_size)
+
+
+def __find_record_writes(archive: JamArchive, folders: list,
+                         new_files: dict, new_folders: dict) -> list:
+    """Find the folder records whose contents changed.
+
+    @param {JamArchive} archive The archive being updated.
+    @param {List.<JamFolder>} folders The folders of the source tree.
+    @param {Dictionary} new_files The new manifest files.
+    @param {Dictionary} new_folders The new manifest folders.
+    @return {List.<Tuple.<Integer, Bytes>>} The offset and
+                                            bytes of every record.
+    """
+    file_offsets = {path: a[0] for path, a in new_files.items()}
+    folder_offsets = {path: a[0] for path, a in new_folders.items()}
+    record_writes = []
+    for folder in folders:
+        offset = new_folders[folder.path][0]
+        record = pack_folder(folder, file_offsets, folder_offsets)
+        if offset + len(record) <= archive.size:
+            with archive.read(offset, len(record)) as current:
+                if current == record:
+                    continue
+        record_writes.append((offset, record))
+    return record_writes
+
+
+def __plan(archive: JamArchive, manifest: dict, tree_path: str,
+           folders: list, stats: dict):
+    """Work out what an incremental update has to write.
+
+    @param {JamArchive} archive The archive being updated.
+    @param {Dictionary} manifest The archive's manifest.
+    @param {String} tree_path An absolute path to the source tree.
+    @param {List.<JamFolder>} folders The folders of the source tree.
+    @param {Dictionary.<String, os.stat_result>} stats The status
+                                                       of every file.
+    @return {Tuple|NoneType} The payload writes, folder record writes,
+                             new manifest folders and files, and the new
+                             archive size. None if a full rebuild is needed.
+    """
+    payload_writes, new_files, end = __place_payloads(
+        archive, manifest["files"], tree_path, folders, stats)
+    placed = __place_folders(manifest["folders"], folders, end)
+    if placed is None:
+        return None
+    new_folders, end, records_size = placed
+    if end > MAX_OFFSET:
+        return None
+
+    # Shared payloads only count once
+    payloads = {}
+    for offset, size, _, _ in new_files.values():
+        payloads[offset] = max(size, payloads.get(offset, 0))
+    live_size = ROOT_OFFSET + sum(payloads.values()) + records_size
+
+    # Too much of the archive would be dead space
+    fragmentation = 1 - live_size / end
+    if fragmentation > FRAGMENTATION_LIMIT:
+        logging.info(f"Archive would be {fragmentation:.0%} fragmented")
+        return None
+
+    record_writes = __find_record_writes(archive, folders, new_files,
+                                         new_folders)
+    return (payload_writes, record_writes, new_folders, new_files, end)
+
+
+def __write_journal(f, journal_path: str, writes: list):
+    """Save the archive bytes an update is about to overwrite.
+
+    Only the ranges within the current archive are saved, anything
+    past its end is undone by truncating it back to its size.
+
+    @param {File} f The archive, open for reading.
+    @param {String} journal_path An absolute path to the journal.
+    @param {List.<Tuple.<Integer, Integer>>} writes The offset and
+                                                     length of every write.
+    @throws {OSError} The journal could not be written.
+    """
+    size = f.seek(0, os.SEEK_END)
+    ranges = [(offset, min(length, size - offset))
+              for offset, length in writes if offset < size]
+    with open(journal_path, "wb") as journal:
+        journal.write(JOURNAL_HEADER.pack(JOURNAL_MAGIC, size, len(ranges)))
+        for offset, length in ranges:
+            f.seek(offset)
+            journal.write(JOURNAL_RANGE.pack(offset, length))
+            if fileutils.copy_range(f, journal, length) != length:
+                raise OSError("archive changed while journaling")
+        journal.write(JOURNAL_MAGIC)
+        journal.flush()
+        os.fsync(journal.fileno())
+
+
+def __read_journal(journal_path: str):
+    """Read an update journal.
+
+    @param {String} journal_path An absolute path to the journal.
+    @return {Tuple|NoneType} The archive size before the update and the
+                             (offset, bytes) of every overwritten range.
+                             None if the journal is incomplete.
+    @throws {OSError} The journal could not be read.
+    """
+    with open(journal_path, "rb") as f:
+        data = f.read()
+
+    try:
+        magic, size, count = JOURNAL_HEADER.unpack_from(data)
+        pos = JOURNAL_HEADER.size
+        ranges = []
+        for _ in range(count):
+            offset, length = JOURNAL_RANGE.unpack_from(data, pos)
+            pos += JOURNAL_RANGE.size
+            ranges.append((offset, data[pos:pos + length]))
+            pos += length
+    except struct.error:
+        return None
+    if magic != JOURNAL_MAGIC or data[pos:] != JOURNAL_MAGIC:
+        return None
+    return (size, ranges)
+
+
+def recover(archive_path: str, manifests: str=None) -> bool:
+    """Roll back an incremental update that was interrupted.
+
+    An update journals the bytes it overwrites before touching the
+    archive, so an archive left half updated by a crash is put back
+    exactly as it was before the update.
+
+    @param {String} archive_path An absolute path to the archive.
+    @param {String} [manifests=None] See signature for __get_manifest_path.
+    @return {Boolean} True if the archive was rolled back,
+                      False if there was nothing to roll back.
+    @throws {OSError} The archive could not be rolled back.
+    """
+    journal_path = __get_journal_path(archive_path)
+    if not os.path.isfile(journal_path):
+        return False
+
+    # The update stopped while writing the journal,
+    # before anything was written to the archive
+    journal = __read_journal(journal_path)
+    if journal is None or not os.path.isfile(archive_path):
+        os.remove(journal_path)
+        return False
+
+    logging.warning(f"Rolling back interrupted update of {archive_path}")
+    size, ranges = journal
+    __discard(archive_path, manifests)
+    with open(archive_path, "r+b") as f:
+        for offset, data in ranges:
+            f.seek(offset)
+            f.write(data)
+        f.truncate(size)
+        f.flush()
+        os.fsync(f.fileno())
+    os.remove(journal_path)
+    return True
+
+
+def __apply(archive_path: str, tree_path: str, plan: tuple):
+    """Write the planned changes to an archive.
+
+    The bytes being overwritten are journaled first, and the journal
+    is only deleted once every write has reached the disk.
+
+    @param {String} archive_path An absolute path to the archive.
+    @param {String} tree_path An absolute path to the source tree.
+    @param {Tuple} plan See signature for __plan.
+    @throws {OSError} The archive could not be updated.
+    """
+    payload_writes, record_writes, _, _, end = plan
+    journal_path = __get_journal_path(archive_path)
+
+    # The archive may be hardlinked into the build cache,
+    # which must not change
+    fileutils.unshare(archive_path)
+    with open(archive_path, "r+b") as f:
+        writes = [(offset, size) for _, offset, size in payload_writes]
+        writes.extend((offset, len(record))
+                      for offset, record in record_writes)
+        __write_journal(f, journal_path, writes)
+
+        # Write the payloads before the records pointing at them
+        for path, offset, size in payload_writes:
+            f.seek(offset)
+            with open(__to_path(tree_path, path), "rb") as src:
+                if fileutils.copy_range(src, f, size) != size:
+                    raise OSError(f"{path} changed while building")
+        for offset, record in record_writes:
+            f.seek(offset)
+            f.write(record)
+        f.truncate(end)
+        f.flush()
+        os.fsync(f.fileno())
+    os.remove(journal_path)
+
+
+def update(archive_path: str, tree_path: str, folders: list,
+           stats: dict, manifests: str=None) -> bool:
+    """Incrementally update an archive from its source tree.
+
+    Using the manifest recorded by the previous build or extraction,
+    only the payloads and folder records that changed are written.
+    Grown payloads and records are relocated to the end of the archive.
+    An interrupted update is rolled back instead of leaving a damaged
+    archive behind.
+
+    @param {String} archive_path An absolute path to the archive.
+    @param {String} tree_path An absolute path to the source tree.
+    @param {List.<JamFolder>} folders The folder table of the tree.
+    @param {Dictionary.<String, os.stat_result>} stats The file status
+        of every source file, by in-archive path.
+    @param {String} [manifests=None] See signature for __get_manifest_path.
+    @return {Boolean} True if the archive was updated,
+                      False if a full rebuild is needed.
+    """
+    manifest = __load(archive_path, tree_path, manifests)
+    if manifest is None:
+        return False
+
+    try:
+        with JamArchive(archive_path) as archive:
+            plan = __plan(archive, manifest, tree_path, folders, stats)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Could not plan an update of {archive_path}")
+        logging.debug(e)
+        return False
+
+    if plan is None:
+        return False
+    logging.info(f"Updating {len(plan[0])} payloads and "
+                 f"{len(plan[1])} folder records in {archive_path}")
+
+    # Put the archive back as it was, the next build is a full one
+    try:
+        __apply(archive_path, tree_path, plan)
+    except OSError as e:
+        logging.warning(f"Incremental update of {archive_path} failed!")
+        logging.debug(e)
+        try:
+            recover(archive_path, manifests)
+        except OSError as e:
+            logging.warning(f"Could not roll back {archive_path}!")
+            logging.debug(e)
+        return False
+
+    # Without a manifest, the next build is simply a full one
+    if not __save(archive_path, tree_path, plan[2], plan[3], manifests):
+        logging.warning("Could not save the build manifest "
+                        f"of {archive_path}")
+    return True
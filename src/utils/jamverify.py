@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""rpm - LEGO Racers package manager.
+
+Created 2015-2018 Caleb Ely
+<https://CodeTri.net/>
+
+Licensed under The MIT License
+<http://opensource.org/licenses/MIT/>
+
+"""
+
+
+import os
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from src.utils import fileutils, jsonutils
+from src.utils.jamarchive import JAM_MAGIC, JamEntry, JamFormatError
+
+__all__ = ["HASH_ALGORITHM", "check_bounds", "compare", "hash_archive",
+           "hash_tree", "read_manifest", "write_manifest"]
+
+
+# Bump the version whenever the manifest layout changes
+MANIFEST_VERSION = 1
+
+HASH_ALGORITHM = "sha256"
+
+
+def check_bounds(archive) -> list:
+    """Check that the index can be read and every entry payload
+    lies within the archive.
+
+    @param {JamArchive} archive The archive.
+    @return {List.<String>} A description of every problem found.
+    """
+    try:
+        index = archive.index()
+    except JamFormatError as e:
+        return [str(e)]
+
+    # A cached index was not checked while parsing
+    problems = []
+    for path, offset, size in zip(index.paths, index.offsets, index.sizes):
+        if offset + size > archive.size:
+            problems.append(f"{path} ends at {offset + size}, past the "
+                            f"end of the archive at {archive.size}")
+        elif size > 0 and offset < len(JAM_MAGIC):
+            problems.append(f"{path} starts at {offset}, "
+                            "inside the archive magic")
+    return problems
+
+
+def __hash_entry(archive, entry: JamEntry) -> tuple:
+    # Hashing a whole view at once releases the GIL for all of it
+    digest = hashlib.new(HASH_ALGORITHM)
+    with archive.read(entry.offset, entry.size) as payload:
+        digest.update(payload)
+    return (entry.path, [entry.size, digest.hexdigest()])
+
+
+def __hash_file(root: str, path: str) -> tuple:
+    digest = hashlib.new(HASH_ALGORITHM)
+    size = 0
+    with open(os.path.join(root, *path.split("/")), "rb") as f:
+        for chunk in iter(lambda: f.read(fileutils.CHUNK_SIZE), b""):
+            digest.update(chunk)
+            size += len(chunk)
+    return (path, [size, digest.hexdigest()])
+
+
+def hash_archive(archive, workers: int=1) -> dict:
+    """Hash every entry payload of an archive.
+
+    The archive must pass check_bounds first, as payloads reaching
+    past its end would be hashed short.
+
+    @param {JamArchive} archive The archive.
+    @param {Integer} [workers=1] The number of payloads to hash at once.
+    @return {Dictionary.<String, List>} The size and hex digest
+                                        of every entry, by path.
+    """
+    index = archive.index()
+    entries = [JamEntry(*a)
+               for a in zip(index.paths, index.offsets, index.sizes)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(executor.map(lambda a: __hash_entry(archive, a),
+                                 entries))
+
+
+def hash_tree(path: str, workers: int=1) -> dict:
+    """Hash every file of an extracted archive.
+
+    @param {String} path An absolute path to the extracted files.
+    @param {Integer} [workers=1] The number of files to hash at once.
+    @return {Dictionary.<String, List>} See signature for hash_archive.
+    @throws {OSError} A file could not be read.
+    """
+    paths = []
+    for current, dirs, files in os.walk(path):
+        folder = os.path.relpath(current, path).replace(os.sep, "/")
+        prefix = "" if folder == "." else f"{folder}/"
+        paths.extend(prefix + name for name in files)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(executor.map(lambda a: __hash_file(path, a), paths))
+
+
+def compare(expected: dict, actual: dict) -> dict:
+    """Compare two sets of hashes.
+
+    Paths are matched case-insensitively, as the game does.
+
+    @param {Dictionary} expected See signature for hash_archive.
+    @param {Dictionary} actual See signature for hash_archive.
+    @return {Dictionary.<String, List.<String>>} The "missing", "added"
+        and "changed" paths, each sorted.
+    """
+    expected = {path.casefold(): (path, a) for path, a in expected.items()}
+    actual = {path.casefold(): (path, a) for path, a in actual.items()}
+    return {
+        "missing": sorted(expected[key][0] for key in
+                          expected.keys() - actual.keys()),
+        "added": sorted(actual[key][0] for key in
+                        actual.keys() - expected.keys()),
+        "changed": sorted(expected[key][0] for key in
+                          expected.keys() & actual.keys()
+                          if expected[key][1] != actual[key][1])
+    }
+
+
+def write_manifest(path: str, hashes: dict) -> bool:
+    """Write a checksum manifest.
+
+    @param {String} path An absolute path to the manifest file.
+    @param {Dictionary} hashes See signature for hash_archive.
+    @return {Boolean} See signature for jsonutils::write.
+    """
+    return jsonutils.write(path, {
+        "version": MANIFEST_VERSION,
+        "algorithm": HASH_ALGORITHM,
+        "entries": hashes
+    })
+
+
+def read_manifest(path: str):
+    """Read a checksum manifest.
+
+    @param {String} path An absolute path to the manifest file.
+    @return {Dictionary|NoneType} See signature for hash_archive.
+                                  None if the manifest is missing,
+                                  invalid or from another version.
+    """
+    manifest = jsonutils.read(path)
+    if (not isinstance(manifest, dict) or
+            manifest.get("version") != MANIFEST_VERSION or
+            manifest.get("algorithm") != HASH_ALGORITHM or
+            not isinstance(manifest.get("entries"), dict)):
+        logging.warning(f"{path} is not a valid checksum manifest")
+        return None
+    return manifest["entries"]
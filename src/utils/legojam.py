@@ -11,6 +11,7 @@ Licensed under The MIT License
 
 
 import os
+import zlib
 import shutil
 import logging
 import distutils.dir_util
@@ -18,9 +19,35 @@ from clint.textui import colored
 
 from src.lib import JAMExtractor
 from src.settings import user as userSettings
-from src.utils import utils
+from src.utils import fileutils, jamupdate, utils
+from src.utils.jamarchive import JamArchive, JamFormatError
+from src.utils.jambuildcache import BuildCache
+from src.utils.jambuilder import JamTree, ZipSource, write_tree
+from src.utils.jamcache import IndexCache
+from src.utils.jamtrie import JamTrie
 
-__all__ = ["build", "config_2001_copy", "extract"]
+__all__ = ["DEFAULT_JAM_WORKERS", "PRISTINE_JAM", "build", "config_2001_copy",
+           "extract", "extract_members", "find_changes", "find_extracted",
+           "keep_pristine", "replace_entries", "resolve_extracted", "splice"]
+
+
+# The number of files written at once when extracting the JAM archive,
+# used unless the user settings say otherwise
+DEFAULT_JAM_WORKERS = min(8, os.cpu_count() or 1)
+
+# The game's original LEGO.JAM, kept next to it
+PRISTINE_JAM = "PRE-RPM-LEGO.JAM"
+
+
+def __get_jam_workers() -> int:
+    """Get the number of files to write at once when extracting.
+
+    @return {Integer}
+    """
+    workers = userSettings.load().get("jamWorkers")
+    if not isinstance(workers, int) or workers < 1:
+        return DEFAULT_JAM_WORKERS
+    return workers
 
 
 def __extract_jam(path: str) -> bool:
@@ -29,8 +56,10 @@ def __extract_jam(path: str) -> bool:
     @param {String} path An absolute path to game installation.
     @return {Boolean} True if extraction was successful, False otherwise.
     """
-    logging.info("Extracting LEGO.JAM")
-    return JAMExtractor.extract(os.path.join(path, "LEGO.JAM"), False)
+    workers = __get_jam_workers()
+    logging.info(f"Extracting LEGO.JAM using {workers} writers")
+    return JAMExtractor.extract(os.path.join(path, "LEGO.JAM"), False,
+                                workers, cache=IndexCache())
 
 
 def __build_jam(path: str) -> bool:
@@ -40,7 +69,8 @@ def __build_jam(path: str) -> bool:
     @return {Boolean} True if build was successful, False otherwise.
     """
     logging.info("Building LEGO.JAM")
-    return JAMExtractor.build(os.path.join(path, "LEGO"), False)
+    return JAMExtractor.build(os.path.join(path, "LEGO"), False, True, True,
+                              BuildCache())
 
 
 def __find_extracted_jam(path: str) -> dict:
@@ -103,8 +133,8 @@ def config_2001_copy(path: str) -> bool:
     # Rename the existing JAM archive and grab our dummy JAM
     # TODO Handle copying the dummy JAM better for distribution
     logging.info("Rename the existing JAM and add our dummy file in its place")
-    os.rename(os.path.join(path, "LEGO.JAM"),
-              os.path.join(path, "PRE-RPM-LEGO.JAM"))
+    os.replace(os.path.join(path, "LEGO.JAM"),
+               os.path.join(path, PRISTINE_JAM))
     shutil.copy2(os.path.join(utils.AppUtils().config_path, "LEGO.JAM"),
                  os.path.join(path, "LEGO.JAM"))
     return True
@@ -177,6 +207,268 @@ def __main(action):
             return r
 
 
+def find_extracted() -> dict:
+    """Find the extracted files of the configured game installation.
+
+    @return {Dictionary} See signature for private __find_extracted_jam.
+    """
+    return __find_extracted_jam(userSettings.load().get("gameLocation"))
+
+
+def __list_folder(folder: str, listings: dict) -> dict:
+    """List a folder by case-folded name, once.
+
+    @param {String} folder An absolute path to the folder.
+    @param {Dictionary} listings The folders listed so far.
+    @return {Dictionary.<String, String>} The name of each folder entry
+                                          by its case-folded name. Empty
+                                          if the folder does not exist.
+    """
+    if folder not in listings:
+        try:
+            listings[folder] = {name.casefold(): name
+                                for name in os.listdir(folder)}
+        except OSError:
+            listings[folder] = {}
+    return listings[folder]
+
+
+def resolve_extracted(root: str, names: list) -> dict:
+    """Find the extracted files, whatever the case of their names.
+
+    The game matches names case-insensitively, so a package can name
+    an extracted file in any case. Every folder and file that already
+    exists keeps its casing on disk, and new ones are named the way
+    the first name that needs them has them. Like zipfile, empty,
+    "." and ".." names are dropped.
+
+    @param {String} root An absolute path to the extracted files.
+    @param {List.<String>} names In-archive or zip archive member paths.
+    @return {Dictionary.<String, String>} The absolute path of each name.
+    """
+    listings = {}
+    paths = {}
+    for name in names:
+        path = root
+        for part in name.replace("\\", "/").split("/"):
+            if part not in ("", ".", ".."):
+                path = os.path.join(path, __list_folder(
+                    path, listings).setdefault(part.casefold(), part))
+        paths[name] = path
+    return paths
+
+
+def extract_members(packages: list, root: str):
+    """Write zip archive members among the extracted files.
+
+    Members replace the extracted files of the same name in any case.
+
+    @param {List.<Tuple.<ZipFile, List.<String>>>} packages Each open
+        zip archive with the names of the members to write from it.
+    @param {String} root An absolute path to the extracted files.
+    @throws {OSError} A file could not be written.
+    """
+    paths = resolve_extracted(
+        root, [name for _, members in packages for name in members])
+    for zf, members in packages:
+        for name in members:
+            if name.endswith("/"):
+                os.makedirs(paths[name], exist_ok=True)
+                continue
+            os.makedirs(os.path.dirname(paths[name]), exist_ok=True)
+            with zf.open(name) as src, open(paths[name], "wb") as dst:
+                shutil.copyfileobj(src, dst, fileutils.CHUNK_SIZE)
+
+
+def keep_pristine():
+    """Make sure a copy of the game's original LEGO.JAM is kept.
+
+    Before the first package is installed, LEGO.JAM is cloned to
+    PRISTINE_JAM, which is where config_2001_copy also keeps it.
+    Uninstalling a package restores the entries it replaced from there.
+
+    @return {String|NoneType} An absolute path to the copy,
+                              None if there is no archive to keep.
+    """
+    game_location = userSettings.load().get("gameLocation")
+    pristine_path = os.path.join(game_location, PRISTINE_JAM)
+    jam_path = os.path.join(game_location, "LEGO.JAM")
+    if os.path.isfile(pristine_path):
+        return pristine_path
+    if not os.path.isfile(jam_path):
+        return None
+
+    # Never hardlink the copy, as the game and other tools
+    # may write to LEGO.JAM in place. A reflink still costs nothing
+    try:
+        method = fileutils.clone_file(jam_path, pristine_path, False)
+    except OSError as e:
+        logging.warning(f"Could not keep the original {jam_path}!")
+        logging.debug(e)
+        return None
+    logging.info(f"Kept the original {jam_path} as {pristine_path} "
+                 f"({method})")
+    return pristine_path
+
+
+def __rewrite_jam(edit) -> bool:
+    """Rewrite LEGO.JAM with some of its entries changed.
+
+    A new archive is written holding every entry of the current one,
+    copied by offset, and only put in place once it is complete.
+
+    @param {Function} edit Called with the JamTree of the current
+                           archive to make the changes.
+    @return {Boolean} True if the archive was written, False otherwise.
+    """
+    jam_path = os.path.join(userSettings.load().get("gameLocation"),
+                            "LEGO.JAM")
+    temp_path = f"{jam_path}.{os.getpid()}.tmp"
+    try:
+        jamupdate.recover(jam_path)
+        with JamArchive(jam_path, IndexCache()) as archive:
+            tree = JamTree.from_archive(archive)
+            edit(tree)
+            write_tree(temp_path, tree, True)
+        os.replace(temp_path, jam_path)
+
+    except (OSError, ValueError, JamFormatError) as e:
+        logging.warning(f"Could not rewrite {jam_path}!")
+        logging.debug(e)
+        if os.path.isfile(temp_path):
+            os.remove(temp_path)
+        return False
+    return True
+
+
+def splice(packages: list) -> bool:
+    """Install zip archive members straight into LEGO.JAM.
+
+    The members are added or replace entries of the same name. Nothing
+    is extracted to disk, and the archive is only written once however
+    many packages are installed.
+
+    @param {List.<Tuple.<ZipFile, List.<String>>>} packages Each open
+        zip archive with the names of the members to install from it.
+        Later members replace earlier ones of the same name.
+    @return {Boolean} True if the archive was written, False otherwise.
+    """
+    def edit(tree: JamTree):
+        for zf, members in packages:
+            members = set(members)
+            for info in zf.infolist():
+                if info.filename not in members:
+                    continue
+                try:
+                    if info.is_dir():
+                        tree.add_folder(info.filename)
+                    else:
+                        tree.add(info.filename, ZipSource(zf, info))
+
+                # The game cannot load this file, so it is not installed
+                except ValueError as e:
+                    logging.warning(f"Skipping {info.filename}: {e}")
+
+    logging.info(f"Splicing {len(packages)} packages into LEGO.JAM")
+    return __rewrite_jam(edit)
+
+
+def __same_file(info, path: str) -> bool:
+    """Compare a zip archive member with a file on disk.
+
+    @param {ZipInfo} info The member.
+    @param {String} path An absolute path to the file.
+    @return {Boolean}
+    """
+    if info.is_dir():
+        return os.path.isdir(path)
+    try:
+        if os.path.getsize(path) != info.file_size:
+            return False
+        crc = 0
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(fileutils.CHUNK_SIZE), b""):
+                crc = zlib.crc32(chunk, crc)
+    except OSError:
+        return False
+    return crc == info.CRC
+
+
+def __same_entry(info, archive, trie: JamTrie) -> bool:
+    """Compare a zip archive member with an archive entry.
+
+    @param {ZipInfo} info The member.
+    @param {JamArchive} archive The archive.
+    @param {JamTrie} trie The archive's path trie.
+    @return {Boolean}
+    """
+    node = trie.get(info.filename)
+    if node is None or node.is_folder() != info.is_dir():
+        return False
+    if info.is_dir():
+        return True
+    entry = trie.entry(node)
+    if entry.size != info.file_size:
+        return False
+    return zlib.crc32(archive.read(entry.offset, entry.size)) == info.CRC
+
+
+def find_changes(packages: list) -> list:
+    """Find the zip archive members that differ from the installed files.
+
+    The size and CRC-32 of each member are already in the zip archive's
+    central directory, so only the installed files of the same size
+    are read, and nothing is decompressed.
+
+    @param {List.<Tuple.<ZipFile, List.<String>>>} packages Each open
+        zip archive with the names of the members to install from it.
+    @return {List.<List.<String>>} The members of each zip archive
+                                   that would change a file.
+    @throws {OSError|JamFormatError} LEGO.JAM could not be read.
+    """
+    # The game reads extracted files, compare with those
+    pre_extracted = find_extracted()
+    if pre_extracted["result"]:
+        paths = resolve_extracted(pre_extracted["path"], [
+            name for _, members in packages for name in members])
+        return [[name for name in members
+                 if not __same_file(zf.getinfo(name), paths[name])]
+                for zf, members in packages]
+
+    jam_path = os.path.join(userSettings.load().get("gameLocation"),
+                            "LEGO.JAM")
+    with JamArchive(jam_path, IndexCache()) as archive:
+        trie = JamTrie(archive.index())
+        return [[name for name in members if not __same_entry(
+                 zf.getinfo(name), archive, trie)]
+                for zf, members in packages]
+
+
+def replace_entries(changes: dict) -> bool:
+    """Replace and remove LEGO.JAM entries in a single pass.
+
+    Folders left empty by removing entries are removed as well.
+
+    @param {Dictionary.<String, Source|NoneType>} changes The new
+        payload source of each in-archive path, None to remove it.
+    @return {Boolean} True if the archive was written, False otherwise.
+    """
+    def edit(tree: JamTree):
+        for path, source in changes.items():
+            if source is None:
+                tree.remove(path)
+            else:
+                tree.add(path, source)
+
+        # Do not leave behind the folders only the removed files were in
+        for path, source in changes.items():
+            if source is None:
+                tree.prune(path.replace("\\", "/").rpartition("/")[0])
+
+    logging.info(f"Replacing {len(changes)} entries of LEGO.JAM")
+    return __rewrite_jam(edit)
+
+
 def build():
     return __main("build")
 
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""rpm - LEGO Racers package manager.
+
+Created 2015-2018 Caleb Ely
+<https://CodeTri.net/>
+
+Licensed under The MIT License
+<http://opensource.org/licenses/MIT/>
+
+"""
+
+
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+from collections import namedtuple
+
+from src.utils import fileutils, utils
+
+__all__ = ["InstalledFile", "InstalledPackage", "PackageDB",
+           "describe_members"]
+
+
+# Bump the version whenever the schema changes,
+# adding the statements that upgrade the previous one
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE packages (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    key TEXT NOT NULL UNIQUE,
+    version TEXT NOT NULL,
+    source TEXT,
+    installed INTEGER NOT NULL
+);
+CREATE TABLE files (
+    package INTEGER NOT NULL REFERENCES packages(id) ON DELETE CASCADE,
+    key TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    crc INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    original INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (package, key)
+) WITHOUT ROWID;
+CREATE INDEX files_by_path ON files(key);
+"""
+
+# The statements upgrading each schema version to the next
+UPGRADES = {
+    1: "ALTER TABLE files ADD COLUMN original INTEGER NOT NULL DEFAULT 0;"
+}
+
+# A file installed by a package. The crc is the zip CRC-32 and the hash
+# the SHA-256 of the file contents. original is True if the file
+# replaced an entry of the game's original LEGO.JAM
+InstalledFile = namedtuple("InstalledFile",
+                           ["path", "size", "crc", "hash", "original"])
+InstalledFile.__new__.__defaults__ = (False,)
+
+# An installed package. installed is the install time in nanoseconds
+InstalledPackage = namedtuple("InstalledPackage",
+                              ["name", "version", "source", "installed"])
+
+
+def describe_members(zf, names: list, originals=frozenset()) -> list:
+    """Describe the zip archive members a package installs.
+
+    @param {ZipFile} zf The open zip archive.
+    @param {List.<String>} names The member names. Folders are skipped.
+    @param {Set.<String>} [originals=frozenset()] The case-folded paths
+        of every entry of the game's original LEGO.JAM.
+    @return {List.<InstalledFile>}
+    """
+    files = []
+    for name in names:
+        info = zf.getinfo(name)
+        if info.is_dir():
+            continue
+        digest = hashlib.sha256()
+        with zf.open(info) as f:
+            for chunk in iter(lambda: f.read(fileutils.CHUNK_SIZE), b""):
+                digest.update(chunk)
+        files.append(InstalledFile(name, info.file_size, info.CRC,
+                                   digest.hexdigest(),
+                                   name.casefold() in originals))
+    return files
+
+
+class PackageDB:
+
+    """Persistent database of installed packages and the files they own.
+
+    Packages are looked up by name and files by game path, both
+    case-insensitively and through an index, so no query ever
+    scans the game files or every installed file.
+
+    Exposes the following public properties and methods:
+    * path {String} An absolute path to the database file.
+    * add(name, version, source, files) Record an installed package.
+    * remove(name) {Boolean} Forget an installed package.
+    * get(name) {InstalledPackage|NoneType} Look up a package.
+    * packages() {List.<InstalledPackage>} Every package, in install order.
+    * files(name) {List.<InstalledFile>} The files a package installed.
+    * file(name, path) {InstalledFile|NoneType} A file a package installed.
+    * owners(path) {List.<String>} The packages that installed a file.
+    * owner(path) {String|NoneType} The last package to install a file.
+    * path_index() {Dictionary} The owner of every installed file.
+    * close() Close the database.
+    """
+
+    def __init__(self, path: str=None):
+        """Open the database, creating it if needed.
+
+        @param {String} [path=None] An absolute path to the database file.
+                                    Defaults to a file in the app's
+                                    configuration folder.
+        @throws {sqlite3.Error} The database could not be opened.
+        """
+        if path is None:
+            path = os.path.join(utils.AppUtils().config_path, "packages.db")
+        self.path = path
+        self.__db = sqlite3.connect(self.path, timeout=30)
+        try:
+            self.__db.execute("PRAGMA foreign_keys = ON")
+            self.__create()
+        except sqlite3.Error:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __create(self):
+        version = self.__db.execute("PRAGMA user_version").fetchone()[0]
+        if version == SCHEMA_VERSION:
+            return
+        if version != 0 and version not in UPGRADES:
+            raise sqlite3.DatabaseError(
+                f"{self.path} uses unknown schema version {version}")
+
+        # Create a new database, or bring an older one up to date
+        if version == 0:
+            logging.info(f"Creating package database {self.path}")
+            script = SCHEMA
+        else:
+            logging.info(f"Upgrading package database {self.path}")
+            script = "".join(UPGRADES[a]
+                             for a in range(version, SCHEMA_VERSION))
+        self.__db.executescript(
+            f"BEGIN;{script}PRAGMA user_version = {SCHEMA_VERSION};COMMIT;")
+
+    def add(self, name: str, version: str, source: str, files: list):
+        """Record an installed package.
+
+        A package that is already installed is replaced,
+        and counts as installed last.
+
+        @param {String} name The package name.
+        @param {String} version The package version.
+        @param {String} source An absolute path to the package.
+        @param {List.<InstalledFile>} files The files the package installed.
+        """
+        with self.__db:
+            self.__db.execute("DELETE FROM packages WHERE key = ?",
+                              (name.casefold(),))
+            package_id = self.__db.execute(
+                "INSERT INTO packages (name, key, version, source, installed)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (name, name.casefold(), version, source,
+                 int(time.time() * 10**9))).lastrowid
+            self.__db.executemany(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((package_id, a.path.casefold(), a.path, a.size, a.crc,
+                  a.hash, a.original) for a in files))
+        logging.info(f"Recorded {len(files)} files of {name} {version}")
+
+    def remove(self, name: str) -> bool:
+        """Forget an installed package.
+
+        @param {String} name The package name.
+        @return {Boolean} True if the package was installed, False otherwise.
+        """
+        with self.__db:
+            cursor = self.__db.execute("DELETE FROM packages WHERE key = ?",
+                                       (name.casefold(),))
+        return cursor.rowcount > 0
+
+    def get(self, name: str):
+        """Look up an installed package.
+
+        @param {String} name The package name.
+        @return {InstalledPackage|NoneType} The package,
+                                            None if it is not installed.
+        """
+        row = self.__db.execute(
+            "SELECT name, version, source, installed FROM packages "
+            "WHERE key = ?", (name.casefold(),)).fetchone()
+        return InstalledPackage(*row) if row is not None else None
+
+    def packages(self) -> list:
+        """Get every installed package, in install order.
+
+        @return {List.<InstalledPackage>}
+        """
+        return [InstalledPackage(*row) for row in self.__db.execute(
+            "SELECT name, version, source, installed FROM packages "
+            "ORDER BY id")]
+
+    def files(self, name: str) -> list:
+        """Get the files an installed package installed.
+
+        @param {String} name The package name.
+        @return {List.<InstalledFile>} The files, sorted by path.
+        """
+        return [self.__to_file(row) for row in self.__db.execute(
+            "SELECT f.path, f.size, f.crc, f.hash, f.original FROM files AS f "
+            "JOIN packages AS p ON p.id = f.package "
+            "WHERE p.key = ? ORDER BY f.key", (name.casefold(),))]
+
+    def file(self, name: str, path: str):
+        """Look up a file an installed package installed.
+
+        @param {String} name The package name.
+        @param {String} path A game path, such as GAMEDATA/FOO.BMP.
+        @return {InstalledFile|NoneType} The file, None if
+                                         the package did not install it.
+        """
+        row = self.__db.execute(
+            "SELECT f.path, f.size, f.crc, f.hash, f.original FROM files AS f "
+            "JOIN packages AS p ON p.id = f.package "
+            "WHERE p.key = ? AND f.key = ?",
+            (name.casefold(), path.casefold())).fetchone()
+        return self.__to_file(row) if row is not None else None
+
+    @staticmethod
+    def __to_file(row: tuple) -> InstalledFile:
+        return InstalledFile(*row[:4], bool(row[4]))
+
+    def owners(self, path: str) -> list:
+        """Get the packages that installed a file.
+
+        @param {String} path A game path, such as GAMEDATA/FOO.BMP.
+        @return {List.<String>} The package names, in install order.
+        """
+        return [row[0] for row in self.__db.execute(
+            "SELECT p.name FROM files AS f "
+            "JOIN packages AS p ON p.id = f.package "
+            "WHERE f.key = ? ORDER BY p.id", (path.casefold(),))]
+
+    def owner(self, path: str):
+        """Get the package whose copy of a file is installed.
+
+        @param {String} path A game path, such as GAMEDATA/FOO.BMP.
+        @return {String|NoneType} The last package to install the file,
+                                  None if no package installed it.
+        """
+        owners = self.owners(path)
+        return owners[-1] if owners else None
+
+    def path_index(self) -> dict:
+        """Get the package whose copy of each installed file is installed.
+
+        The whole index is read in a single query, for checking
+        many paths at once.
+
+        @return {Dictionary.<String, Tuple.<String, String>>} The
+            (package name, path) pair of every case-folded game path.
+        """
+        index = {}
+        for key, path, name in self.__db.execute(
+                "SELECT f.key, f.path, p.name FROM files AS f "
+                "JOIN packages AS p ON p.id = f.package ORDER BY p.id"):
+            index[key] = (name, path)
+        return index
+
+    def close(self):
+        self.__db.close()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(".."))
+
+import testhelpers
+from src.utils import fileutils
+
+
+class TestFileUtilsMethods(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        testhelpers.setUpClass()
+        os.makedirs(testhelpers.TEST_FILES_TEMP_PATH, exist_ok=True)
+        cls.data = os.urandom(fileutils.CHUNK_SIZE * 2 + 123)
+        cls.src = os.path.join(testhelpers.TEST_FILES_TEMP_PATH, "src.bin")
+        with open(cls.src, "wb") as f:
+            f.write(cls.data)
+
+    @classmethod
+    def tearDownClass(cls):
+        testhelpers.tearDownClass()
+
+    def test_copy_range_files(self):
+        dst_path = os.path.join(testhelpers.TEST_FILES_TEMP_PATH, "dst.bin")
+        with open(self.src, "rb") as src, open(dst_path, "wb") as dst:
+            dst.write(b"head")
+            src.seek(10)
+            self.assertEqual(fileutils.copy_range(src, dst, 5000), 5000)
+            self.assertEqual(src.tell(), 5010)
+            self.assertEqual(dst.tell(), 5004)
+            dst.write(b"tail")
+        with open(dst_path, "rb") as f:
+            self.assertEqual(f.read(), b"head" + self.data[10:5010] + b"tail")
+
+    def test_copy_range_buffered_fallback(self):
+        src = io.BytesIO(self.data)
+        dst = io.BytesIO()
+        copied = fileutils.copy_range(src, dst, len(self.data))
+        self.assertEqual(copied, len(self.data))
+        self.assertEqual(dst.getvalue(), self.data)
+
+    def test_copy_range_short_source(self):
+        dst = io.BytesIO()
+        copied = fileutils.copy_range(io.BytesIO(b"abc"), dst, 10)
+        self.assertEqual(copied, 3)
+        self.assertEqual(dst.getvalue(), b"abc")
+
+    def test_clone_file(self):
+        dst_path = os.path.join(testhelpers.TEST_FILES_TEMP_PATH, "clone.bin")
+        method = fileutils.clone_file(self.src, dst_path)
+        self.assertIn(method, ("reflink", "hardlink", "copy"))
+        with open(dst_path, "rb") as f:
+            self.assertEqual(f.read(), self.data)
+        os.remove(dst_path)
+
+    def test_unshare(self):
+        path = os.path.join(testhelpers.TEST_FILES_TEMP_PATH, "shared.bin")
+        link_path = os.path.join(testhelpers.TEST_FILES_TEMP_PATH, "link.bin")
+        with open(path, "wb") as f:
+            f.write(b"shared")
+        self.assertFalse(fileutils.unshare(path))
+
+        os.link(path, link_path)
+        self.assertTrue(fileutils.unshare(path))
+        self.assertFalse(os.path.samefile(path, link_path))
+        with open(path, "r+b") as f:
+            f.write(b"change")
+        with open(link_path, "rb") as f:
+            self.assertEqual(f.read(), b"shared")
+
+    def test_prefetch_missing_file(self):
+        fileutils.prefetch(os.path.join(testhelpers.TEST_FILES_TEMP_PATH,
+                                        "missing.bin"))
+
+
+if __name__ == "__main__":
+    unittest.main()
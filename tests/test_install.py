@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import sys
+import unittest
+from zipfile import ZipFile
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.abspath(".."))
+
+import testhelpers
+from src.install import install
+from src.utils import legojam
+from src.utils.packagedb import PackageDB
+
+
+class TestInstallMethods(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        testhelpers.setUpClass()
+        os.makedirs(testhelpers.TEST_FILES_TEMP_PATH, exist_ok=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        testhelpers.tearDownClass()
+
+    def test_plan_files_later_package_wins(self):
+        planned = install.plan_files([
+            ["GAMEDATA/", "GAMEDATA/A.BMP", "GAMEDATA/B.BMP"],
+            ["gamedata/a.bmp", "MENUDATA/C.TXT"],
+            ["GAMEDATA/B.BMP"]
+        ])
+        self.assertEqual(planned, [
+            ["GAMEDATA/"],
+            ["gamedata/a.bmp", "MENUDATA/C.TXT"],
+            ["GAMEDATA/B.BMP"]
+        ])
+
+    def test_find_conflicts(self):
+        installed = {
+            "gamedata/a.bmp": ("old", "GAMEDATA/A.BMP"),
+            "gamedata/b.bmp": ("first", "GAMEDATA/B.BMP")
+        }
+        conflicts = install.find_conflicts(installed, [
+            ("first", ["GAMEDATA/", "gamedata/a.bmp", "GAMEDATA/B.BMP",
+                       "MENUDATA/C.TXT"]),
+            ("second", ["MENUDATA/C.TXT"])
+        ])
+        self.assertEqual(conflicts, [
+            install.Conflict("gamedata/a.bmp", "first",
+                             "GAMEDATA/A.BMP", "old"),
+            install.Conflict("MENUDATA/C.TXT", "second",
+                             "MENUDATA/C.TXT", "first")
+        ])
+
+    def test_find_conflicts_within_package(self):
+        conflicts = install.find_conflicts({}, [
+            ("first", ["GAMEDATA/A.BMP", "GameData/a.bmp"])
+        ])
+        self.assertEqual(conflicts, [install.Conflict(
+            "GameData/a.bmp", "first", "GAMEDATA/A.BMP", "first")])
+
+    def test_read_manifest(self):
+        path = os.path.join(testhelpers.TEST_FILES_TEMP_PATH, "modpack.txt")
+        with open(path, "wt", encoding="utf-8") as f:
+            f.write("# My modpack\nfirst.zip\n\n  mods/second.zip  \n")
+        self.assertEqual(install.read_manifest(path), [
+            os.path.join(testhelpers.TEST_FILES_TEMP_PATH, "first.zip"),
+            os.path.join(testhelpers.TEST_FILES_TEMP_PATH, "mods/second.zip")
+        ])
+
+
+class TestInstallCommand(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        testhelpers.setUpClass()
+        os.makedirs(testhelpers.TEST_FILES_TEMP_PATH, exist_ok=True)
+        cls.original = {
+            "GAMEDATA/B.BIN": b"original b",
+            "GAMEDATA/COMMON/A.TXT": b"original a"
+        }
+        cls.jam = testhelpers.create_jam("install", cls.original)
+        cls.one = testhelpers.create_package("one", "1.0.0", {
+            "GAMEDATA/": b"",
+            "GAMEDATA/B.BIN": b"one b",
+            "GAMEDATA/MODA.TXT": b"one a"
+        })
+        cls.two = testhelpers.create_package("two", "1.0.0", {
+            "gamedata/b.bin": b"two b",
+            "MENUDATA/MODB.TXT": b"two m"
+        })
+
+    @classmethod
+    def tearDownClass(cls):
+        testhelpers.tearDownClass()
+
+    def setUp(self):
+        self.game = testhelpers.use_game(self, self.jam)
+        self.game_jam = os.path.join(self.game, "LEGO.JAM")
+
+    def install(self, *args):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            result = install.main(list(args))
+        self.output = out.getvalue()
+        return result
+
+    def find_changes(self, package):
+        """Find the changes of installing package one, then package."""
+        with ZipFile(self.one) as one, ZipFile(package) as other:
+            return legojam.find_changes([
+                (zf, [a for a in zf.namelist() if a != "package.json"])
+                for zf in (one, other)])
+
+    def installed_files(self, name):
+        with PackageDB() as db:
+            return [a.path for a in db.files(name)]
+
+    def test_install_package(self):
+        self.assertTrue(self.install(self.one))
+        self.assertEqual(testhelpers.read_jam(self.game_jam), {
+            "GAMEDATA/B.BIN": b"one b",
+            "GAMEDATA/COMMON/A.TXT": b"original a",
+            "GAMEDATA/MODA.TXT": b"one a"
+        })
+        self.assertEqual(self.installed_files("one"),
+                         ["GAMEDATA/B.BIN", "GAMEDATA/MODA.TXT"])
+        self.assertTrue(os.path.isfile(os.path.join(self.game,
+                                                    "PRE-RPM-LEGO.JAM")))
+
+    def test_install_manifest_later_package_wins(self):
+        manifest = os.path.join(self.game, "modpack.txt")
+        with open(manifest, "wt", encoding="utf-8") as f:
+            f.write(f"{self.one}\n{self.two}\n")
+        self.assertTrue(self.install("-r", manifest))
+
+        files = testhelpers.read_jam(self.game_jam)
+        self.assertEqual(len(files), 4)
+        self.assertEqual(
+            {path.upper(): data for path, data in files.items()}, {
+                "GAMEDATA/B.BIN": b"two b",
+                "GAMEDATA/COMMON/A.TXT": b"original a",
+                "GAMEDATA/MODA.TXT": b"one a",
+                "MENUDATA/MODB.TXT": b"two m"
+            })
+        self.assertEqual(self.installed_files("one"), ["GAMEDATA/MODA.TXT"])
+        self.assertEqual(self.installed_files("two"),
+                         ["gamedata/b.bin", "MENUDATA/MODB.TXT"])
+
+    def test_check_only_reports_conflicts(self):
+        self.assertFalse(self.install("-c", self.one, self.two))
+        self.assertTrue(self.install("-c", self.one))
+        self.assertEqual(testhelpers.read_jam(self.game_jam), self.original)
+
+    def test_invalid_package_installs_nothing(self):
+        missing = os.path.join(self.game, "missing.zip")
+        self.assertFalse(self.install(self.one, missing))
+        self.assertEqual(testhelpers.read_jam(self.game_jam), self.original)
+        self.assertEqual(self.installed_files("one"), [])
+
+    def test_find_changes(self):
+        self.assertTrue(self.install(self.one))
+        changed = testhelpers.create_package("one", "1.0.1", {
+            "GAMEDATA/B.BIN": b"one b",
+            "GAMEDATA/MODA.TXT": b"one A",
+            "GAMEDATA/NEW/C.TXT": b"c"
+        })
+        self.assertEqual(self.find_changes(changed), [
+            [], ["GAMEDATA/MODA.TXT", "GAMEDATA/NEW/C.TXT"]])
+
+    def test_find_changes_extracted(self):
+        for path, data in (("GAMEDATA/B.BIN", b"one b"),
+                           ("GAMEDATA/MODA.TXT", b"one a!"),
+                           ("MENUDATA/MODB.TXT", b"two m")):
+            path = os.path.join(self.game, *path.split("/"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(data)
+        self.assertEqual(self.find_changes(self.two), [
+            ["GAMEDATA/MODA.TXT"], ["gamedata/b.bin"]])
+
+    def test_install_extracted_matches_case(self):
+        extracted = os.path.join(self.game, "LEGO")
+        for path, data in self.original.items():
+            path = os.path.join(extracted, *path.split("/"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(data)
+        os.makedirs(os.path.join(extracted, "MENUDATA"))
+        self.assertTrue(self.install(self.two))
+
+        # The lower case gamedata/b.bin replaces the extracted GAMEDATA/B.BIN
+        self.assertEqual(sorted(os.listdir(extracted)),
+                         ["GAMEDATA", "MENUDATA"])
+        self.assertEqual(sorted(os.listdir(os.path.join(
+            extracted, "GAMEDATA"))), ["B.BIN", "COMMON"])
+        self.assertEqual(testhelpers.read_jam(self.game_jam), {
+            "GAMEDATA/B.BIN": b"two b",
+            "GAMEDATA/COMMON/A.TXT": b"original a",
+            "MENUDATA/MODB.TXT": b"two m"
+        })
+
+        self.assertTrue(self.install(self.two))
+        self.assertIn("two 1.0.0 is already installed.", self.output)
+
+    def test_reinstall_changes_nothing(self):
+        self.assertTrue(self.install(self.one))
+        before = os.stat(self.game_jam)
+        self.assertTrue(self.install(self.one))
+        self.assertIn("one 1.0.0 is already installed.", self.output)
+        after = os.stat(self.game_jam)
+        self.assertEqual((after.st_ino, after.st_mtime_ns),
+                         (before.st_ino, before.st_mtime_ns))
+
+    def test_reinstall_records_unrecorded_package(self):
+        self.assertTrue(self.install(self.one))
+        with PackageDB() as db:
+            db.remove("one")
+        self.assertTrue(self.install(self.one))
+        self.assertIn("one 1.0.0 is already installed.", self.output)
+        self.assertEqual(self.installed_files("one"),
+                         ["GAMEDATA/B.BIN", "GAMEDATA/MODA.TXT"])
+
+
+if __name__ == "__main__":
+    unittest.main()
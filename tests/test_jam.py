@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import sys
+import csv
+import json
+import unittest
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.abspath(".."))
+
+import testhelpers
+from src.jam import jam
+from src.utils.jamarchive import JamArchive
+
+
+class TestJamLsMethods(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        testhelpers.setUpClass()
+        cls.jam = testhelpers.create_jam("ls", {
+            "GAMEDATA/COMMON/A.TXT": b"a" * 10,
+            "GAMEDATA/COMMON/B.BMP": b"b" * 20,
+            "GAMEDATA/RACE/C.BIN": b"c" * 30,
+            "MENUDATA/D.TXT": b"d" * 40
+        })
+        with JamArchive(cls.jam) as archive:
+            cls.offsets = {e.path: e.offset for e in archive.walk()}
+
+    @classmethod
+    def tearDownClass(cls):
+        testhelpers.tearDownClass()
+
+    def setUp(self):
+        testhelpers.use_config(self)
+
+    def ls(self, *args):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            self.assertTrue(jam.main(["ls", "--jam", self.jam, *args]))
+        return out.getvalue()
+
+    def test_list_entries(self):
+        self.assertCountEqual(self.ls().splitlines(), [
+            "GAMEDATA/COMMON/A.TXT", "GAMEDATA/COMMON/B.BMP",
+            "GAMEDATA/RACE/C.BIN", "MENUDATA/D.TXT"])
+
+    def test_filters(self):
+        self.assertCountEqual(self.ls("gamedata/common").splitlines(),
+                              ["GAMEDATA/COMMON/A.TXT",
+                               "GAMEDATA/COMMON/B.BMP"])
+        self.assertCountEqual(self.ls("**/*.txt").splitlines(),
+                              ["GAMEDATA/COMMON/A.TXT", "MENUDATA/D.TXT"])
+        self.assertEqual(self.ls("-e", r"\.bin$").splitlines(),
+                         ["GAMEDATA/RACE/C.BIN"])
+
+    def test_long_table(self):
+        lines = self.ls("-l", "MENUDATA").splitlines()
+        self.assertEqual(lines, [
+            f"{40:>12} {self.offsets['MENUDATA/D.TXT']:>12}  MENUDATA/D.TXT"])
+
+    def test_folder_totals(self):
+        rows = [line.split() for line in self.ls("-t").splitlines()]
+        self.assertEqual(rows, [
+            ["4", "100", "."],
+            ["3", "60", "GAMEDATA"],
+            ["2", "30", "GAMEDATA/COMMON"],
+            ["1", "30", "GAMEDATA/RACE"],
+            ["1", "40", "MENUDATA"]])
+
+    def test_csv_format(self):
+        rows = list(csv.reader(io.StringIO(self.ls("-f", "csv",
+                                                   "GAMEDATA/RACE"))))
+        self.assertEqual(rows, [
+            ["path", "offset", "size"],
+            ["GAMEDATA/RACE/C.BIN",
+             str(self.offsets["GAMEDATA/RACE/C.BIN"]), "30"]])
+
+        rows = list(csv.reader(io.StringIO(self.ls("-f", "csv", "-t",
+                                                   "MENUDATA"))))
+        self.assertEqual(rows, [["path", "count", "size"],
+                                ["", "1", "40"], ["MENUDATA", "1", "40"]])
+
+    def test_json_format(self):
+        listing = json.loads(self.ls("-f", "json", "*/*.TXT"))
+        self.assertEqual(listing["archive"], self.jam)
+        self.assertEqual(listing["entries"], [{
+            "path": "MENUDATA/D.TXT",
+            "offset": self.offsets["MENUDATA/D.TXT"],
+            "size": 40}])
+
+    def test_missing_entry(self):
+        with redirect_stdout(io.StringIO()):
+            self.assertFalse(jam.main(["ls", "--jam", self.jam, "NOPE"]))
+
+
+class TestJamCommand(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        testhelpers.setUpClass()
+        cls.jam = testhelpers.create_jam("get", {
+            "GAMEDATA/A.TXT": b"aaa",
+            "GAMEDATA/B.TXT": b"bbb"
+        })
+
+    @classmethod
+    def tearDownClass(cls):
+        testhelpers.tearDownClass()
+
+    def setUp(self):
+        testhelpers.use_config(self)
+
+    def test_get_to_file(self):
+        out = os.path.join(testhelpers.TEST_FILES_TEMP_PATH, "get.out")
+        self.assertTrue(jam.main(["get", "--jam", self.jam, "-o", out,
+                                  "gamedata/b.txt", "GAMEDATA/A.TXT"]))
+        with open(out, "rb") as f:
+            self.assertEqual(f.read(), b"bbbaaa")
+
+    def test_unknown_command(self):
+        with redirect_stdout(io.StringIO()):
+            self.assertFalse(jam.main([]))
+            self.assertFalse(jam.main(["nope"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import struct
+import unittest
+
+sys.path.insert(0, os.path.abspath(".."))
+
+import testhelpers
+from src.lib import JAMExtractor
+from src.utils import jamarchive
+
+
+def create_deep_jam(path, depth):
+    """Write a JAM whose single file is nested depth folders deep."""
+    data = bytearray(b"LJAM")
+    for _ in range(depth):
+        next_folder = len(data) + 24
+        data += struct.pack("<II12sI", 0, 1, b"D", next_folder)
+    payload = len(data) + 24
+    data += struct.pack("<I12sIII", 1, b"DEEP.TXT", payload, 4, 0)
+    data += b"deep"
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+class TestJamArchiveMethods(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        testhelpers.setUpClass()
+        cls.files = {
+            "GAMEDATA/COMMON/A.TXT": b"hello",
+            "GAMEDATA/B.BIN": bytes(range(256)) * 4,
+            "MENUDATA/C.TXT": b""
+        }
+        cls.jam = testhelpers.create_jam("archive", cls.files)
+
+    @classmethod
+    def tearDownClass(cls):
+        testhelpers.tearDownClass()
+
+    def test_open_valid_archive(self):
+        with jamarchive.JamArchive(self.jam) as archive:
+            self.assertEqual(archive.size, os.path.getsize(self.jam))
+            self.assertEqual(archive.read(0, 4), b"LJAM")
+
+    def test_read_is_zero_copy(self):
+        with jamarchive.JamArchive(self.jam) as archive:
+            view = archive.read(0, 4)
+            self.assertIsInstance(view, memoryview)
+            self.assertTrue(view.readonly)
+            view.release()
+
+    def test_close_with_live_view(self):
+        archive = jamarchive.JamArchive(self.jam)
+        view = archive.read(0, 4)
+        payload = archive.read_entry("GAMEDATA/COMMON/A.TXT")
+        archive.close()
+
+        # The file is closed, but the view still works until released
+        self.assertTrue(archive._JamArchive__file.closed)
+        self.assertEqual(view, b"LJAM")
+        self.assertEqual(payload, b"hello")
+        view.release()
+
+    def test_open_invalid_archive(self):
+        path = os.path.join(testhelpers.TEST_FILES_TEMP_PATH, "NOT.JAM")
+        with open(path, "wb") as f:
+            f.write(b"JAML")
+        with self.assertRaises(jamarchive.JamFormatError):
+            jamarchive.JamArchive(path)
+
+    def test_open_empty_archive(self):
+        path = os.path.join(testhelpers.TEST_FILES_TEMP_PATH, "EMPTY.JAM")
+        open(path, "wb").close()
+        with self.assertRaises(jamarchive.JamFormatError):
+            jamarchive.JamArchive(path)
+
+    def test_find_entry(self):
+        with jamarchive.JamArchive(self.jam) as archive:
+            entry = archive.find("GAMEDATA/COMMON/A.TXT")
+            self.assertEqual(entry.path, "GAMEDATA/COMMON/A.TXT")
+            self.assertEqual(entry.size, 5)
+
+    def test_find_entry_case_insensitive(self):
+        with jamarchive.JamArchive(self.jam) as archive:
+            entry = archive.find("\\gamedata\\common\\a.txt")
+            self.assertEqual(entry.path, "GAMEDATA/COMMON/A.TXT")
+
+    def test_find_missing_entry(self):
+        with jamarchive.JamArchive(self.jam) as archive:
+            self.assertIsNone(archive.find("GAMEDATA/COMMON/Z.TXT"))
+            self.assertIsNone(archive.find("GAMEDATA/COMMON"))
+            self.assertIsNone(archive.find(""))
+
+    def test_read_entry(self):
+        with jamarchive.JamArchive(self.jam) as archive:
+            for rel_path, data in self.files.items():
+                self.assertEqual(archive.read_entry(rel_path), data)
+            with self.assertRaises(KeyError):
+                archive.read_entry("GAMEDATA/NOPE.BIN")
+
+    def test_open_entry(self):
+        with jamarchive.JamArchive(self.jam) as archive:
+            with archive.open_entry("GAMEDATA/B.BIN") as f:
+                self.assertEqual(f.read(4), bytes(range(4)))
+                f.seek(-2, os.SEEK_END)
+                self.assertEqual(f.read(), bytes((254, 255)))
+                f.seek(0)
+                self.assertEqual(f.read(), self.files["GAMEDATA/B.BIN"])
+
+    def test_walk(self):
+        with jamarchive.JamArchive(self.jam) as archive:
+            entries = {e.path: e.size for e in archive.walk()}
+        self.assertEqual(entries, {p: len(d) for p, d in self.files.items()})
+
+    def test_walk_subfolder(self):
+        with jamarchive.JamArchive(self.jam) as archive:
+            paths = [e.path for e in archive.walk("gamedata")]
+            self.assertEqual(sorted(paths),
+                             ["GAMEDATA/B.BIN", "GAMEDATA/COMMON/A.TXT"])
+            self.assertEqual(list(archive.walk("NOPE")), [])
+
+    def test_walk_folders(self):
+        with jamarchive.JamArchive(self.jam) as archive:
+            walk = archive.walk_folders()
+            folder, files, subfolders = next(walk)
+            self.assertEqual(folder, "")
+            self.assertEqual(files, [])
+            self.assertEqual(sorted(subfolders), ["GAMEDATA", "MENUDATA"])
+            walk.close()
+
+    def test_walk_deep_archive(self):
+        path = os.path.join(testhelpers.TEST_FILES_TEMP_PATH, "DEEP.JAM")
+        depth = sys.getrecursionlimit() * 2
+        create_deep_jam(path, depth)
+        with jamarchive.JamArchive(path) as archive:
+            entries = list(archive.walk())
+            self.assertEqual(len(entries), 1)
+            self.assertEqual(entries[0].path, "D/" * depth + "DEEP.TXT")
+            self.assertEqual(len(archive.index().folders), depth)
+
+    def test_decode_folder_records(self):
+        data = (b"GAMEDATA\0\0\0\0" + (44).to_bytes(4, "little") +
+                b"MENUDATA1234" + (76).to_bytes(4, "little"))
+        names, offsets = jamarchive.decode_folder_records(data, 0, 2)
+        self.assertEqual(names, ["GAMEDATA", "MENUDATA1234"])
+        self.assertEqual(list(offsets), [44, 76])
+
+    def test_decode_file_records(self):
+        data = (b"XX" + b"A.TXT\0\0\0\0\0\0\0" +
+                (148).to_bytes(4, "little") + (5).to_bytes(4, "little"))
+        names, offsets, sizes = jamarchive.decode_file_records(data, 2, 1)
+        self.assertEqual(names, ["A.TXT"])
+        self.assertEqual(list(offsets), [148])
+        self.assertEqual(list(sizes), [5])
+
+    def test_decode_no_records(self):
+        names, offsets, sizes = jamarchive.decode_file_records(b"", 0, 0)
+        self.assertEqual((names, len(offsets), len(sizes)), ([], 0, 0))
+
+    def test_extract_roundtrip(self):
+        self.assertTrue(JAMExtractor.extract(self.jam, False))
+        out_folder = self.jam[:-4]
+        for rel_path, data in self.files.items():
+            with open(os.path.join(out_folder, *rel_path.split("/")),
+                      "rb") as f:
+                self.assertEqual(f.read(), data)
+
+    def test_parallel_extract_roundtrip(self):
+        self.assertTrue(JAMExtractor.extract(self.jam, False, 4))
+        out_folder = self.jam[:-4]
+        for rel_path, data in self.files.items():
+            with open(os.path.join(out_folder, *rel_path.split("/")),
+                      "rb") as f:
+                self.assertEqual(f.read(), data)
+
+    def test_selective_extract(self):
+        out_folder = os.path.join(testhelpers.TEST_FILES_TEMP_PATH,
+                                  "selective")
+        self.assertTrue(JAMExtractor.extract(
+            self.jam, False, 1, ["gamedata/common", "*/*.bin"], out_folder))
+        extracted = []
+        for current, dirs, files in os.walk(out_folder):
+            extracted.extend(os.path.relpath(os.path.join(current, a),
+                                             out_folder).replace(os.sep, "/")
+                             for a in files)
+        self.assertCountEqual(extracted,
+                              ["GAMEDATA/COMMON/A.TXT", "GAMEDATA/B.BIN"])
+        self.assertFalse(os.path.exists(os.path.join(out_folder, "MENUDATA")))
+
+    def write_raw_jam(self, name, data):
+        path = os.path.join(testhelpers.TEST_FILES_TEMP_PATH, name)
+        with open(path, "wb") as f:
+            f.write(b"LJAM" + data)
+        return path
+
+    def assertCorrupt(self, path, message):
+        with jamarchive.JamArchive(path) as archive:
+            with self.assertRaisesRegex(jamarchive.JamFormatError, message):
+                archive.index()
+
+    def test_folder_cycle(self):
+        # The root's only subfolder is the root itself
+        path = self.write_raw_jam(
+            "CYCLE.JAM", struct.pack("<II12sI", 0, 1, b"LOOP", 4))
+        self.assertCorrupt(path, "LOOP points back")
+
+    def test_shared_folder_record(self):
+        # Two subfolders sharing one record
+        path = self.write_raw_jam("SHARED.JAM", struct.pack(
+            "<II12sI12sIII", 0, 2, b"A", 44, b"B", 44, 0, 0))
+        self.assertCorrupt(path, "B points back")
+
+    def test_truncated_records(self):
+        path = self.write_raw_jam(
+            "COUNT.JAM", struct.pack("<II", 0xFFFFFFFF, 0))
+        self.assertCorrupt(path, "run past the end")
+
+        path = self.write_raw_jam("SHORT.JAM", struct.pack("<I", 0))
+        self.assertCorrupt(path, "outside the archive")
+
+    def test_folder_offset_in_magic(self):
+        path = self.write_raw_jam(
+            "MAGIC.JAM", struct.pack("<II12sI", 0, 1, b"BAD", 2))
+        self.assertCorrupt(path, "points into the archive magic")
+
+    def test_payload_past_end(self):
+        path = self.write_raw_jam(
+            "PAYLOAD.JAM", struct.pack("<I12sIII", 1, b"A.TXT", 28, 100, 0))
+        self.assertCorrupt(path, "A.TXT ends at 128")
+        with jamarchive.JamArchive(path) as archive:
+            with self.assertRaises(jamarchive.JamFormatError):
+                archive.find("A.TXT")
+
+    def test_parent_folder_record(self):
+        # The root's only subfolder climbs out of the extraction folder
+        path = self.write_raw_jam("PARENT.JAM", struct.pack(
+            "<II12sII12sIIIs", 0, 1, b"..", 28,
+            1, b"EVIL.TXT", 56, 4, 0, b"evil"))
+        self.assertCorrupt(path, "invalid record name '..'")
+
+        out_folder = os.path.join(testhelpers.TEST_FILES_TEMP_PATH,
+                                  "parent", "out")
+        self.assertFalse(JAMExtractor.extract(path, False, 1, None,
+                                              out_folder))
+        self.assertFalse(os.path.exists(os.path.join(
+            testhelpers.TEST_FILES_TEMP_PATH, "parent", "EVIL.TXT")))
+
+    def test_file_name_with_separator(self):
+        path = self.write_raw_jam("SLASH.JAM", struct.pack(
+            "<I12sIII", 1, b"..\\EVIL.TXT", 28, 0, 0))
+        self.assertCorrupt(path, "invalid record name")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(".."))
+
+import testhelpers
+from src.lib import JAMExtractor
+from src.utils.jamarchive import JamArchive
+from src.utils.jambuildcache import BuildCache, tree_hash
+from src.utils.jambuilder import JamFolder
+
+
+class TestJamBuildCacheMethods(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        testhelpers.setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        testhelpers.tearDownClass()
+
+    def setUp(self):
+        self.name = self.id().split(".")[-1]
+        self.tree = os.path.join(testhelpers.TEST_FILES_TEMP_PATH, self.name)
+        self.jam = f"{self.tree}.JAM"
+        self.cache = BuildCache(os.path.join(
+            testhelpers.TEST_FILES_TEMP_PATH, f"{self.name}-cache"))
+        self.write("GAMEDATA/A.TXT", b"a" * 1000)
+        self.write("MENUDATA/B.TXT", b"b" * 1000)
+
+    def write(self, path, data):
+        full_path = os.path.join(self.tree, *path.split("/"))
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "wb") as f:
+            f.write(data)
+
+    def build(self):
+        return JAMExtractor.build(self.tree, False, True, True, self.cache,
+                                  f"{self.tree}-manifests")
+
+    def cached_archives(self):
+        return [a for a in os.listdir(self.cache.path) if a.endswith(".JAM")]
+
+    def read_archive(self):
+        with JamArchive(self.jam) as archive:
+            return {e.path: bytes(archive.read(e.offset, e.size))
+                    for e in archive.walk()}
+
+    def test_tree_hash(self):
+        folders = [JamFolder("", [("A", 1)], ["SUB"]),
+                   JamFolder("SUB", [("B", 2)], [])]
+        digests = {"A": "00" * 32, "SUB/B": "11" * 32}
+        first = tree_hash(folders, digests)
+        self.assertEqual(tree_hash(folders, digests), first)
+
+        digests["SUB/B"] = "22" * 32
+        self.assertNotEqual(tree_hash(folders, digests), first)
+        renamed = [JamFolder("", [("A", 1)], ["SUB2"]),
+                   JamFolder("SUB2", [("B", 2)], [])]
+        self.assertNotEqual(tree_hash(renamed, {"A": "00" * 32,
+                                                "SUB2/B": "22" * 32}),
+                            tree_hash(folders, digests))
+
+    def test_restore_reverted_tree(self):
+        self.assertTrue(self.build())
+        original = self.read_archive()
+        self.assertEqual(len(self.cached_archives()), 1)
+
+        self.write("GAMEDATA/A.TXT", b"modded")
+        self.assertTrue(self.build())
+        self.assertEqual(self.read_archive()["GAMEDATA/A.TXT"], b"modded")
+        self.assertEqual(len(self.cached_archives()), 2)
+
+        # Reverting the tree brings back the first archive unchanged
+        self.write("GAMEDATA/A.TXT", b"a" * 1000)
+        self.assertTrue(self.build())
+        self.assertEqual(self.read_archive(), original)
+        self.assertEqual(len(self.cached_archives()), 2)
+
+    def test_cached_archive_is_not_changed(self):
+        self.assertTrue(self.build())
+        self.write("GAMEDATA/A.TXT", b"a" * 999 + b"!")
+        self.assertTrue(self.build())
+        self.write("GAMEDATA/A.TXT", b"a" * 1000)
+        self.assertTrue(self.build())
+
+        # An incremental update of a restored archive
+        # must not write through to the cache
+        self.write("GAMEDATA/A.TXT", b"b" * 1000)
+        self.assertTrue(self.build())
+        self.write("GAMEDATA/A.TXT", b"a" * 1000)
+        self.assertTrue(self.build())
+        self.assertEqual(self.read_archive()["GAMEDATA/A.TXT"], b"a" * 1000)
+
+    def test_changed_archive_is_not_cached(self):
+        self.assertTrue(self.build())
+        original = self.read_archive()
+        self.write("GAMEDATA/A.TXT", b"modded")
+        self.assertTrue(self.build())
+        self.write("GAMEDATA/A.TXT", b"a" * 1000)
+        self.assertTrue(self.build())
+        self.assertEqual(os.stat(self.jam).st_nlink, 1)
+
+        # Damage the restored archive in place behind the cache's back
+        with open(self.jam, "r+b") as f:
+            f.seek(-1, os.SEEK_END)
+            f.write(b"!")
+        stat = os.stat(self.jam)
+        os.utime(self.jam, ns=(stat.st_atime_ns,
+                               stat.st_mtime_ns + 10**9))
+        self.assertTrue(self.build())
+        self.assertEqual(self.read_archive(), original)
+
+    def test_eviction(self):
+        self.assertTrue(self.build())
+        self.cache.max_size = os.path.getsize(self.jam) + 1
+        self.write("GAMEDATA/A.TXT", b"modded")
+        self.assertTrue(self.build())
+        self.assertEqual(len(self.cached_archives()), 1)
+
+        # The first archive was evicted, so it has to be rebuilt
+        self.write("GAMEDATA/A.TXT", b"a" * 1000)
+        self.assertTrue(self.build())
+        self.assertEqual(self.read_archive()["GAMEDATA/A.TXT"], b"a" * 1000)
+
+
+if __name__ == "__main__":
+    unittest.main()
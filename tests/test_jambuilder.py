@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import zipfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(".."))
+
+import testhelpers
+from src.utils import jambuilder
+from src.utils.jamarchive import JamArchive
+
+
+class TestJamBuilderMethods(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        testhelpers.setUpClass()
+        os.makedirs(testhelpers.TEST_FILES_TEMP_PATH, exist_ok=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        testhelpers.tearDownClass()
+
+    def test_plan_layout(self):
+        folders = [
+            jambuilder.JamFolder("", [("ROOT.TXT", 3)], ["GAMEDATA"]),
+            jambuilder.JamFolder("GAMEDATA", [("A.BIN", 5), ("B.BIN", 0)],
+                                 ["EMPTY"]),
+            jambuilder.JamFolder("GAMEDATA/EMPTY", [], [])
+        ]
+        layout = jambuilder.plan_layout(folders)
+        payloads = {"ROOT.TXT": b"abc", "GAMEDATA/A.BIN": b"12345",
+                    "GAMEDATA/B.BIN": b""}
+
+        path = os.path.join(testhelpers.TEST_FILES_TEMP_PATH, "PLAN.JAM")
+        with open(path, "wb") as f:
+            f.write(layout.header)
+            for entry in layout.entries:
+                self.assertEqual(f.tell(), entry.offset)
+                f.write(payloads[entry.path])
+            self.assertEqual(f.tell(), layout.size)
+
+        with JamArchive(path) as archive:
+            index = archive.index()
+            self.assertEqual(index.folders,
+                             ["GAMEDATA", "GAMEDATA/EMPTY"])
+            for entry in archive.walk():
+                with archive.read(entry.offset, entry.size) as view:
+                    self.assertEqual(view, payloads[entry.path])
+
+    def test_tree_case_insensitive(self):
+        tree = jambuilder.JamTree()
+        tree.add("GAMEDATA/A.BIN", "first")
+        tree.add("gamedata\\a.bin", "second")
+        tree.add("gamedata/NEW/B.BIN", "third")
+        self.assertEqual(len(tree), 2)
+        self.assertEqual(tree.get("GameData/A.Bin"), "second")
+        self.assertEqual(list(dict(tree.items())),
+                         ["GAMEDATA/A.BIN", "GAMEDATA/NEW/B.BIN"])
+        self.assertTrue(tree.remove("GAMEDATA/A.BIN"))
+        self.assertFalse(tree.remove("GAMEDATA/A.BIN"))
+        self.assertNotIn("GAMEDATA/A.BIN", tree)
+
+    def test_tree_prune(self):
+        tree = jambuilder.JamTree()
+        source = jambuilder.FileSource("A.BIN", 1)
+        tree.add("GAMEDATA/A.BIN", source)
+        tree.add("GAMEDATA/NEW/DEEP/B.BIN", source)
+        tree.add_folder("MENUDATA")
+
+        # Folders that still hold anything are kept
+        self.assertEqual(tree.prune("GAMEDATA/NEW/DEEP"), 0)
+        self.assertTrue(tree.remove("gamedata/new/deep/b.bin"))
+        self.assertEqual(tree.prune("gamedata/new/deep"), 2)
+        self.assertEqual(tree.prune(""), 0)
+        self.assertEqual([a.path for a in tree.folders()],
+                         ["", "GAMEDATA", "MENUDATA"])
+
+    def test_tree_rejects_invalid_paths(self):
+        tree = jambuilder.JamTree()
+        tree.add("GAMEDATA/A.BIN", "a")
+        with self.assertRaises(ValueError):
+            tree.add("GAMEDATA/THIRTEEN.CHAR", "b")
+        with self.assertRaises(ValueError):
+            tree.add("GAMEDATA", "c")
+        with self.assertRaises(ValueError):
+            tree.add_folder("GAMEDATA/A.BIN/X")
+
+    def test_write_tree_from_archive_and_zip(self):
+        original = testhelpers.create_jam("spliced", {
+            "GAMEDATA/A.BIN": b"old a",
+            "GAMEDATA/B.BIN": b"old b"
+        })
+        package = os.path.join(testhelpers.TEST_FILES_TEMP_PATH, "pkg.zip")
+        with zipfile.ZipFile(package, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("gamedata/a.bin", b"new a" * 100)
+            zf.writestr("MENUDATA/C.BIN", b"new c")
+
+        path = os.path.join(testhelpers.TEST_FILES_TEMP_PATH, "NEW.JAM")
+        with JamArchive(original) as archive, \
+                zipfile.ZipFile(package) as zf:
+            tree = jambuilder.JamTree.from_archive(archive)
+            for info in zf.infolist():
+                tree.add(info.filename, jambuilder.ZipSource(zf, info))
+            jambuilder.write_tree(path, tree)
+
+        with JamArchive(path) as archive:
+            entries = {e.path: bytes(archive.read(e.offset, e.size))
+                       for e in archive.walk()}
+        self.assertEqual(entries, {
+            "GAMEDATA/A.BIN": b"new a" * 100,
+            "GAMEDATA/B.BIN": b"old b",
+            "MENUDATA/C.BIN": b"new c"
+        })
+
+    def test_write_tree_dedup(self):
+        original = testhelpers.create_jam("dedup", {
+            "GAMEDATA/A.BIN": b"same" * 100,
+            "GAMEDATA/B.BIN": b"diff" * 100,
+            "MENUDATA/C.BIN": b"same" * 100,
+            "MENUDATA/D.BIN": b""
+        })
+        path = os.path.join(testhelpers.TEST_FILES_TEMP_PATH, "DEDUP.JAM")
+        with JamArchive(original) as archive:
+            tree = jambuilder.JamTree.from_archive(archive)
+            layout = jambuilder.write_tree(path, tree, True)
+            expected = {e.path: bytes(archive.read(e.offset, e.size))
+                        for e in archive.walk()}
+
+        offsets = {e.path: e.offset for e in layout.entries}
+        self.assertEqual(offsets["GAMEDATA/A.BIN"], offsets["MENUDATA/C.BIN"])
+        self.assertEqual(os.path.getsize(path), layout.size)
+        self.assertEqual(os.path.getsize(path),
+                         os.path.getsize(original) - 400)
+        with JamArchive(path) as archive:
+            entries = {e.path: bytes(archive.read(e.offset, e.size))
+                       for e in archive.walk()}
+        self.assertEqual(entries, expected)
+
+    def test_hash_payloads_skips_unique_sizes(self):
+        class Source:
+            def __init__(self, data):
+                self.data = data
+                self.size = len(data)
+
+            def chunks(self):
+                yield self.data
+
+        digests = jambuilder.hash_payloads({
+            "A": Source(b"abc"), "B": Source(b"abc"),
+            "C": Source(b"abd"), "D": Source(b"long"), "E": Source(b"")
+        })
+        self.assertEqual(sorted(digests), ["A", "B", "C"])
+        self.assertEqual(digests["A"], digests["B"])
+        self.assertNotEqual(digests["A"], digests["C"])
+
+    def test_tree_add_files(self):
+        original = testhelpers.create_jam("overlay", {
+            "GAMEDATA/A.BIN": b"old a",
+            "GAMEDATA/B.BIN": b"old b"
+        })
+        folder = os.path.join(testhelpers.TEST_FILES_TEMP_PATH, "changes")
+        for rel_path in ("gamedata/a.bin", "NEW/C.BIN", "NEW/THIRTEEN.CHAR"):
+            os.makedirs(os.path.join(folder, os.path.dirname(rel_path)),
+                        exist_ok=True)
+            with open(os.path.join(folder, rel_path), "wb") as f:
+                f.write(b"new")
+
+        path = os.path.join(testhelpers.TEST_FILES_TEMP_PATH, "OVERLAY.JAM")
+        with JamArchive(original) as archive:
+            tree = jambuilder.JamTree.from_archive(archive)
+            skipped = tree.add_files(folder)
+            jambuilder.write_tree(path, tree)
+        self.assertEqual(skipped,
+                         [os.path.join(folder, "NEW", "THIRTEEN.CHAR")])
+
+        with JamArchive(path) as archive:
+            entries = {e.path: bytes(archive.read(e.offset, e.size))
+                       for e in archive.walk()}
+        self.assertEqual(entries, {
+            "GAMEDATA/A.BIN": b"new",
+            "GAMEDATA/B.BIN": b"old b",
+            "NEW/C.BIN": b"new"
+        })
+
+    def test_plan_layout_name_too_long(self):
+        with self.assertRaises(ValueError):
+            jambuilder.plan_layout([
+                jambuilder.JamFolder("", [("THIRTEEN.CHAR", 1)], [])])
+
+    def test_plan_layout_missing_folder(self):
+        with self.assertRaises(ValueError):
+            jambuilder.plan_layout([
+                jambuilder.JamFolder("", [], ["GAMEDATA"])])
+
+    def test_plan_layout_missing_root(self):
+        with self.assertRaises(ValueError):
+            jambuilder.plan_layout([])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(".."))
+
+import testhelpers
+from src.lib import JAMExtractor
+from src.utils.jamarchive import JamArchive
+from src.utils.jamcache import IndexCache
+
+
+class TestIndexCacheMethods(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        testhelpers.setUpClass()
+        cls.jam = testhelpers.create_jam("cached", {
+            "GAMEDATA/COMMON/A.TXT": b"hello",
+            "GAMEDATA/B.BIN": b"\xff" * 300,
+            "MENUDATA/C.TXT": b"c"
+        })
+
+    @classmethod
+    def tearDownClass(cls):
+        testhelpers.tearDownClass()
+
+    def setUp(self):
+        self.cache_path = os.path.join(testhelpers.TEST_FILES_TEMP_PATH,
+                                       "cache", self.id().split(".")[-1])
+        self.cache = IndexCache(self.cache_path)
+
+    def test_load_missing_index(self):
+        with JamArchive(self.jam) as archive:
+            self.assertIsNone(self.cache.load(archive))
+
+    def test_save_and_load_index(self):
+        with JamArchive(self.jam) as archive:
+            index = archive.index()
+            self.assertTrue(self.cache.save(archive, index))
+            self.assertEqual(self.cache.load(archive), index)
+
+    def test_archive_uses_cache(self):
+        with JamArchive(self.jam, self.cache) as archive:
+            index = archive.index()
+        with JamArchive(self.jam) as archive:
+            self.assertEqual(self.cache.load(archive), index)
+        with JamArchive(self.jam, self.cache) as archive:
+            self.assertEqual(archive.index(), index)
+
+    def test_changed_archive_invalidates_index(self):
+        with JamArchive(self.jam) as archive:
+            self.cache.save(archive, archive.index())
+        stat = os.stat(self.jam)
+        os.utime(self.jam, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        with JamArchive(self.jam) as archive:
+            self.assertIsNone(self.cache.load(archive))
+
+    def test_corrupt_index_is_discarded(self):
+        with JamArchive(self.jam) as archive:
+            self.cache.save(archive, archive.index())
+            cache_file = os.path.join(self.cache_path,
+                                      os.listdir(self.cache_path)[0])
+            with open(cache_file, "r+b") as f:
+                f.truncate(os.path.getsize(cache_file) - 1)
+            self.assertIsNone(self.cache.load(archive))
+            self.assertFalse(os.path.exists(cache_file))
+
+    def test_read_only_cache_still_loads(self):
+        with JamArchive(self.jam) as archive:
+            index = archive.index()
+            self.cache.save(archive, index)
+            with mock.patch("os.utime", side_effect=PermissionError):
+                self.assertEqual(self.cache.load(archive), index)
+
+    def test_extract_uses_given_cache(self):
+        out_folder = os.path.join(testhelpers.TEST_FILES_TEMP_PATH,
+                                  "cached_extract")
+        self.assertTrue(JAMExtractor.extract(self.jam, False, 1, None,
+                                             out_folder, self.cache))
+        with JamArchive(self.jam) as archive:
+            self.assertIsNotNone(self.cache.load(archive))
+
+    def test_eviction(self):
+        with JamArchive(self.jam) as archive:
+            index = archive.index()
+            self.cache.save(archive, index)
+            cache_file = os.listdir(self.cache_path)[0]
+            self.cache.max_size = 0
+            self.cache.save(archive, index)
+        self.assertNotIn(cache_file, os.listdir(self.cache_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.abspath(".."))
+
+import testhelpers
+from src.utils import jamdelta
+from src.utils.jamarchive import JamArchive
+
+
+class TestJamDeltaMethods(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        testhelpers.setUpClass()
+        rng = random.Random(1)
+        big = bytes(rng.getrandbits(8) for _ in range(200 * 1024))
+        cls.base = testhelpers.create_jam("base", {
+            "GAMEDATA/BIG.BIN": big,
+            "GAMEDATA/OLD.BMP": b"moved" * 1000,
+            "MENUDATA/KEEP.TXT": b"keep"
+        })
+        cls.target = testhelpers.create_jam("target", {
+            "GAMEDATA/BIG.BIN": big[:1000] + b"inserted" + big[1000:],
+            "GAMEDATA/NEW/RENAMED.BMP": b"moved" * 1000,
+            "MENUDATA/KEEP.TXT": b"keep",
+            "MENUDATA/ADDED.TXT": b"added"
+        })
+
+    @classmethod
+    def tearDownClass(cls):
+        testhelpers.tearDownClass()
+
+    def roundtrip(self, blocks):
+        patch = os.path.join(testhelpers.TEST_FILES_TEMP_PATH, "PATCH.RJD")
+        result = os.path.join(testhelpers.TEST_FILES_TEMP_PATH, "RESULT.JAM")
+        with JamArchive(self.base) as base, \
+                JamArchive(self.target) as target:
+            stats = jamdelta.create(base, target, patch, blocks)
+        with JamArchive(self.base) as base, open(result, "wb") as f:
+            jamdelta.apply(base, patch, f)
+
+        with open(self.target, "rb") as a, open(result, "rb") as b:
+            self.assertEqual(a.read(), b.read())
+        return stats
+
+    def test_moved_entries_are_copied(self):
+        stats = self.roundtrip(False)
+        self.assertGreaterEqual(stats["copied"], 5000 + 4)
+        self.assertLess(stats["literal"], 210 * 1024)
+
+    def test_block_delta(self):
+        stats = self.roundtrip(True)
+        self.assertLess(stats["literal"], 8 * 1024)
+        self.assertGreater(stats["copied"], 190 * 1024)
+
+    def test_wrong_base(self):
+        patch = os.path.join(testhelpers.TEST_FILES_TEMP_PATH, "WRONG.RJD")
+        with JamArchive(self.base) as base, \
+                JamArchive(self.target) as target:
+            jamdelta.create(base, target, patch)
+        with JamArchive(self.target) as target, open(os.devnull, "wb") as f:
+            with self.assertRaisesRegex(jamdelta.DeltaError, "not made for"):
+                jamdelta.apply(target, patch, f)
+
+    def test_corrupt_patch(self):
+        patch = os.path.join(testhelpers.TEST_FILES_TEMP_PATH, "BAD.RJD")
+        with JamArchive(self.base) as base, \
+                JamArchive(self.target) as target:
+            jamdelta.create(base, target, patch)
+        with open(patch, "rb") as f:
+            data = f.read()
+        with open(patch, "wb") as f:
+            f.write(data[:len(data) // 2])
+
+        with JamArchive(self.base) as base, open(os.devnull, "wb") as f:
+            with self.assertRaises(jamdelta.DeltaError):
+                jamdelta.apply(base, patch, f)
+
+    def test_not_a_patch(self):
+        patch = os.path.join(testhelpers.TEST_FILES_TEMP_PATH, "NOT.RJD")
+        with open(patch, "wb") as f:
+            f.write(b"not a gzip stream at all")
+
+        with JamArchive(self.base) as base, open(os.devnull, "wb") as f:
+            with self.assertRaises(jamdelta.DeltaError):
+                jamdelta.apply(base, patch, f)
+
+
+if __name__ == "__main__":
+    unittest.main()
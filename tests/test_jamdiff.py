@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(".."))
+
+import testhelpers
+from src.utils import jamdiff
+from src.utils.jamarchive import JamArchive
+
+
+class TestJamDiffMethods(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        testhelpers.setUpClass()
+        cls.old = testhelpers.create_jam("old", {
+            "GAMEDATA/SAME.BIN": b"s" * 5000,
+            "GAMEDATA/EDIT.BIN": b"e" * 5000,
+            "GAMEDATA/GROW.BIN": b"g",
+            "MENUDATA/GONE.TXT": b"gone"
+        })
+        cls.new = testhelpers.create_jam("new", {
+            "GAMEDATA/same.bin": b"s" * 5000,
+            "GAMEDATA/EDIT.BIN": b"e" * 4999 + b"!",
+            "GAMEDATA/GROW.BIN": b"grown",
+            "MENUDATA/NEW.TXT": b"new"
+        })
+
+    @classmethod
+    def tearDownClass(cls):
+        testhelpers.tearDownClass()
+
+    def test_diff(self):
+        with JamArchive(self.old) as old, JamArchive(self.new) as new:
+            self.assertEqual(jamdiff.diff(old, new), {
+                "added": ["MENUDATA/NEW.TXT"],
+                "removed": ["MENUDATA/GONE.TXT"],
+                "changed": [["GAMEDATA/EDIT.BIN", 5000, 5000],
+                            ["GAMEDATA/GROW.BIN", 1, 5]]
+            })
+
+    def test_diff_same_archive(self):
+        with JamArchive(self.old) as old, JamArchive(self.old) as new:
+            self.assertEqual(jamdiff.diff(old, new),
+                             {"added": [], "removed": [], "changed": []})
+
+    def test_same_payload(self):
+        with JamArchive(self.old) as old, JamArchive(self.new) as new:
+            a = old.find("GAMEDATA/SAME.BIN")
+            b = new.find("GAMEDATA/SAME.BIN")
+            self.assertTrue(jamdiff.same_payload(old, a.offset, new,
+                                                 b.offset, a.size))
+            a = old.find("GAMEDATA/EDIT.BIN")
+            b = new.find("GAMEDATA/EDIT.BIN")
+            self.assertFalse(jamdiff.same_payload(old, a.offset, new,
+                                                  b.offset, a.size))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import stat
+import unittest
+
+sys.path.insert(0, os.path.abspath(".."))
+
+import testhelpers
+from src.utils.jamarchive import JamArchive
+from src.utils.jampath import JamPath
+
+
+class TestJamPathMethods(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        testhelpers.setUpClass()
+        cls.jam = testhelpers.create_jam("path", {
+            "GAMEDATA/COMMON/FOO.BMP": b"foo",
+            "GAMEDATA/COMMON/BAR.TXT": b"line 1\r\nline 2",
+            "GAMEDATA/RACE/TRACK.BIN": b"track" * 10,
+            "MENUDATA/MENU.TXT": b"menu"
+        })
+
+    @classmethod
+    def tearDownClass(cls):
+        testhelpers.tearDownClass()
+
+    def setUp(self):
+        self.archive = JamArchive(self.jam)
+        self.root = JamPath(self.archive)
+
+    def tearDown(self):
+        self.archive.close()
+
+    def test_path_names(self):
+        path = self.root / "gamedata" / "common/foo.bmp"
+        self.assertEqual(path.parts, ("gamedata", "common", "foo.bmp"))
+        self.assertEqual(path.name, "foo.bmp")
+        self.assertEqual(path.stem, "foo")
+        self.assertEqual(path.suffix, ".bmp")
+        self.assertEqual(str(path.parent), "gamedata/common")
+        self.assertEqual(path,
+                         JamPath(self.archive, "GAMEDATA/COMMON/FOO.BMP"))
+        self.assertEqual(str(path.resolve()), "GAMEDATA/COMMON/FOO.BMP")
+
+    def test_exists(self):
+        self.assertTrue(self.root.is_dir())
+        self.assertTrue((self.root / "gamedata/common").is_dir())
+        self.assertTrue((self.root / "MENUDATA/MENU.TXT").is_file())
+        self.assertFalse((self.root / "MENUDATA/MENU.TXT").is_dir())
+        self.assertFalse((self.root / "MENUDATA/NOPE.TXT").exists())
+        self.assertFalse((self.root / "MENUDATA/MENU.TXT/X").exists())
+        with self.assertRaises(FileNotFoundError):
+            (self.root / "NOPE").resolve()
+
+    def test_iterdir(self):
+        names = [p.name for p in (self.root / "GAMEDATA").iterdir()]
+        self.assertCountEqual(names, ["COMMON", "RACE"])
+        names = [p.name for p in (self.root / "GAMEDATA/COMMON").iterdir()]
+        self.assertCountEqual(names, ["FOO.BMP", "BAR.TXT"])
+        with self.assertRaises(NotADirectoryError):
+            list((self.root / "MENUDATA/MENU.TXT").iterdir())
+        with self.assertRaises(FileNotFoundError):
+            list((self.root / "NOPE").iterdir())
+
+    def test_glob(self):
+        gamedata = self.root / "GAMEDATA"
+        self.assertCountEqual([str(p) for p in gamedata.glob("*/*.bmp")],
+                              ["GAMEDATA/COMMON/FOO.BMP"])
+        self.assertCountEqual([p.name for p in self.root.rglob("*.txt")],
+                              ["BAR.TXT", "MENU.TXT"])
+
+    def test_stat(self):
+        info = (self.root / "GAMEDATA/RACE/TRACK.BIN").stat()
+        self.assertTrue(stat.S_ISREG(info.st_mode))
+        self.assertEqual(info.st_size, 50)
+        self.assertEqual(info.st_mtime, self.archive.stat.st_mtime)
+
+        info = (self.root / "GAMEDATA").stat()
+        self.assertTrue(stat.S_ISDIR(info.st_mode))
+        self.assertEqual(info.st_size, 3 + 14 + 50)
+
+    def test_read(self):
+        path = self.root / "GAMEDATA/COMMON/BAR.TXT"
+        self.assertEqual(path.read_bytes(), b"line 1\r\nline 2")
+        self.assertEqual(path.read_text("ascii"), "line 1\nline 2")
+        with path.open("rb") as f:
+            f.seek(5)
+            self.assertEqual(f.read(3), b"1\r\n")
+        with self.assertRaises(IsADirectoryError):
+            (self.root / "GAMEDATA").read_bytes()
+        with self.assertRaises(ValueError):
+            path.open("wb")
+
+    def test_closed_files_release_the_archive(self):
+        mapping = self.archive._JamArchive__mmap
+        path = self.root / "GAMEDATA/COMMON/BAR.TXT"
+        with path.open("rb") as f:
+            f.read()
+        with path.open("r", "ascii") as f:
+            f.read()
+        with self.assertRaises(LookupError):
+            path.open("r", "no-such-encoding")
+
+        # No entry view is left to keep the mapping alive
+        self.archive.close()
+        self.assertTrue(mapping.closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
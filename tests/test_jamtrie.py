@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(".."))
+
+import testhelpers
+from src.utils.jamarchive import JamArchive, JamIndex
+from src.utils.jamtrie import JamTrie
+
+
+class TestJamTrieMethods(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        testhelpers.setUpClass()
+        cls.files = {
+            "GAMEDATA/COMMON/TEXTURES/A.BMP": b"a" * 10,
+            "GAMEDATA/COMMON/TEXTURES/B.TGA": b"b" * 20,
+            "GAMEDATA/TRACK1/TEXTURES/C.BMP": b"c" * 30,
+            "GAMEDATA/TRACK1/D.BMP": b"d" * 40,
+            "MENUDATA/E.BMP": b"e" * 50
+        }
+        path = testhelpers.create_jam("trie", cls.files)
+        with JamArchive(path) as archive:
+            cls.index = archive.index()
+        cls.trie = JamTrie(cls.index)
+
+    @classmethod
+    def tearDownClass(cls):
+        testhelpers.tearDownClass()
+
+    def test_find(self):
+        entry = self.trie.find("gamedata\\track1\\d.bmp")
+        self.assertEqual(entry.path, "GAMEDATA/TRACK1/D.BMP")
+        self.assertEqual(entry.size, 40)
+        self.assertIsNone(self.trie.find("GAMEDATA/TRACK1"))
+        self.assertIsNone(self.trie.find("GAMEDATA/TRACK1/D.BMP/X"))
+        self.assertIsNone(self.trie.find("MISSING.BMP"))
+
+    def test_get_folder(self):
+        node = self.trie.get("gamedata/common")
+        self.assertTrue(node.is_folder())
+        self.assertEqual(node.name, "COMMON")
+        self.assertEqual(sorted(node.children), ["textures"])
+        self.assertIs(self.trie.get(""), self.trie.root)
+
+    def test_size_totals(self):
+        self.assertEqual(self.trie.size(), 150)
+        self.assertEqual(self.trie.root.count, 5)
+        self.assertEqual(self.trie.size("GAMEDATA"), 100)
+        self.assertEqual(self.trie.size("gamedata/track1"), 70)
+        self.assertEqual(self.trie.size("MENUDATA/E.BMP"), 50)
+        self.assertEqual(self.trie.size("MISSING"), 0)
+
+    def test_glob(self):
+        self.assertCountEqual(
+            [e.path for e in self.trie.glob("GAMEDATA/*/TEXTURES/*")],
+            ["GAMEDATA/COMMON/TEXTURES/A.BMP",
+             "GAMEDATA/COMMON/TEXTURES/B.TGA",
+             "GAMEDATA/TRACK1/TEXTURES/C.BMP"])
+        self.assertCountEqual(
+            [e.path for e in self.trie.glob("gamedata/*/textures/*.bmp")],
+            ["GAMEDATA/COMMON/TEXTURES/A.BMP",
+             "GAMEDATA/TRACK1/TEXTURES/C.BMP"])
+        self.assertCountEqual(
+            [e.path for e in self.trie.glob("*/E.BMP")], ["MENUDATA/E.BMP"])
+        self.assertEqual(list(self.trie.glob("*/*/*/*/*")), [])
+
+    def test_glob_recursive(self):
+        self.assertCountEqual(
+            [e.path for e in self.trie.glob("**/*.BMP")],
+            ["GAMEDATA/COMMON/TEXTURES/A.BMP",
+             "GAMEDATA/TRACK1/TEXTURES/C.BMP",
+             "GAMEDATA/TRACK1/D.BMP",
+             "MENUDATA/E.BMP"])
+        self.assertCountEqual(
+            [e.path for e in self.trie.glob("GAMEDATA/TRACK1/**")],
+            ["GAMEDATA/TRACK1/TEXTURES/C.BMP", "GAMEDATA/TRACK1/D.BMP"])
+
+    def test_empty_folders(self):
+        trie = JamTrie(JamIndex(["EMPTY"], [], [], []))
+        self.assertTrue(trie.get("empty").is_folder())
+        self.assertEqual(trie.size("EMPTY"), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
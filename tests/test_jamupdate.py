@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(".."))
+
+import testhelpers
+from src.lib import JAMExtractor
+from src.utils import jamupdate
+from src.utils.jamarchive import JamArchive
+
+
+class TestJamUpdateMethods(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        testhelpers.setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        testhelpers.tearDownClass()
+
+    def setUp(self):
+        self.files = {
+            "GAMEDATA/COMMON/A.TXT": b"a" * 1000,
+            "GAMEDATA/B.BIN": b"b" * 1000,
+            "MENUDATA/C.TXT": b"c" * 1000
+        }
+        self.name = self.id().split(".")[-1]
+        self.tree = os.path.join(testhelpers.TEST_FILES_TEMP_PATH, self.name)
+        self.jam = f"{self.tree}.JAM"
+        self.manifests = os.path.join(testhelpers.TEST_FILES_TEMP_PATH,
+                                      f"{self.name}-manifests")
+        for path, data in self.files.items():
+            self.write(path, data)
+        self.assertTrue(self.build())
+
+    def build(self, dedup=False):
+        return JAMExtractor.build(self.tree, False, True, dedup, None,
+                                  self.manifests)
+
+    def write(self, path, data):
+        self.files[path] = data
+        full_path = os.path.join(self.tree, *path.split("/"))
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "wb") as f:
+            f.write(data)
+        # Make sure the change is visible even on coarse file systems
+        stat = os.stat(full_path)
+        os.utime(full_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    def assertArchiveMatches(self):
+        with JamArchive(self.jam) as archive:
+            entries = {e.path: bytes(archive.read(e.offset, e.size))
+                       for e in archive.walk()}
+        self.assertEqual(entries, self.files)
+
+    def test_unchanged_tree(self):
+        size = os.path.getsize(self.jam)
+        self.assertTrue(self.build())
+        self.assertEqual(os.path.getsize(self.jam), size)
+        self.assertFalse(os.path.exists(f"{self.jam}.1.bak"))
+        self.assertArchiveMatches()
+
+    def test_rewrite_in_place(self):
+        size = os.path.getsize(self.jam)
+        self.write("GAMEDATA/B.BIN", b"x" * 900)
+        self.assertTrue(self.build())
+        self.assertEqual(os.path.getsize(self.jam), size)
+        self.assertFalse(os.path.exists(f"{self.jam}.1.bak"))
+        self.assertArchiveMatches()
+
+    def test_relocate_grown_file_and_folder(self):
+        size = os.path.getsize(self.jam)
+        self.write("GAMEDATA/B.BIN", b"y" * 1100)
+        self.write("GAMEDATA/COMMON/D.TXT", b"d" * 10)
+        self.assertTrue(self.build())
+        self.assertGreater(os.path.getsize(self.jam), size)
+        self.assertFalse(os.path.exists(f"{self.jam}.1.bak"))
+        self.assertArchiveMatches()
+
+    def test_fragmentation_forces_full_rebuild(self):
+        self.write("GAMEDATA/B.BIN", b"z" * 2000)
+        self.write("MENUDATA/C.TXT", b"z" * 2000)
+        self.assertTrue(self.build())
+        self.assertTrue(os.path.exists(f"{self.jam}.1.bak"))
+        self.assertArchiveMatches()
+
+    def test_extraction_manifest(self):
+        os.rename(self.tree, f"{self.tree}_src")
+        self.assertTrue(JAMExtractor.extract(self.jam, False))
+        self.assertTrue(jamupdate.record_extraction(
+            self.jam, self.tree, self.manifests))
+        self.write("MENUDATA/C.TXT", b"q" * 1000)
+        self.assertTrue(self.build())
+        self.assertFalse(os.path.exists(f"{self.jam}.1.bak"))
+        self.assertArchiveMatches()
+
+    def test_shared_payload_is_not_rewritten(self):
+        os.remove(self.jam)
+        self.write("MENUDATA/C.TXT", b"a" * 1000)
+        self.assertTrue(self.build(True))
+        size = os.path.getsize(self.jam)
+
+        self.write("MENUDATA/C.TXT", b"e" * 1000)
+        self.assertTrue(self.build())
+        self.assertFalse(os.path.exists(f"{self.jam}.1.bak"))
+        self.assertEqual(os.path.getsize(self.jam), size + 1000)
+        self.assertArchiveMatches()
+
+    def test_changed_archive_forces_full_rebuild(self):
+        with open(self.jam, "ab") as f:
+            f.write(b"junk")
+        self.assertTrue(self.build())
+        self.assertTrue(os.path.exists(f"{self.jam}.1.bak"))
+        self.assertArchiveMatches()
+
+    def interrupt_update(self, error):
+        """Fail an update once the first payload is half written."""
+        with open(self.jam, "rb") as f:
+            self.before = f.read()
+        self.write("GAMEDATA/B.BIN", b"x" * 900)
+        copy_range = jamupdate.fileutils.copy_range
+        failed = []
+
+        def fail(src, dst, count):
+            if src.name == self.jam or failed:
+                return copy_range(src, dst, count)
+            failed.append(src.name)
+            copy_range(src, dst, count // 2)
+            raise error
+        with mock.patch.object(jamupdate.fileutils, "copy_range", fail):
+            return self.build()
+
+    def test_failed_update_is_rolled_back(self):
+        self.assertTrue(self.interrupt_update(OSError("disk full")))
+        self.assertFalse(os.path.exists(f"{self.jam}.journal"))
+        with open(f"{self.jam}.1.bak", "rb") as f:
+            self.assertEqual(f.read(), self.before)
+        self.assertArchiveMatches()
+
+    def test_interrupted_update_is_rolled_back(self):
+        with self.assertRaises(KeyboardInterrupt):
+            self.interrupt_update(KeyboardInterrupt())
+        self.assertTrue(os.path.exists(f"{self.jam}.journal"))
+        self.assertTrue(self.build())
+        self.assertFalse(os.path.exists(f"{self.jam}.journal"))
+        self.assertArchiveMatches()
+
+    def test_recover_restores_archive(self):
+        with self.assertRaises(KeyboardInterrupt):
+            self.interrupt_update(KeyboardInterrupt())
+        self.assertTrue(jamupdate.recover(self.jam, self.manifests))
+        self.assertFalse(jamupdate.recover(self.jam, self.manifests))
+        with open(self.jam, "rb") as f:
+            self.assertEqual(f.read(), self.before)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(".."))
+
+import testhelpers
+from src.lib import JAMExtractor
+from src.utils import jamverify
+from src.utils.jamarchive import JamArchive
+
+
+class TestJamVerifyMethods(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        testhelpers.setUpClass()
+        cls.files = {
+            "GAMEDATA/COMMON/A.TXT": b"hello",
+            "GAMEDATA/B.BIN": bytes(range(256)) * 4,
+            "MENUDATA/C.TXT": b""
+        }
+        cls.jam = testhelpers.create_jam("verify", cls.files)
+
+    @classmethod
+    def tearDownClass(cls):
+        testhelpers.tearDownClass()
+
+    def test_intact_archive(self):
+        with JamArchive(self.jam) as archive:
+            self.assertEqual(jamverify.check_bounds(archive), [])
+            hashes = jamverify.hash_archive(archive, 4)
+        self.assertEqual(sorted(hashes), sorted(self.files))
+        self.assertEqual(hashes["GAMEDATA/B.BIN"][0], 1024)
+
+    def test_truncated_archive(self):
+        path = os.path.join(testhelpers.TEST_FILES_TEMP_PATH, "SHORT.JAM")
+        with open(self.jam, "rb") as src, open(path, "wb") as f:
+            f.write(src.read()[:-10])
+        with JamArchive(path) as archive:
+            problems = jamverify.check_bounds(archive)
+        self.assertEqual(len(problems), 1)
+        self.assertIn("past the end of the archive", problems[0])
+
+    def test_tree_matches_archive(self):
+        out_folder = os.path.join(testhelpers.TEST_FILES_TEMP_PATH, "tree")
+        self.assertTrue(JAMExtractor.extract(self.jam, False, 1, None,
+                                             out_folder))
+        with JamArchive(self.jam) as archive:
+            expected = jamverify.hash_archive(archive)
+        self.assertEqual(
+            jamverify.compare(expected, jamverify.hash_tree(out_folder, 2)),
+            {"missing": [], "added": [], "changed": []})
+
+        with open(os.path.join(out_folder, "GAMEDATA", "B.BIN"), "wb") as f:
+            f.write(b"changed")
+        os.remove(os.path.join(out_folder, "MENUDATA", "C.TXT"))
+        self.assertEqual(
+            jamverify.compare(expected, jamverify.hash_tree(out_folder)),
+            {"missing": ["MENUDATA/C.TXT"], "added": [],
+             "changed": ["GAMEDATA/B.BIN"]})
+
+    def test_compare_ignores_case(self):
+        self.assertEqual(
+            jamverify.compare({"A/B.TXT": [1, "x"]}, {"a/b.txt": [1, "x"],
+                                                      "C.TXT": [1, "y"]}),
+            {"missing": [], "added": ["C.TXT"], "changed": []})
+
+    def test_manifest_roundtrip(self):
+        path = os.path.join(testhelpers.TEST_FILES_TEMP_PATH, "sums.json")
+        hashes = {"A.TXT": [5, "abc"]}
+        self.assertTrue(jamverify.write_manifest(path, hashes))
+        self.assertEqual(jamverify.read_manifest(path), hashes)
+
+        with open(path, "wt") as f:
+            f.write("{}")
+        self.assertIsNone(jamverify.read_manifest(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import sqlite3
+import zipfile
+import hashlib
+import unittest
+
+sys.path.insert(0, os.path.abspath(".."))
+
+import testhelpers
+from src.utils.packagedb import InstalledFile, PackageDB, describe_members
+
+
+class TestPackageDBMethods(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        testhelpers.setUpClass()
+        os.makedirs(testhelpers.TEST_FILES_TEMP_PATH, exist_ok=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        testhelpers.tearDownClass()
+
+    def setUp(self):
+        self.path = os.path.join(testhelpers.TEST_FILES_TEMP_PATH,
+                                 f"{self.id().split('.')[-1]}.db")
+        self.db = PackageDB(self.path)
+
+    def tearDown(self):
+        self.db.close()
+
+    def file(self, path, data=b"data", original=False):
+        return InstalledFile(path, len(data), zipfile.crc32(data),
+                             hashlib.sha256(data).hexdigest(), original)
+
+    def test_add_and_query(self):
+        self.db.add("first", "1.0.0", "/first.zip",
+                    [self.file("GAMEDATA/A.BMP"), self.file("MENUDATA/B")])
+        self.db.add("second", "2.0.0", "/second.zip",
+                    [self.file("gamedata/a.bmp", b"other")])
+
+        self.assertEqual([a.name for a in self.db.packages()],
+                         ["first", "second"])
+        self.assertEqual(self.db.get("FIRST").version, "1.0.0")
+        self.assertIsNone(self.db.get("third"))
+        self.assertEqual(self.db.files("first"),
+                         [self.file("GAMEDATA/A.BMP"),
+                          self.file("MENUDATA/B")])
+        self.assertEqual(self.db.owners("GameData/A.bmp"),
+                         ["first", "second"])
+        self.assertEqual(self.db.owner("GAMEDATA/A.BMP"), "second")
+        self.assertIsNone(self.db.owner("GAMEDATA/NOPE"))
+        self.assertEqual(self.db.path_index(), {
+            "gamedata/a.bmp": ("second", "gamedata/a.bmp"),
+            "menudata/b": ("first", "MENUDATA/B")
+        })
+
+    def test_reinstall_and_remove(self):
+        self.db.add("first", "1.0.0", None, [self.file("A")])
+        self.db.add("second", "1.0.0", None, [self.file("A")])
+        self.db.add("first", "1.1.0", None, [self.file("A"), self.file("B")])
+        self.assertEqual(self.db.owner("A"), "first")
+        self.assertEqual(self.db.get("first").version, "1.1.0")
+
+        self.assertTrue(self.db.remove("first"))
+        self.assertFalse(self.db.remove("first"))
+        self.assertEqual(self.db.files("first"), [])
+        self.assertEqual(self.db.owners("A"), ["second"])
+
+    def test_persistence(self):
+        self.db.add("first", "1.0.0", None, [self.file("A")])
+        self.db.close()
+        self.db = PackageDB(self.path)
+        self.assertEqual(self.db.owner("a"), "first")
+
+    def test_original_files(self):
+        self.db.add("first", "1.0.0", None,
+                    [self.file("A", original=True), self.file("B")])
+        self.assertTrue(self.db.file("first", "a").original)
+        self.assertFalse(self.db.file("first", "B").original)
+        self.assertIsNone(self.db.file("first", "C"))
+
+    def test_upgrade_schema(self):
+        path = os.path.join(testhelpers.TEST_FILES_TEMP_PATH, "old.db")
+        db = sqlite3.connect(path)
+        db.executescript("""
+            CREATE TABLE packages (id INTEGER PRIMARY KEY, name TEXT NOT NULL,
+                key TEXT NOT NULL UNIQUE, version TEXT NOT NULL, source TEXT,
+                installed INTEGER NOT NULL);
+            CREATE TABLE files (package INTEGER NOT NULL, key TEXT NOT NULL,
+                path TEXT NOT NULL, size INTEGER NOT NULL,
+                crc INTEGER NOT NULL, hash TEXT NOT NULL,
+                PRIMARY KEY (package, key)) WITHOUT ROWID;
+            INSERT INTO packages VALUES (1, 'Old', 'old', '1.0.0', NULL, 0);
+            INSERT INTO files VALUES (1, 'a', 'A', 1, 2, 'ff');
+            PRAGMA user_version = 1;""")
+        db.close()
+        with PackageDB(path) as db:
+            self.assertEqual(db.files("old"), [InstalledFile("A", 1, 2, "ff")])
+
+    def test_describe_members(self):
+        path = os.path.join(testhelpers.TEST_FILES_TEMP_PATH, "package.zip")
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("GAMEDATA/", b"")
+            zf.writestr("GAMEDATA/A.BMP", b"bitmap" * 100)
+        with zipfile.ZipFile(path, "r") as zf:
+            self.assertEqual(
+                describe_members(zf, ["GAMEDATA/", "GAMEDATA/A.BMP"],
+                                 {"gamedata/a.bmp"}),
+                [self.file("GAMEDATA/A.BMP", b"bitmap" * 100, True)])
+
+
+if __name__ == "__main__":
+    unittest.main()
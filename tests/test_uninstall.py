@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import sys
+import shutil
+import unittest
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.abspath(".."))
+
+import testhelpers
+from src.install import install
+from src.uninstall import uninstall
+from src.utils.jamarchive import JamArchive
+from src.utils.packagedb import InstalledFile, PackageDB
+
+
+class TestUninstallMethods(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        testhelpers.setUpClass()
+        os.makedirs(testhelpers.TEST_FILES_TEMP_PATH, exist_ok=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        testhelpers.tearDownClass()
+
+    def setUp(self):
+        self.db = PackageDB(os.path.join(testhelpers.TEST_FILES_TEMP_PATH,
+                                         f"{self.id().split('.')[-1]}.db"))
+        self.db.add("first", "1.0.0", None, [
+            InstalledFile("GAMEDATA/ORIGINAL.BMP", 1, 0, "", True),
+            InstalledFile("GAMEDATA/SHARED.BMP", 1, 0, ""),
+            InstalledFile("GAMEDATA/FIRST.BMP", 1, 0, "")
+        ])
+        self.db.add("second", "1.0.0", None, [
+            InstalledFile("gamedata/original.bmp", 1, 0, "", True),
+            InstalledFile("GAMEDATA/SHARED.BMP", 1, 0, "")
+        ])
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_plan_restore_last_owner(self):
+        self.assertEqual(uninstall.plan_restore(self.db, ["second"]), {
+            "gamedata/original.bmp": ("first", True),
+            "GAMEDATA/SHARED.BMP": ("first", False)
+        })
+
+    def test_plan_restore_overridden_package(self):
+        # The files the later package replaced are left alone
+        self.assertEqual(uninstall.plan_restore(self.db, ["first"]), {
+            "GAMEDATA/FIRST.BMP": (None, False)
+        })
+
+    def test_plan_restore_all(self):
+        self.assertEqual(
+            uninstall.plan_restore(self.db, ["first", "SECOND"]), {
+                "GAMEDATA/ORIGINAL.BMP": (None, True),
+                "GAMEDATA/SHARED.BMP": (None, False),
+                "GAMEDATA/FIRST.BMP": (None, False)
+            })
+
+
+class TestUninstallCommand(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        testhelpers.setUpClass()
+        os.makedirs(testhelpers.TEST_FILES_TEMP_PATH, exist_ok=True)
+        cls.original = {
+            "GAMEDATA/B.BIN": b"original b",
+            "GAMEDATA/COMMON/A.TXT": b"original a"
+        }
+        cls.jam = testhelpers.create_jam("uninstall", cls.original)
+        cls.one = testhelpers.create_package("one", "1.0.0", {
+            "GAMEDATA/B.BIN": b"one b",
+            "GAMEDATA/MODA.TXT": b"one a",
+            "MENUDATA/MODB.TXT": b"one m"
+        })
+        cls.two = testhelpers.create_package("two", "1.0.0", {
+            "GAMEDATA/B.BIN": b"two b",
+            "MENUDATA/MODB.TXT": b"two m"
+        })
+
+    @classmethod
+    def tearDownClass(cls):
+        testhelpers.tearDownClass()
+
+    def setUp(self):
+        self.game = testhelpers.use_game(self, self.jam)
+        self.game_jam = os.path.join(self.game, "LEGO.JAM")
+
+    def run_command(self, command, *args):
+        with redirect_stdout(io.StringIO()):
+            return command.main(list(args))
+
+    def test_uninstall_restores_previous_owner(self):
+        self.assertTrue(self.run_command(install, self.one))
+        self.assertTrue(self.run_command(install, self.two))
+        self.assertTrue(self.run_command(uninstall, "two"))
+        self.assertEqual(testhelpers.read_jam(self.game_jam), {
+            "GAMEDATA/B.BIN": b"one b",
+            "GAMEDATA/COMMON/A.TXT": b"original a",
+            "GAMEDATA/MODA.TXT": b"one a",
+            "MENUDATA/MODB.TXT": b"one m"
+        })
+        with PackageDB() as db:
+            self.assertEqual([a.name for a in db.packages()], ["one"])
+
+    def test_uninstall_all_restores_original(self):
+        self.assertTrue(self.run_command(install, self.one, self.two))
+        self.assertTrue(self.run_command(uninstall, "one", "two"))
+        self.assertEqual(testhelpers.read_jam(self.game_jam), self.original)
+
+        # MENUDATA only held files of the packages
+        with JamArchive(self.game_jam) as archive:
+            self.assertEqual(archive.index().folders,
+                             ["GAMEDATA", "GAMEDATA/COMMON"])
+
+    def test_uninstall_extracted_removes_empty_folders(self):
+        extracted = os.path.join(self.game, "LEGO")
+        for path, data in self.original.items():
+            path = os.path.join(extracted, *path.split("/"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(data)
+        os.makedirs(os.path.join(extracted, "MENUDATA"))
+        deep = testhelpers.create_package("deep", "1.0.0", {
+            "gamedata/b.bin": b"deep b",
+            "GAMEDATA/NEW/DEEP/C.TXT": b"c",
+            "MENUDATA/D.TXT": b"d"
+        })
+        self.assertTrue(self.run_command(install, deep))
+        self.assertTrue(os.path.isfile(os.path.join(
+            extracted, "GAMEDATA", "NEW", "DEEP", "C.TXT")))
+
+        self.assertTrue(self.run_command(uninstall, "deep"))
+        self.assertFalse(os.path.exists(os.path.join(
+            extracted, "GAMEDATA", "NEW")))
+        self.assertEqual(os.listdir(os.path.join(extracted, "MENUDATA")), [])
+        with open(os.path.join(extracted, "GAMEDATA", "B.BIN"), "rb") as f:
+            self.assertEqual(f.read(), b"original b")
+        self.assertEqual(testhelpers.read_jam(self.game_jam), self.original)
+
+    def test_uninstall_unknown_package(self):
+        self.assertTrue(self.run_command(install, self.one))
+        self.assertFalse(self.run_command(uninstall, "one", "nope"))
+        self.assertEqual(testhelpers.read_jam(self.game_jam)["GAMEDATA/B.BIN"],
+                         b"one b")
+
+    def test_missing_package_keeps_files(self):
+        one = shutil.copy(self.one, self.game)
+        self.assertTrue(self.run_command(install, one))
+        self.assertTrue(self.run_command(install, self.two))
+        os.remove(one)
+
+        before = testhelpers.read_jam(self.game_jam)
+        self.assertFalse(self.run_command(uninstall, "two"))
+        self.assertEqual(testhelpers.read_jam(self.game_jam), before)
+        with PackageDB() as db:
+            self.assertIsNotNone(db.get("two"))
+
+    def test_missing_original_keeps_files(self):
+        self.assertTrue(self.run_command(install, self.one))
+        os.remove(os.path.join(self.game, "PRE-RPM-LEGO.JAM"))
+
+        before = testhelpers.read_jam(self.game_jam)
+        self.assertFalse(self.run_command(uninstall, "one"))
+        self.assertEqual(testhelpers.read_jam(self.game_jam), before)
+        with PackageDB() as db:
+            self.assertIsNotNone(db.get("one"))
+
+    def test_original_is_not_linked(self):
+        self.assertTrue(self.run_command(install, self.one))
+        self.assertFalse(os.path.samefile(
+            self.game_jam, os.path.join(self.game, "PRE-RPM-LEGO.JAM")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 import os
+import json
+import shutil
 import logging
 import zipfile
+from unittest import mock
 
 
 TEST_FILES_ROOT_PATH = os.path.join(os.getcwd(), "tests", "files")
@@ -49,3 +52,80 @@ def setUpClass():
 
 def tearDownClass():
     delete_temp_files()
+
+
+def create_jam(name, files):
+    """Build a JAM archive in the temp folder from a
+    {relative path: bytes} dictionary and return its path.
+    """
+    from src.lib import JAMExtractor
+
+    root = os.path.join(TEST_FILES_TEMP_PATH, name)
+    for rel_path, data in files.items():
+        path = os.path.join(root, *rel_path.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+    JAMExtractor.build(root, False)
+    return f"{root}.JAM"
+
+
+def create_package(name, version, files):
+    """Build a package in the temp folder from a
+    {relative path: bytes} dictionary and return its path.
+    """
+    path = os.path.join(TEST_FILES_TEMP_PATH, f"{name}-{version}.zip")
+    with zipfile.ZipFile(path, "w") as z:
+        z.writestr("package.json", json.dumps({
+            "name": name,
+            "version": version,
+            "author": "rpm",
+            "description": f"The {name} test package.",
+            "homepage": ""
+        }))
+        for rel_path, data in files.items():
+            z.writestr(rel_path, data)
+    return path
+
+
+def read_jam(path):
+    """Get the {path: bytes} contents of a JAM archive."""
+    from src.utils.jamarchive import JamArchive
+
+    with JamArchive(path) as archive:
+        return {e.path: bytes(archive.read(e.offset, e.size))
+                for e in archive.walk()}
+
+
+def use_config(test):
+    """Keep the app's configuration folder in the temp folder
+    for the length of a test.
+    """
+    home = os.path.join(TEST_FILES_TEMP_PATH,
+                        f"{test.id().split('.')[-1]}-home")
+    os.makedirs(home, exist_ok=True)
+    patcher = mock.patch.dict(os.environ, {"HOME": home, "APPDATA": home})
+    patcher.start()
+    test.addCleanup(patcher.stop)
+
+
+def use_game(test, jam):
+    """Point the app at a game installation holding a copy of a JAM
+    archive, with its configuration folder in the temp folder,
+    for the length of a test. Returns the game installation path.
+    """
+    from src.settings import user
+    from src.utils import utils
+
+    game = os.path.join(TEST_FILES_TEMP_PATH,
+                        f"{test.id().split('.')[-1]}-game")
+    os.makedirs(game)
+    shutil.copy(jam, os.path.join(game, "LEGO.JAM"))
+    use_config(test)
+
+    settings = utils.Settings({"gameLocation": game})
+    patcher = mock.patch.object(user, "load", lambda: settings)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+    return game